@@ -0,0 +1,100 @@
+"""
+Replays a journal written with --journal against a running server, usually one
+started with --simulator, and reports throughput and latency percentiles.
+
+    python benchmarks/loadtest.py journal.jsonl [--url http://localhost:6659] [--speed 1] [--concurrency 50]
+
+--speed 1 keeps the original timing, 2 replays twice as fast and 0 sends the next
+call as soon as one of the --concurrency connections is free.
+"""
+import argparse
+import json
+import sys
+import time
+
+import eventlet
+from eventlet.green.urllib import error, request as urlrequest
+from urllib.parse import urlencode
+
+import numpy as np
+
+def readJournal(path):
+    entries = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                entries.append(json.loads(line))
+    return sorted(entries, key=lambda entry: entry["t"])
+
+def urlFor(base, entry):
+    query = urlencode([(name, value) for name, values in sorted(entry.get("args", {}).items()) for value in values])
+    return base.rstrip("/") + entry["path"] + ("?" + query if query else "")
+
+def bodyFor(entry):
+    if "body" in entry:
+        return json.dumps(entry["body"]).encode(), "application/json"
+    if "form" in entry:
+        return urlencode([(name, value) for name, values in entry["form"].items() for value in values]).encode(), "application/x-www-form-urlencoded"
+    return None, None
+
+def replay(base, entry):
+    data, contentType = bodyFor(entry)
+    call = urlrequest.Request(urlFor(base, entry), data=data, method=entry["method"])
+    if contentType is not None:
+        call.add_header("Content-Type", contentType)
+    if entry.get("client"):
+        call.add_header("X-Client-Id", entry["client"])
+    started = time.perf_counter()
+    try:
+        response = urlrequest.urlopen(call)
+        response.read()
+        status = response.status
+    except error.HTTPError as e:
+        status = e.code
+    except Exception:
+        status = 0
+    return entry["path"], status, time.perf_counter() - started
+
+def run(base, entries, speed, concurrency):
+    pool = eventlet.GreenPool(concurrency)
+    threads = []
+    started = time.perf_counter()
+    firstAt = entries[0]["t"]
+    for entry in entries:
+        if speed > 0:
+            wait = (entry["t"] - firstAt) / speed - (time.perf_counter() - started)
+            if wait > 0:
+                eventlet.sleep(wait)
+        threads.append(pool.spawn(replay, base, entry))
+    results = [thread.wait() for thread in threads]
+    return results, time.perf_counter() - started
+
+def report(results, elapsed):
+    print("{} calls in {:.1f}s, {:.1f} calls/s".format(len(results), elapsed, len(results) / elapsed))
+    failed = sum(1 for _, status, _ in results if status == 0 or status >= 500)
+    print("{} failed ({:.1f}%)".format(failed, 100.0 * failed / len(results)))
+    byPath = {}
+    for path, _, seconds in results:
+        byPath.setdefault(path, []).append(seconds * 1000)
+    print("{:<24} {:>7} {:>9} {:>9} {:>9} {:>9}".format("endpoint", "calls", "p50 ms", "p90 ms", "p99 ms", "max ms"))
+    for path, latencies in sorted(byPath.items()) + [("all", [seconds * 1000 for _, _, seconds in results])]:
+        p50, p90, p99 = np.percentile(latencies, [50, 90, 99])
+        print("{:<24} {:>7} {:>9.1f} {:>9.1f} {:>9.1f} {:>9.1f}".format(path, len(latencies), p50, p90, p99, max(latencies)))
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a request journal against a server.')
+    parser.add_argument('journal')
+    parser.add_argument('--url', default="http://localhost:6659")
+    parser.add_argument('--speed', type=float, default=1.0)
+    parser.add_argument('--concurrency', type=int, default=50)
+    args = parser.parse_args()
+
+    entries = readJournal(args.journal)
+    if not len(entries):
+        print("{} has no calls to replay".format(args.journal))
+        sys.exit(1)
+    results, elapsed = run(args.url, entries, args.speed, args.concurrency)
+    report(results, elapsed)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Compares reading last values from the shared-memory tick table with the
+Socket.IO path, where every batch of ticks is encoded to JSON by the server
+and decoded again by the consumer.
+
+    python benchmarks/tick_table.py [--securities 500] [--fields 10] [--rounds 20]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from ticktable import TickTable, TickTableReader
+
+def generateTicks(securities, fields):
+    ticks = []
+    for s in range(securities):
+        values = {}
+        for f in range(fields):
+            values["FIELD_{}".format(f)] = "{:.4f}".format(90 + s * 0.01 + f * 0.0001)
+        ticks.append(("SECURITY {} Comdty".format(s), values))
+    return ticks
+
+def socketIOPath(ticks, rounds):
+    lastValues = {}
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for start in range(0, len(ticks), 11):
+            messages = [{
+                "type": "SUBSCRIPTION_DATA",
+                "security": security,
+                "values": values
+            } for security, values in ticks[start:start + 11]]
+            packet = json.dumps(["action", messages])
+            for message in json.loads(packet)[1]:
+                lastValues.setdefault(message["security"], {}).update(
+                    (field, float(value)) for field, value in message["values"].items())
+    return time.perf_counter() - started
+
+def tickTablePath(ticks, rounds, path):
+    table = TickTable(path, maxSecurities=len(ticks), maxFields=len(ticks[0][1]))
+    reader = TickTableReader(path)
+    for security, values in ticks:
+        table.publish(security, values)
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for security, values in ticks:
+            for field in values:
+                reader.get(security, field)
+    byField = time.perf_counter() - started
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for security, _ in ticks:
+            reader.snapshot(security)
+    bySecurity = time.perf_counter() - started
+    reader.close()
+    table.close()
+    return byField, bySecurity
+
+def main():
+    parser = argparse.ArgumentParser(description='Tick table vs Socket.IO/JSON read path.')
+    parser.add_argument('--securities', type=int, default=500)
+    parser.add_argument('--fields', type=int, default=10)
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+
+    ticks = generateTicks(args.securities, args.fields)
+    values = args.securities * args.fields * args.rounds
+    path = os.path.join(tempfile.mkdtemp(), "ticks")
+
+    byField, bySecurity = tickTablePath(ticks, args.rounds, path)
+    for name, elapsed in [("socket.io/json", socketIOPath(ticks, args.rounds)),
+                          ("table get", byField),
+                          ("table snapshot", bySecurity)]:
+        print("{:<16} {:>10.0f} values/s  {:>8.3f} us/value".format(name, values / elapsed, elapsed / values * 1e6))
+
+if __name__ == "__main__":
+    main()
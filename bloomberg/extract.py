@@ -1,18 +1,28 @@
-def extractReferenceSecurityPricing(message):
-    result = []
+from bloomberg.fields import bulkValue, typedValue
+
+def referenceValue(field, fieldSchema):
+    if fieldSchema is not None:
+        return typedValue(field, fieldSchema.kindOf(str(field.name())))
+    elif field.isArray():
+        # bulk fields, like index members or dividend history, have no single value
+        return bulkValue(field)
+    return field.getValue()
+
+def iterReferenceSecurityPricing(message, fieldSchema=None):
+    """
+    Yields the fields of one security at a time, with bulk fields as a table of
+    columns and rows.
+    """
     if message.hasElement("securityData"):
-        for securityInformation in list(message.getElement("securityData").values()):
-            fields = []
-            for field in securityInformation.getElement("fieldData").elements():
-                fields.append({
-                    "name": str(field.name()),
-                    "value": field.getValue()
-                })
-            result.append({
+        for securityInformation in message.getElement("securityData").values():
+            yield {
                 "security": securityInformation.getElementValue("security"),
-                "fields": fields
-            })
-    return result
+                "fields": [{ "name": str(field.name()), "value": referenceValue(field, fieldSchema) }
+                    for field in securityInformation.getElement("fieldData").elements()]
+            }
+
+def extractReferenceSecurityPricing(message, fieldSchema=None):
+    return list(iterReferenceSecurityPricing(message, fieldSchema))
 
 def extractHistoricalSecurityPricing(message):
     resultsForDate = {}
@@ -71,6 +81,40 @@ def extractIntradaySecurityPricing(security, message):
         "values": values
     }
 
+def extractIntradayBars(message):
+    bars = []
+    if message.hasElement("barData"):
+        barData = message.getElement("barData")
+        for barTick in list(barData.getElement("barTickData").values()):
+            bars.append((
+                barTick.getElement("time").getValueAsDatetime(),
+                barTick.getElement("open").getValueAsFloat(),
+                barTick.getElement("high").getValueAsFloat(),
+                barTick.getElement("low").getValueAsFloat(),
+                barTick.getElement("close").getValueAsFloat(),
+                barTick.getElement("numEvents").getValueAsInteger(),
+                barTick.getElement("volume").getValueAsInteger()))
+    return bars
+
+TICK_COLUMNS = ["time", "type", "value", "size"]
+
+def extractIntradayTicks(message, includeConditionCodes=False):
+    """
+    Ticks of one IntradayTickResponse as columns, one list per element.
+    """
+    columns = dict((name, []) for name in TICK_COLUMNS)
+    if includeConditionCodes:
+        columns["conditionCodes"] = []
+    if message.hasElement("tickData"):
+        for tick in list(message.getElement("tickData").getElement("tickData").values()):
+            columns["time"].append(tick.getElement("time").getValueAsString())
+            columns["type"].append(tick.getElement("type").getValueAsString())
+            columns["value"].append(tick.getElement("value").getValueAsFloat())
+            columns["size"].append(tick.getElement("size").getValueAsInteger())
+            if includeConditionCodes:
+                columns["conditionCodes"].append(tick.getElement("conditionCodes").getValueAsString() if tick.hasElement("conditionCodes") else None)
+    return columns
+
 def extractError(errorElement):
     category = errorElement.getElementValue("category")
     if errorElement.hasElement("subcategory"):
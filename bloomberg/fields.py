@@ -0,0 +1,142 @@
+import json
+import os
+import traceback
+
+from bloomberg.utils import sendAndWait
+
+NUMBER = "number"
+INTEGER = "integer"
+BOOLEAN = "boolean"
+DATE = "date"
+TIME = "time"
+DATETIME = "datetime"
+STRING = "string"
+BULK = "bulk"
+
+# //blp/apiflds reports both a datatype and an ftype, whichever is more specific wins
+KINDS = {
+    "Float32": NUMBER,
+    "Float64": NUMBER,
+    "Double": NUMBER,
+    "Price": NUMBER,
+    "Real": NUMBER,
+    "Int32": INTEGER,
+    "Int64": INTEGER,
+    "Integer": INTEGER,
+    "Integer/Real": NUMBER,
+    "Bool": BOOLEAN,
+    "Boolean": BOOLEAN,
+    "Date": DATE,
+    "Time": TIME,
+    "Datetime": DATETIME,
+    "Date or Time": DATETIME,
+    "Bulk Format": BULK,
+    "Sequence": BULK,
+    "Character": STRING,
+    "String": STRING
+}
+
+def kindOf(datatype, ftype):
+    if ftype in KINDS and KINDS[ftype] != STRING:
+        return KINDS[ftype]
+    return KINDS.get(datatype, STRING)
+
+class FieldSchema(object):
+    """
+    Types of Bloomberg fields, looked up from //blp/apiflds the first time a field
+    is seen and kept in a JSON file so that they survive restarts.
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self.kinds = {}
+        # fields that could not be looked up are strings until the next restart, they are not saved
+        self.unresolved = set()
+        if self.path is not None and os.path.exists(self.path):
+            try:
+                with open(self.path) as f:
+                    self.kinds = json.load(f)
+            except Exception:
+                traceback.print_exc()
+
+    def kindOf(self, field):
+        return self.kinds.get(field.upper())
+
+    def kindsFor(self, sessions, session, fields):
+        """
+        Looks the missing fields up on a session for requests, through the SessionManager
+        sessions. A failed lookup leaves them strings rather than failing the caller.
+        """
+        missing = [field for field in set(fields) if not field.upper() in self.kinds]
+        if len(missing):
+            try:
+                self.lookUp(sessions, session, missing)
+            except Exception:
+                traceback.print_exc()
+            for field in missing:
+                if not field.upper() in self.kinds:
+                    self.kinds[field.upper()] = STRING
+                    self.unresolved.add(field.upper())
+        return dict((field, self.kindOf(field)) for field in fields)
+
+    def lookUp(self, sessions, session, fields):
+        fieldInfoService, _ = sessions.service(session, "//blp/apiflds")
+        request = fieldInfoService.createRequest("FieldInfoRequest")
+        for field in fields:
+            request.append("id", field)
+        request.set("returnFieldDocumentation", False)
+
+        for response in sendAndWait(session, request):
+            if not response.hasElement("fieldData"):
+                continue
+            for fieldData in list(response.getElement("fieldData").values()):
+                id = str(fieldData.getElementAsString("id")).upper()
+                if fieldData.hasElement("fieldInfo"):
+                    fieldInfo = fieldData.getElement("fieldInfo")
+                    kind = kindOf(fieldInfo.getElementAsString("datatype"), fieldInfo.getElementAsString("ftype"))
+                    self.kinds[id] = kind
+                    self.kinds[str(fieldInfo.getElementAsString("mnemonic")).upper()] = kind
+                else:
+                    # unknown fields are kept as strings, rather than being looked up on every request
+                    self.kinds[id] = STRING
+        self.save()
+
+    def save(self):
+        if self.path is None:
+            return
+        try:
+            with open(self.path, "w") as f:
+                json.dump(dict((field, kind) for field, kind in self.kinds.items() if not field in self.unresolved), f)
+        except Exception:
+            traceback.print_exc()
+
+def bulkRows(element):
+    """
+    Yields the column names of a bulk field once, then the values of each of its
+    rows in that order. All rows of a bulk field have the same elements.
+    """
+    columns = None
+    for row in element.values():
+        if columns is None:
+            columns = [str(each.name()) for each in row.elements()]
+            yield columns
+        yield [typedValue(each) for each in row.elements()]
+
+def bulkValue(element):
+    rows = bulkRows(element)
+    return { "columns": next(rows, []), "rows": list(rows) }
+
+def typedValue(element, kind=None):
+    if kind == NUMBER:
+        return element.getValueAsFloat()
+    elif kind == INTEGER:
+        return element.getValueAsInteger()
+    elif kind == BOOLEAN:
+        return element.getValueAsBool()
+    elif kind in (DATE, TIME, DATETIME, STRING):
+        return element.getValueAsString()
+    elif kind == BULK or element.isArray():
+        return bulkValue(element)
+    value = element.getValue()
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return value
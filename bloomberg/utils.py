@@ -1,12 +1,20 @@
 import os, sys
+import eventlet
 import psutil
 import subprocess
 import traceback
 import datetime
 
+from timing import span
+
 BLOOMBERG_HOST = "localhost"
 BLOOMBERG_PORT = 8194
 
+# how long a request waits before polling its event queue again
+EVENT_POLL_INTERVAL = 0.005
+
+RESPONSE_TYPES = ["ReferenceDataResponse", "HistoricalDataResponse", "IntradayBarResponse", "IntradayTickResponse", "fieldResponse"]
+
 class BrokenSessionException(Exception):
     pass
 
@@ -37,22 +45,38 @@ def openBloombergService(session, serviceName):
     except Exception as e:
         raise BrokenSessionException("Failed to open {}".format(serviceName)) from e
 
-def sendAndWait(session, request):
+def nextEvent(eventQueue):
+    """
+    nextEvent of blpapi blocks the eventlet hub, and every other green thread with
+    it, so the queue is polled instead and other green threads run in between.
+    """
+    while True:
+        ev = eventQueue.tryNextEvent()
+        if ev is not None:
+            return ev
+        eventlet.sleep(EVENT_POLL_INTERVAL)
+
+def sendAndStream(session, request):
+    """
+    Yields the response messages as the partial responses arrive, so that large
+    responses can be processed without keeping all of them.
+    """
     eventQueue=blpapi.EventQueue()
-    session.sendRequest(request, eventQueue=eventQueue)
-    responses = []
+    with span("sendRequest"):
+        session.sendRequest(request, eventQueue=eventQueue)
     while(True):
-        ev = eventQueue.nextEvent(100)
-        if ev.eventType() == blpapi.Event.TIMEOUT:
-            continue
+        with span("wait"):
+            ev = nextEvent(eventQueue)
 
         for msg in ev:
-            if msg.messageType() == blpapi.Name("ReferenceDataResponse") or msg.messageType() == blpapi.Name("HistoricalDataResponse") or msg.messageType() == blpapi.Name("IntradayBarResponse"):
-                responses.append(msg)
+            if str(msg.messageType()) in RESPONSE_TYPES:
+                yield msg
         responseCompletelyReceived = ev.eventType() == blpapi.Event.RESPONSE
         if responseCompletelyReceived:
             break
-    return responses
+
+def sendAndWait(session, request):
+    return list(sendAndStream(session, request))
 
 global BBCOMM_LAST_RESTARTED_AT
 BBCOMM_LAST_RESTARTED_AT = None
@@ -0,0 +1,225 @@
+"""
+Message buses connecting the primary node, which owns the Bloomberg subscriptions,
+to the edge nodes serving Socket.IO clients. A bus delivers JSON frames published
+on a topic to every handler subscribed to it. Another bus can be plugged in by
+implementing subscribe, publish, onConnect, onDisconnect, isConnected and start.
+"""
+import eventlet
+import json
+import socket
+import traceback
+from urllib.parse import urlparse
+
+from eventlet.queue import Full, LightQueue
+from eventlet.semaphore import Semaphore
+
+RECONNECT_INTERVAL = 1
+# frames a remote may fall behind by before the broker disconnects it
+MAX_PENDING_FRAMES = 10000
+
+class BusException(Exception):
+    pass
+
+class FrameStream(object):
+    """
+    Newline delimited JSON frames over a socket. Writes are serialised, as frames
+    are sent from different green threads.
+    """
+    def __init__(self, connection):
+        self.connection = connection
+        self.stream = connection.makefile("rwb")
+        self.writeLock = Semaphore()
+
+    def send(self, frame):
+        data = json.dumps(frame).encode() + b"\n"
+        with self.writeLock:
+            self.stream.write(data)
+            self.stream.flush()
+
+    def receive(self):
+        line = self.stream.readline()
+        if not line:
+            raise EOFError("bus connection closed")
+        return json.loads(line.decode())
+
+    def close(self):
+        self.connection.close()
+
+class Remote(object):
+    """
+    A connection to a TcpBus. Frames are queued and written by a green thread of
+    its own, so that a stalled remote never blocks the publisher.
+    """
+    def __init__(self, stream, maxPendingFrames=MAX_PENDING_FRAMES):
+        self.stream = stream
+        self.pending = LightQueue(maxPendingFrames)
+        self.writer = eventlet.spawn(self.write)
+
+    def send(self, frame):
+        # raises Full once the remote is too far behind
+        self.pending.put_nowait(frame)
+
+    def write(self):
+        try:
+            while True:
+                self.stream.send(self.pending.get())
+        except Exception as e:
+            if not isinstance(e, ConnectionError):
+                traceback.print_exc()
+            self.disconnect()
+
+    def disconnect(self):
+        # the serving green thread then reads the end of the connection and forgets the remote
+        try:
+            self.stream.connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def close(self):
+        self.writer.kill()
+        self.stream.close()
+
+class LocalBus(object):
+    """
+    Delivers frames to the handlers of the same process, in the publishing green thread.
+    """
+    def __init__(self):
+        self.handlers = {}
+        self.connectHandlers = []
+        self.disconnectHandlers = []
+
+    def subscribe(self, topic, handler):
+        self.handlers.setdefault(topic, []).append(handler)
+
+    def publish(self, topic, frame):
+        for handler in list(self.handlers.get(topic, [])):
+            try:
+                handler(frame)
+            except Exception:
+                traceback.print_exc()
+
+    def onConnect(self, handler):
+        self.connectHandlers.append(handler)
+
+    def onDisconnect(self, handler):
+        self.disconnectHandlers.append(handler)
+
+    def isConnected(self):
+        return True
+
+    def start(self):
+        for handler in self.connectHandlers:
+            handler()
+
+class TcpBroker(LocalBus):
+    """
+    A local bus that other processes can also subscribe and publish to over TCP,
+    through a TcpBus. Frames from one connection are handled in order.
+    """
+    def __init__(self, host, port):
+        LocalBus.__init__(self)
+        self.host = host
+        self.port = port
+        self.remotes = {}
+        self.server = None
+
+    def publish(self, topic, frame):
+        LocalBus.publish(self, topic, frame)
+        for remote in list(self.remotes.get(topic, [])):
+            try:
+                remote.send(["message", topic, frame])
+            except Full:
+                print("Disconnecting a message bus client that fell too far behind")
+                self.forget(remote)
+                remote.disconnect()
+
+    def forget(self, remote):
+        for remotes in self.remotes.values():
+            remotes.discard(remote)
+
+    def start(self):
+        self.server = eventlet.listen((self.host, self.port))
+        print("Message bus listening on {}:{}".format(self.host, self.port))
+        eventlet.spawn(self.accept)
+        LocalBus.start(self)
+
+    def accept(self):
+        while True:
+            connection, _ = self.server.accept()
+            eventlet.spawn(self.serve, Remote(FrameStream(connection)))
+
+    def serve(self, remote):
+        try:
+            while True:
+                frame = remote.stream.receive()
+                if frame[0] == "subscribe":
+                    self.remotes.setdefault(frame[1], set()).add(remote)
+                elif frame[0] == "publish":
+                    self.publish(frame[1], frame[2])
+        except (EOFError, ConnectionError):
+            pass
+        except Exception:
+            traceback.print_exc()
+        finally:
+            self.forget(remote)
+            remote.close()
+
+class TcpBus(LocalBus):
+    """
+    Connects to a TcpBroker, and reconnects with the same subscriptions whenever the
+    connection is lost.
+    """
+    def __init__(self, host, port):
+        LocalBus.__init__(self)
+        self.host = host
+        self.port = port
+        self.stream = None
+
+    def subscribe(self, topic, handler):
+        LocalBus.subscribe(self, topic, handler)
+        if self.stream is not None:
+            self.stream.send(["subscribe", topic])
+
+    def publish(self, topic, frame):
+        if self.stream is None:
+            raise BusException("Not connected to the message bus on {}:{}".format(self.host, self.port))
+        self.stream.send(["publish", topic, frame])
+
+    def isConnected(self):
+        return self.stream is not None
+
+    def start(self):
+        eventlet.spawn(self.run)
+
+    def run(self):
+        while True:
+            try:
+                stream = FrameStream(eventlet.connect((self.host, self.port)))
+                for topic in self.handlers:
+                    stream.send(["subscribe", topic])
+                self.stream = stream
+                for handler in self.connectHandlers:
+                    handler()
+                while True:
+                    _, topic, frame = stream.receive()
+                    LocalBus.publish(self, topic, frame)
+            except Exception as e:
+                if not isinstance(e, (EOFError, ConnectionError)):
+                    traceback.print_exc()
+            if self.stream is not None:
+                self.stream = None
+                for handler in self.disconnectHandlers:
+                    handler()
+            eventlet.sleep(RECONNECT_INTERVAL)
+
+def parseBusUrl(url):
+    parsed = urlparse(url)
+    if parsed.scheme != "tcp" or not parsed.hostname or not parsed.port:
+        raise ValueError("Unknown message bus {}, expected tcp://HOST:PORT".format(url))
+    return parsed.hostname, parsed.port
+
+def serveBus(url):
+    return TcpBroker(*parseBusUrl(url))
+
+def connectBus(url):
+    return TcpBus(*parseBusUrl(url))
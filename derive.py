@@ -0,0 +1,141 @@
+"""
+Series derived from fetched data on the server, so that clients only download
+the results and not the raw history they were computed from.
+
+    historical | returns:FIELD, logReturns:FIELD, volatility:FIELD:WINDOW, spread:FIELD:SECURITY1:SECURITY2
+    intraday   | returns, logReturns, volatility:WINDOW, vwap
+
+Volatility is the rolling standard deviation of log returns over WINDOW points.
+"""
+import numpy as np
+from collections import OrderedDict
+
+from timeseries import asNumbers
+
+HISTORICAL_DERIVATIONS = {
+    "returns": 1,
+    "logReturns": 1,
+    "volatility": 2,
+    "spread": 3
+}
+
+INTRADAY_DERIVATIONS = {
+    "returns": 0,
+    "logReturns": 0,
+    "volatility": 1,
+    "vwap": 0
+}
+
+def returns(values):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return values[1:] / values[:-1] - 1
+
+def logReturns(values):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.diff(np.log(values))
+
+def rollingVolatility(values, window):
+    changes = logReturns(values)
+    if len(changes) < window:
+        return np.array([])
+    sums = np.concatenate(([0], np.cumsum(changes)))
+    squares = np.concatenate(([0], np.cumsum(changes ** 2)))
+    windowSums = sums[window:] - sums[:-window]
+    windowSquares = squares[window:] - squares[:-window]
+    variance = (windowSquares - windowSums ** 2 / window) / max(window - 1, 1)
+    return np.sqrt(np.maximum(variance, 0))
+
+def vwap(high, low, close, volume):
+    typical = (high + low + close) / 3
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.cumsum(typical * volume) / np.cumsum(volume)
+
+def toList(values):
+    # NaN and infinities, from returns or ratios over a zero price, are not valid JSON
+    finite = np.isfinite(values)
+    return [value if isFinite else None for value, isFinite in zip(values.tolist(), finite.tolist())]
+
+def parseDerivation(expression, arities):
+    parts = expression.split(":")
+    kind, arguments = parts[0], parts[1:]
+    if not kind in arities or len(arguments) != arities[kind]:
+        raise ValueError("Unknown derivation {}".format(expression))
+    if kind == "volatility":
+        window = int(arguments[-1])
+        if window < 2:
+            raise ValueError("Volatility needs a window of at least 2 points, got {}".format(expression))
+        arguments[-1] = window
+    return kind, arguments
+
+def parseHistoricalDerivations(expressions):
+    derivations = []
+    for expression in expressions:
+        kind, arguments = parseDerivation(expression, HISTORICAL_DERIVATIONS)
+        arguments[0] = arguments[0].upper()
+        derivations.append((expression, kind, arguments))
+    return derivations
+
+def parseIntradayDerivations(expressions):
+    return [(expression,) + parseDerivation(expression, INTRADAY_DERIVATIONS) for expression in expressions]
+
+def requiredFields(derivations):
+    return [arguments[0] for _, _, arguments in derivations]
+
+def requiredSecurities(derivations):
+    return [security for _, kind, arguments in derivations if kind == "spread" for security in arguments[1:]]
+
+def numbersOf(values, name):
+    numbers = asNumbers(values)
+    if numbers is None:
+        raise ValueError("{} can only be derived from numeric fields".format(name))
+    return numbers
+
+def deriveHistorical(series, securities, derivations):
+    """
+    Takes ([date], [value]) per (security, field) and returns the derived series,
+    keyed by (security, derivation) or, for spreads, ("SECURITY1 - SECURITY2", "spread:FIELD").
+    """
+    derived = OrderedDict()
+    for expression, kind, arguments in derivations:
+        field = arguments[0]
+        if kind == "spread":
+            first, second = series.get((arguments[1], field), ([], [])), series.get((arguments[2], field), ([], []))
+            secondValues = dict(zip(*second))
+            dates = [date for date in first[0] if date in secondValues]
+            firstValues = dict(zip(*first))
+            spread = numbersOf([firstValues[date] for date in dates], expression) - numbersOf([secondValues[date] for date in dates], expression)
+            derived[("{} - {}".format(arguments[1], arguments[2]), "spread:{}".format(field))] = (dates, toList(spread))
+            continue
+        for security in securities:
+            if not (security, field) in series:
+                continue
+            dates, values = series[(security, field)]
+            numbers = numbersOf(values, expression)
+            if kind == "returns":
+                values = returns(numbers)
+            elif kind == "logReturns":
+                values = logReturns(numbers)
+            else:
+                values = rollingVolatility(numbers, arguments[1])
+            derived[(security, expression)] = (dates[len(dates) - len(values):], toList(values))
+    return derived
+
+def deriveIntraday(bars, derivations):
+    """
+    Takes (open, high, low, close, numEvents, volume) rows and returns one list per
+    derivation, as long as the bars and padded with None at the start.
+    """
+    bars = np.asarray(bars, dtype=np.float64).reshape(-1, 6)
+    close = bars[:, 3]
+    derived = {}
+    for expression, kind, arguments in derivations:
+        if kind == "vwap":
+            values = vwap(bars[:, 1], bars[:, 2], close, bars[:, 5])
+        elif kind == "returns":
+            values = returns(close)
+        elif kind == "logReturns":
+            values = logReturns(close)
+        else:
+            values = rollingVolatility(close, arguments[0])
+        derived[expression] = [None] * (len(close) - len(values)) + toList(values)
+    return derived
@@ -0,0 +1,233 @@
+import base64
+import eventlet
+import itertools
+import json
+import os
+import socket
+import time
+import traceback
+import uuid
+
+from eventlet.event import Event
+
+from requests.subscribe import doSubscribe, forgetClient, useBinaryTicks
+from requests.unsubscribe import unsubscribeSecurities
+from subscriptions import handleSubscriptions
+from utils import handleBrokenSession
+
+ENGINE_CALL_TIMEOUT = 30
+# edges repeat how many binary clients they have, edges not heard from are forgotten
+EDGE_HEARTBEAT = 5
+EDGE_TIMEOUT = 3 * EDGE_HEARTBEAT
+
+# frames from the primary to every edge
+TICKS = "ticks"
+# subscribe/unsubscribe intents from the edges to the primary
+INTENTS = "intents"
+
+def repliesTopic(edgeId):
+    return "replies/" + edgeId
+
+class EngineException(Exception):
+    pass
+
+class EngineBroadcaster(object):
+    """
+    Takes the place of socketio inside the primary node, so that everything
+    handleSubscriptions emits is published to the edges instead.
+    """
+    def __init__(self, bus):
+        self.bus = bus
+
+    def emit(self, event, data, **kwargs):
+        if isinstance(data, bytes):
+            self.send(["emitBinary", event, base64.b64encode(data).decode(), kwargs])
+        else:
+            self.send(["emit", event, data, kwargs])
+
+    def send(self, frame):
+        try:
+            self.bus.publish(TICKS, frame)
+        except Exception:
+            traceback.print_exc()
+
+    def sleep(self, seconds=0):
+        eventlet.sleep(seconds)
+
+ENGINE_COMMANDS = {
+    "subscribe": doSubscribe,
+    "unsubscribe": unsubscribeSecurities
+}
+
+# about the sockets of an edge, these need no Bloomberg session and get no reply
+ENGINE_NOTIFICATIONS = {
+    "binarySocket": useBinaryTicks,
+    "forgetClient": forgetClient
+}
+
+class Engine(object):
+    """
+    Runs the intents of the edges against the Bloomberg subscription session of the
+    primary node, and replies to the edge that sent them.
+    """
+    def __init__(self, app, bus, broadcaster, commands=ENGINE_COMMANDS):
+        self.app = app
+        self.bus = bus
+        self.broadcaster = broadcaster
+        self.commands = commands
+        self.edges = {}
+
+    def start(self):
+        self.bus.subscribe(INTENTS, self.handleIntent)
+
+    def handleIntent(self, frame):
+        edgeId, callId, command, args = frame
+        if command == "hello":
+            # a new or reconnected edge needs the state it missed
+            self.broadcaster.send(["subscriptions", self.app.allSubscriptions])
+            self.broadcaster.send(["tickDictionary", self.app.tickDictionary.snapshot()])
+            return
+        if command == "binaryClients":
+            self.edges[edgeId] = (args[0], time.time())
+            self.updateBinaryClients()
+            return
+        if command in ENGINE_NOTIFICATIONS:
+            with self.app.app_context():
+                ENGINE_NOTIFICATIONS[command](*args)
+            return
+        try:
+            self.app.sessions.ensureSessions(forRequests=False)
+            with self.app.app_context():
+                self.commands[command](*args)
+            reply = ["reply", callId, None]
+        except Exception as e:
+            traceback.print_exc()
+            handleBrokenSession(self.app, e)
+            reply = ["reply", callId, "{0}: {1}".format(type(e).__name__, e)]
+        if callId is not None:
+            self.bus.publish(repliesTopic(edgeId), reply)
+        self.broadcaster.send(["subscriptions", self.app.allSubscriptions])
+
+    def updateBinaryClients(self):
+        # binary frames are only encoded while some edge has a client for them
+        now = time.time()
+        for edgeId, (_, lastSeen) in list(self.edges.items()):
+            if now - lastSeen > EDGE_TIMEOUT:
+                del self.edges[edgeId]
+        self.app.binaryClients = sum(count for count, _ in self.edges.values())
+
+    def expireEdges(self):
+        while True:
+            self.updateBinaryClients()
+            eventlet.sleep(EDGE_HEARTBEAT)
+
+def publishSubscriptions(app, broadcaster):
+    # subscription failures and broken sessions change the state outside of any command
+    published = None
+    while True:
+        current = json.dumps(app.allSubscriptions, sort_keys=True)
+        if current != published:
+            broadcaster.send(["subscriptions", app.allSubscriptions])
+            published = current
+        eventlet.sleep(1)
+
+def runEngine(app, bus):
+    broadcaster = EngineBroadcaster(bus)
+    engine = Engine(app, bus, broadcaster)
+    try:
+        app.sessionForSubscriptions = app.sessions.openSession()
+        app.allSubscriptions = {}
+    except:
+        traceback.print_exc()
+    app.sessions.start()
+    engine.start()
+    bus.start()
+    eventlet.spawn(handleSubscriptions, app, broadcaster)
+    eventlet.spawn(publishSubscriptions, app, broadcaster)
+    engine.expireEdges()
+
+class EngineClient(object):
+    """
+    Connects an edge node, serving HTTP and Socket.IO, to the primary node over the
+    bus. Ticks and the subscription state are mirrored locally, subscribe/unsubscribe
+    are forwarded.
+    """
+    def __init__(self, app, socketio, bus):
+        self.app = app
+        self.socketio = socketio
+        self.bus = bus
+        self.edgeId = "{}-{}-{}".format(socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+        self.callIds = itertools.count()
+        self.pendingCalls = {}
+        self.binaryClients = 0
+
+    def isConnected(self):
+        return self.bus.isConnected()
+
+    def start(self):
+        self.bus.subscribe(TICKS, self.dispatch)
+        self.bus.subscribe(repliesTopic(self.edgeId), self.dispatch)
+        self.bus.onConnect(self.hello)
+        self.bus.onDisconnect(self.failPendingCalls)
+        self.bus.start()
+        self.socketio.start_background_task(self.heartbeat)
+
+    def hello(self):
+        self.notify("hello")
+        self.setBinaryClients(self.binaryClients)
+
+    def heartbeat(self):
+        while True:
+            self.socketio.sleep(EDGE_HEARTBEAT)
+            try:
+                self.setBinaryClients(self.binaryClients)
+            except Exception:
+                traceback.print_exc()
+
+    def failPendingCalls(self):
+        for pending in self.pendingCalls.values():
+            pending.send("EngineException: connection to the message bus lost")
+        self.pendingCalls = {}
+
+    def dispatch(self, frame):
+        kind = frame[0]
+        if kind == "emit":
+            _, event, data, kwargs = frame
+            if event == "tickDictionary":
+                self.app.tickDictionary.update(data)
+            self.socketio.emit(event, data, **kwargs)
+        elif kind == "emitBinary":
+            _, event, data, kwargs = frame
+            self.socketio.emit(event, base64.b64decode(data), **kwargs)
+        elif kind == "subscriptions":
+            self.app.allSubscriptions = frame[1]
+        elif kind == "tickDictionary":
+            self.app.tickDictionary.update(frame[1])
+        elif kind == "reply":
+            _, callId, error = frame
+            pending = self.pendingCalls.pop(callId, None)
+            if pending is not None:
+                pending.send(error)
+
+    def setBinaryClients(self, count):
+        self.binaryClients = count
+        self.notify("binaryClients", count)
+
+    def notify(self, command, *args):
+        if self.bus.isConnected():
+            self.bus.publish(INTENTS, [self.edgeId, None, command, args])
+
+    def call(self, command, *args):
+        if not self.bus.isConnected():
+            raise EngineException("Not connected to the message bus of the primary node")
+        callId = next(self.callIds)
+        pending = Event()
+        self.pendingCalls[callId] = pending
+        try:
+            self.bus.publish(INTENTS, [self.edgeId, callId, command, args])
+            with eventlet.Timeout(ENGINE_CALL_TIMEOUT, EngineException("Primary node did not reply to " + command)):
+                error = pending.wait()
+        finally:
+            self.pendingCalls.pop(callId, None)
+        if error is not None:
+            raise EngineException(error)
@@ -0,0 +1,118 @@
+"""
+Compact binary frames for subscription data. Securities and fields are replaced
+by numeric ids, announced once per connection through "tickDictionary" events,
+and values are packed as typed numbers instead of formatted strings.
+
+    frame   | version (u8), number of messages (u16), messages
+    message | security id (u32), number of values (u16), values
+    value   | field id (u16), type (u8), payload: f64, i64, u8 or u16 length + utf-8
+"""
+import datetime
+import struct
+
+JSON_ROOM = "json"
+BINARY_ROOM = "binary"
+
+FRAME_VERSION = 1
+
+FRAME_HEADER = struct.Struct("<BH")
+MESSAGE_HEADER = struct.Struct("<IH")
+VALUE_HEADER = struct.Struct("<HB")
+DOUBLE = struct.Struct("<d")
+INTEGER = struct.Struct("<q")
+BOOLEAN = struct.Struct("<B")
+LENGTH = struct.Struct("<H")
+
+TYPE_DOUBLE = 1
+TYPE_INTEGER = 2
+TYPE_BOOLEAN = 3
+TYPE_STRING = 4
+
+INTEGER_RANGE = (-2 ** 63, 2 ** 63 - 1)
+
+class TickDictionary(object):
+    def __init__(self):
+        self.securities = {}
+        self.fields = {}
+        self.securityNames = {}
+        self.fieldNames = {}
+
+    def snapshot(self):
+        return { "securities": dict(self.securities), "fields": dict(self.fields) }
+
+    def update(self, entries):
+        for name, id in entries.get("securities", {}).items():
+            self.securities[name] = id
+            self.securityNames[id] = name
+        for name, id in entries.get("fields", {}).items():
+            self.fields[name] = id
+            self.fieldNames[id] = name
+
+    def idFor(self, ids, names, name, newEntries):
+        id = ids.get(name)
+        if id is None:
+            id = len(ids)
+            ids[name] = id
+            names[id] = name
+            newEntries[name] = id
+        return id
+
+def encodeValue(fieldId, value):
+    if isinstance(value, bool):
+        return VALUE_HEADER.pack(fieldId, TYPE_BOOLEAN) + BOOLEAN.pack(value)
+    if isinstance(value, int) and INTEGER_RANGE[0] <= value <= INTEGER_RANGE[1]:
+        return VALUE_HEADER.pack(fieldId, TYPE_INTEGER) + INTEGER.pack(value)
+    if isinstance(value, (int, float)):
+        return VALUE_HEADER.pack(fieldId, TYPE_DOUBLE) + DOUBLE.pack(value)
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        value = value.isoformat()
+    encoded = str(value).encode()[:0xFFFF]
+    return VALUE_HEADER.pack(fieldId, TYPE_STRING) + LENGTH.pack(len(encoded)) + encoded
+
+def encodeTickFrame(dictionary, messages):
+    """
+    Encodes [(security, {field: value})] and returns the frame together with the
+    dictionary entries that were assigned for it and still have to be announced.
+    """
+    newEntries = { "securities": {}, "fields": {} }
+    parts = [FRAME_HEADER.pack(FRAME_VERSION, len(messages))]
+    for security, values in messages:
+        securityId = dictionary.idFor(dictionary.securities, dictionary.securityNames, security, newEntries["securities"])
+        parts.append(MESSAGE_HEADER.pack(securityId, len(values)))
+        for field, value in values.items():
+            fieldId = dictionary.idFor(dictionary.fields, dictionary.fieldNames, field, newEntries["fields"])
+            parts.append(encodeValue(fieldId, value))
+    if not newEntries["securities"] and not newEntries["fields"]:
+        newEntries = None
+    return b"".join(parts), newEntries
+
+def decodeTickFrame(dictionary, frame):
+    version, count = FRAME_HEADER.unpack_from(frame, 0)
+    if version != FRAME_VERSION:
+        raise ValueError("Unsupported tick frame version {}".format(version))
+    offset = FRAME_HEADER.size
+    messages = []
+    for _ in range(count):
+        securityId, numValues = MESSAGE_HEADER.unpack_from(frame, offset)
+        offset += MESSAGE_HEADER.size
+        values = {}
+        for _ in range(numValues):
+            fieldId, kind = VALUE_HEADER.unpack_from(frame, offset)
+            offset += VALUE_HEADER.size
+            if kind == TYPE_DOUBLE:
+                value = DOUBLE.unpack_from(frame, offset)[0]
+                offset += DOUBLE.size
+            elif kind == TYPE_INTEGER:
+                value = INTEGER.unpack_from(frame, offset)[0]
+                offset += INTEGER.size
+            elif kind == TYPE_BOOLEAN:
+                value = bool(BOOLEAN.unpack_from(frame, offset)[0])
+                offset += BOOLEAN.size
+            else:
+                length = LENGTH.unpack_from(frame, offset)[0]
+                offset += LENGTH.size
+                value = bytes(frame[offset:offset + length]).decode(errors="ignore")
+                offset += length
+            values[dictionary.fieldNames[fieldId]] = value
+        messages.append((dictionary.securityNames[securityId], values))
+    return messages
@@ -0,0 +1,43 @@
+"""
+Opt-in journal of the API calls the server answers, one compact JSON document per
+line, so that real traffic can be replayed with benchmarks/loadtest.py.
+"""
+import json
+import traceback
+
+# calls that are not part of the traffic to replay
+SKIPPED_PREFIXES = ["/debug/", "/dev/"]
+
+class Journal(object):
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "a", buffering=1)
+
+    def record(self, request, status, timing, client):
+        """
+        The latency of streamed responses only covers the time until the first byte.
+        """
+        if request.method == 'OPTIONS' or any(request.path.startswith(prefix) for prefix in SKIPPED_PREFIXES):
+            return
+        entry = {
+            "t": round(timing.startedAt, 3),
+            "method": request.method,
+            "path": request.path,
+            "args": request.args.to_dict(flat=False),
+            "client": client,
+            "status": status,
+            "ms": round(timing.elapsed() * 1000, 1)
+        }
+        if request.method == 'POST':
+            body = request.get_json(force=True, silent=True)
+            if body is not None:
+                entry["body"] = body
+            elif len(request.form):
+                entry["form"] = request.form.to_dict(flat=False)
+        try:
+            self.file.write(json.dumps(entry, separators=(",", ":")) + "\n")
+        except Exception:
+            traceback.print_exc()
+
+    def close(self):
+        self.file.close()
@@ -0,0 +1,218 @@
+"""
+Learns which /historical and /intraday queries are asked for, with their dates
+relative to the day they were asked on, and replays the most frequent ones in the
+background before the market opens, so that the caches are warm when users arrive.
+"""
+import datetime
+import dateutil.parser
+import eventlet
+import json
+import os
+import time
+import traceback
+from urllib.parse import parse_qsl, urlencode
+
+from requests.batch import queryCost
+from requests.historical import endsBeforeToday
+
+# endpoints whose queries are replayed, with the path they are replayed on
+PREWARMED_ENDPOINTS = { "historical.index": "/historical/", "intraday.index": "/intraday/" }
+DATE_ARGUMENTS = ["startDate", "endDate"]
+DATETIME_ARGUMENTS = ["startDateTime", "endDateTime"]
+# queries nobody asked for in this many days are forgotten
+MAX_AGE_DAYS = 14
+SAVE_INTERVAL = 300
+PREWARM_HEADER = "X-Prewarm"
+
+def relativeDate(value, today):
+    try:
+        date = datetime.datetime.strptime(value[:10].replace("-", ""), "%Y%m%d").date()
+    except (TypeError, ValueError):
+        # relative Bloomberg dates such as -1CY already are
+        return value
+    return "@{}".format((date - today).days)
+
+def relativeDateTime(value, today):
+    try:
+        dateTime = dateutil.parser.parse(value)
+    except (TypeError, ValueError, OverflowError):
+        return value
+    return "@{}T{}".format((dateTime.date() - today).days, dateTime.time().isoformat())
+
+def absoluteValue(name, value, today):
+    if not value.startswith("@"):
+        return value
+    if name in DATE_ARGUMENTS:
+        return (today + datetime.timedelta(days=int(value[1:]))).strftime("%Y%m%d")
+    days, timeOfDay = value[1:].split("T")
+    return "{}T{}".format((today + datetime.timedelta(days=int(days))).isoformat(), timeOfDay)
+
+def queryShape(path, arguments, today):
+    """
+    The URL of a query with its dates written as days from today, like @-1.
+    """
+    shape = []
+    for name, value in arguments:
+        if name in DATE_ARGUMENTS:
+            value = relativeDate(value, today)
+        elif name in DATETIME_ARGUMENTS:
+            value = relativeDateTime(value, today)
+        shape.append((name, value))
+    return path + "?" + urlencode(shape)
+
+def queryFor(shape, today):
+    path, query = shape.split("?", 1)
+    arguments = [(name, absoluteValue(name, value, today)) for name, value in parse_qsl(query)]
+    return path + "?" + urlencode(arguments)
+
+def batchQueryFor(query):
+    """
+    The query as a /batch query, which the cost of a query is estimated from.
+    """
+    path, arguments = query.split("?", 1)
+    batchQuery = { "type": path.strip("/") }
+    for name, value in parse_qsl(arguments):
+        if name in ("security", "field", "eventType"):
+            batchQuery.setdefault(name, []).append(value)
+        else:
+            batchQuery[name] = value
+    return batchQuery
+
+def isWorthPrewarming(batchQuery):
+    # daily ranges up to today only go into the response cache, they would expire before users arrive
+    return not (batchQuery["type"] == "historical" and
+        (batchQuery.get("periodicity") or "DAILY").upper() == "DAILY" and
+        not endsBeforeToday(batchQuery.get("endDate")))
+
+class AccessPatterns(object):
+    """
+    How often each query shape was asked for, kept in a JSON file so that they
+    survive restarts. Worker processes share the file, each adds the counts it
+    recorded since it last saved to the ones in there.
+    """
+    def __init__(self, path=None):
+        self.path = path
+        self.shapes = self.load()
+        self.unsaved = {}
+
+    def load(self):
+        if self.path is None or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except Exception:
+            traceback.print_exc()
+            return {}
+
+    def record(self, path, arguments, today=None):
+        today = today or datetime.date.today()
+        shape = queryShape(path, arguments, today)
+        entry = self.shapes.setdefault(shape, { "count": 0 })
+        entry["count"] += 1
+        entry["lastSeen"] = today.isoformat()
+        self.unsaved[shape] = self.unsaved.get(shape, 0) + 1
+
+    def forget(self, today=None):
+        oldest = ((today or datetime.date.today()) - datetime.timedelta(days=MAX_AGE_DAYS)).isoformat()
+        for shape, entry in list(self.shapes.items()):
+            if entry["lastSeen"] < oldest:
+                del self.shapes[shape]
+                self.unsaved.pop(shape, None)
+
+    def mostFrequent(self):
+        return sorted(self.shapes, key=lambda shape: -self.shapes[shape]["count"])
+
+    def save(self):
+        if self.path is None:
+            return
+        try:
+            shapes = self.load()
+            for shape, count in self.unsaved.items():
+                entry = shapes.setdefault(shape, { "count": 0, "lastSeen": self.shapes[shape]["lastSeen"] })
+                entry["count"] += count
+                entry["lastSeen"] = max(entry["lastSeen"], self.shapes[shape]["lastSeen"])
+            self.shapes = shapes
+            self.forget()
+            # written next to the file and renamed, so that other workers never read half of it
+            temporaryPath = "{}.{}".format(self.path, os.getpid())
+            with open(temporaryPath, "w") as f:
+                json.dump(self.shapes, f)
+            os.replace(temporaryPath, self.path)
+            self.unsaved = {}
+        except Exception:
+            traceback.print_exc()
+
+def nextRunAfter(now, at):
+    """
+    The next weekday at the local time at, given as HH:MM.
+    """
+    hour, minute = [int(each) for each in at.split(":")]
+    run = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if run <= now:
+        run += datetime.timedelta(days=1)
+    while run.weekday() >= 5:
+        run += datetime.timedelta(days=1)
+    return run
+
+class Prewarmer(object):
+    """
+    Replays the most frequent query shapes through the app every weekday at a given
+    time, as bulk requests, until the Bloomberg hits they cause reach the budget.
+    Queries served from the caches cost nothing, the others are only replayed when
+    their estimated cost fits in what is left of the budget.
+    """
+    def __init__(self, app, patterns, at="06:30", budget=20000):
+        self.app = app
+        self.patterns = patterns
+        self.at = at
+        self.budget = budget
+        self.thread = None
+        self.lastRun = None
+
+    def start(self):
+        if self.thread is None and self.budget > 0:
+            self.thread = eventlet.spawn(self.run, nextRunAfter(datetime.datetime.now(), self.at))
+
+    def run(self, nextRun):
+        nextSave = time.time() + SAVE_INTERVAL
+        while True:
+            eventlet.sleep(30)
+            try:
+                if time.time() >= nextSave:
+                    self.patterns.save()
+                    nextSave = time.time() + SAVE_INTERVAL
+                if datetime.datetime.now() >= nextRun:
+                    self.prewarm()
+                    nextRun = nextRunAfter(datetime.datetime.now(), self.at)
+            except Exception:
+                traceback.print_exc()
+
+    def hitsToday(self):
+        return sum(self.app.bloombergHits.get(datetime.date.today().isoformat(), {}).values())
+
+    def prewarm(self):
+        today = datetime.date.today()
+        self.patterns.forget(today)
+        client = self.app.test_client()
+        spent = 0
+        warmed = 0
+        for shape in self.patterns.mostFrequent():
+            if spent >= self.budget:
+                break
+            query = queryFor(shape, today)
+            batchQuery = batchQueryFor(query)
+            # queries that could overrun the budget on their own are left out, smaller ones may still fit
+            if not isWorthPrewarming(batchQuery) or queryCost(batchQuery) > self.budget - spent:
+                continue
+            hitsBefore = self.hitsToday()
+            response = client.get(query, headers={
+                PREWARM_HEADER: "true",
+                "X-Priority": "bulk",
+                "X-Client-Id": "prewarm"
+            })
+            spent += self.hitsToday() - hitsBefore
+            if response.status_code == 200:
+                warmed += 1
+        self.lastRun = { "at": datetime.datetime.now().isoformat(), "warmed": warmed, "hits": spent }
+        self.patterns.save()
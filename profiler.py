@@ -0,0 +1,65 @@
+"""
+Statistical profiler for the running server. Green threads all run in the OS
+thread of the eventlet hub, so sampling the frame that thread is executing, from
+a real OS thread, profiles every green thread without tracing any of them.
+"""
+import os
+import sys
+import traceback
+from collections import Counter
+from eventlet import patcher
+
+SAMPLE_INTERVAL = 0.005
+MAX_SECONDS = 120
+
+def frameName(frame):
+    code = frame.f_code
+    return "{}:{}".format(os.path.basename(code.co_filename), code.co_name)
+
+def collapse(frame):
+    names = []
+    while frame is not None:
+        names.append(frameName(frame))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+class SamplingProfiler(object):
+    def __init__(self, threadId, interval=SAMPLE_INTERVAL):
+        self.threadId = threadId
+        self.interval = interval
+        self.counts = Counter()
+        self.running = False
+        self.sampler = None
+
+    def start(self):
+        self.running = True
+        self.sampler = patcher.original("threading").Thread(target=self.run, name="sampling-profiler")
+        self.sampler.daemon = True
+        self.sampler.start()
+
+    def stop(self):
+        self.running = False
+        if self.sampler is not None:
+            self.sampler.join()
+            self.sampler = None
+
+    def run(self):
+        sleep = patcher.original("time").sleep
+        while self.running:
+            try:
+                self.sample()
+            except Exception:
+                traceback.print_exc()
+            sleep(self.interval)
+
+    def sample(self):
+        frame = sys._current_frames().get(self.threadId)
+        if frame is not None:
+            self.counts[collapse(frame)] += 1
+
+    def collapsed(self):
+        """
+        One "frame;frame;frame count" line per distinct stack, as read by flamegraph.pl
+        and speedscope.
+        """
+        return "".join("{} {}\n".format(stack, count) for stack, count in sorted(self.counts.items()))
@@ -0,0 +1,139 @@
+import dateutil.parser
+import eventlet
+import json
+import traceback
+from eventlet.queue import Queue
+from flask import Blueprint, current_app as app, request, Response, stream_with_context
+
+from derive import parseHistoricalDerivations, parseIntradayDerivations
+from scheduler import currentSchedule, useSchedule
+from sessions import SessionUnavailableException
+from utils import handleBrokenSession
+
+from .historical import deriveSecurityPricing, downsampleSecurityPricing, historicalCost, parseAggregations, parsePeriodicity, requestHistoricalSeries, requiredFields, requiredSecurities, unique
+from .intraday import intradayCost, requestIntraday
+from .latest import requestLatest
+from .utils import allowCORS, classifyRequest, parseMaxPoints, respond400, respond500
+
+blueprint = Blueprint('batch', __name__)
+
+def runLatest(session, query):
+    return requestLatest(session, query.get("security", []), query.get("field", []), query.get("typed", False))
+
+def runHistorical(session, query):
+    securities = query.get("security", [])
+    derivations = parseHistoricalDerivations(query.get("derive", []))
+    periodicity = parsePeriodicity(query.get("periodicity"), query.get("startDate"), query.get("endDate"))
+    result = requestHistoricalSeries(session, unique(securities + requiredSecurities(derivations)),
+        unique(query.get("field", []) + requiredFields(derivations)), query.get("startDate"), query.get("endDate"),
+        periodicity, parseAggregations(query.get("aggregation", [])))
+    if len(derivations):
+        result["response"] = deriveSecurityPricing(result["response"], securities, derivations)
+    if query.get("maxPoints"):
+        result["response"] = downsampleSecurityPricing(result["response"], parseMaxPoints(query["maxPoints"]))
+    return result
+
+def runIntraday(session, query):
+    return requestIntraday(session, query.get("security", []), query.get("eventType", []),
+        dateutil.parser.parse(query.get("startDateTime")), dateutil.parser.parse(query.get("endDateTime")), int(query.get("interval", 5)), parseMaxPoints(query.get("maxPoints")),
+        parseIntradayDerivations(query.get("derive", [])))
+
+QUERY_TYPES = {
+    "latest": runLatest,
+    "historical": runHistorical,
+    "intraday": runIntraday
+}
+
+def queryCost(query):
+    securities = query.get("security", [])
+    if query["type"] == "historical":
+        return historicalCost(securities, query.get("field", []), query.get("startDate"), query.get("endDate"))
+    elif query["type"] == "intraday":
+        try:
+            return intradayCost(securities, query.get("eventType", []),
+                dateutil.parser.parse(query.get("startDateTime")), dateutil.parser.parse(query.get("endDateTime")))
+        except Exception:
+            # malformed queries fail on their own when they are run
+            return 0
+    return len(securities) * len(query.get("field", []))
+
+def runQuery(flaskApp, schedule, index, query):
+    with flaskApp.app_context():
+        useSchedule(*schedule)
+        result = { "id": query.get("id", index), "type": query.get("type") }
+        try:
+            result["response"] = QUERY_TYPES[query["type"]](app.sessionForRequests, query)
+            result["status"] = 200
+        except Exception as e:
+            handleBrokenSession(app, e)
+            traceback.print_exc()
+            result["status"] = 503 if isinstance(e, SessionUnavailableException) else 500
+            result["error"] = "{0}: {1}".format(type(e).__name__, e)
+        return result
+
+def parseQueries(body):
+    queries = body["queries"]
+    for query in queries:
+        if not query.get("type") in QUERY_TYPES:
+            raise ValueError("Unknown query type {}, expected one of {}".format(query.get("type"), ", ".join(sorted(QUERY_TYPES))))
+        parseMaxPoints(query.get("maxPoints"))
+        if query["type"] == "historical":
+            parsePeriodicity(query.get("periodicity"), query.get("startDate"), query.get("endDate"))
+            parseAggregations(query.get("aggregation", []))
+    return queries
+
+@blueprint.route('/', methods = ['OPTIONS'])
+def tellThemWhenCORSIsAllowed():
+    response = Response("")
+    response.headers['Access-Control-Allow-Origin'] = allowCORS(request.headers.get('Origin'))
+    response.headers['Access-Control-Allow-Methods'] = ", ".join(["POST", "OPTIONS"])
+    response.headers['Access-Control-Allow-Headers'] = "Content-Type"
+    return response
+
+# { "queries": [{ "id": ..., "type": "latest|historical|intraday", <parameters of that endpoint> }], "stream": false }
+@blueprint.route('/', methods = ['POST'])
+def index():
+    try:
+        app.sessions.ensureSessions()
+    except Exception as e:
+        handleBrokenSession(app, e)
+        traceback.print_exc()
+        return respond500(e)
+    try:
+        body = request.get_json(force=True)
+        queries = parseQueries(body)
+        stream = body.get("stream", False) or request.args.get('stream') == "true"
+        cost = sum(queryCost(query) for query in queries)
+    except Exception as e:
+        traceback.print_exc()
+        return respond400(e)
+    classifyRequest(cost)
+
+    flaskApp = app._get_current_object()
+    schedule = currentSchedule()
+    pool = eventlet.GreenPool(app.config["CONCURRENT_QUERIES"])
+
+    if not stream:
+        results = list(pool.starmap(runQuery, [(flaskApp, schedule, index, query) for index, query in enumerate(queries)]))
+        response = Response(
+            json.dumps({ "responses": results }).encode(),
+            status=200,
+            mimetype='application/json')
+        response.headers['Access-Control-Allow-Origin'] = allowCORS(request.headers.get('Origin'))
+        return response
+
+    completed = Queue()
+    for index, query in enumerate(queries):
+        pool.spawn(runQuery, flaskApp, schedule, index, query).link(lambda thread: completed.put(thread.wait()))
+
+    # one JSON document per line, in the order the queries complete
+    def generate():
+        for _ in queries:
+            yield json.dumps(completed.get()).encode() + b"\n"
+
+    response = Response(
+        stream_with_context(generate()),
+        status=200,
+        mimetype='application/x-ndjson')
+    response.headers['Access-Control-Allow-Origin'] = allowCORS(request.headers.get('Origin'))
+    return response
@@ -0,0 +1,255 @@
+import datetime
+import os
+import time
+import pickle
+import hashlib
+import traceback
+from collections import OrderedDict
+
+class CachedResponse(object):
+    def __init__(self, payload, etag, expiresAt=None):
+        self.payload = payload
+        self.etag = etag
+        self.expiresAt = expiresAt
+
+    def isImmutable(self):
+        return self.expiresAt is None
+
+    def isFresh(self):
+        return self.expiresAt is None or time.time() < self.expiresAt
+
+    def size(self):
+        return len(self.payload)
+
+class ResponseCache(object):
+    """
+    Encoded response payloads shared between all clients, keyed by the request ETag.
+    Entries without a TTL are immutable and, when a directory is given, are also
+    written to disk so that they survive restarts. Both tiers evict the least
+    recently used entries once they grow past their byte budget.
+    """
+    def __init__(self, maxBytes=64 * 1024 * 1024, directory=None, maxDiskBytes=1024 * 1024 * 1024):
+        self.maxBytes = maxBytes
+        self.directory = directory
+        self.maxDiskBytes = maxDiskBytes
+        self.entries = OrderedDict()
+        self.totalBytes = 0
+        self.diskEntries = OrderedDict()
+        self.totalDiskBytes = 0
+        if self.directory is not None:
+            self.loadDiskIndex()
+
+    def get(self, key, stale=False):
+        entry = self.entries.get(key)
+        if entry is not None:
+            if not entry.isFresh() and not stale:
+                # kept for serving stale while Bloomberg is down, the LRU evicts it in time
+                return None
+            self.entries.move_to_end(key)
+            return entry
+        entry = self.readFromDisk(key)
+        if entry is not None:
+            self.storeInMemory(key, entry)
+        return entry
+
+    def put(self, key, payload, etag, ttl=None):
+        expiresAt = None if ttl is None else time.time() + ttl
+        entry = CachedResponse(payload, etag, expiresAt)
+        self.storeInMemory(key, entry)
+        if entry.isImmutable():
+            self.writeToDisk(key, entry)
+        return entry
+
+    def clear(self):
+        self.entries.clear()
+        self.totalBytes = 0
+
+    def remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.totalBytes -= entry.size()
+
+    def storeInMemory(self, key, entry):
+        self.remove(key)
+        if entry.size() > self.maxBytes:
+            return
+        self.entries[key] = entry
+        self.totalBytes += entry.size()
+        while self.totalBytes > self.maxBytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.totalBytes -= evicted.size()
+
+    def pathFor(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest() + ".cache")
+
+    def loadDiskIndex(self):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            paths = [os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith(".cache")]
+            for path in sorted(paths, key=os.path.getmtime):
+                size = os.path.getsize(path)
+                self.diskEntries[path] = size
+                self.totalDiskBytes += size
+        except Exception:
+            traceback.print_exc()
+            self.directory = None
+
+    def readFromDisk(self, key):
+        if self.directory is None:
+            return None
+        path = self.pathFor(key)
+        if not path in self.diskEntries:
+            return None
+        try:
+            with open(path, "rb") as f:
+                storedKey, payload, etag = pickle.load(f)
+            if storedKey != key:
+                return None
+            self.diskEntries.move_to_end(path)
+            return CachedResponse(payload, etag)
+        except Exception:
+            traceback.print_exc()
+            self.removeFromDisk(path)
+            return None
+
+    def writeToDisk(self, key, entry):
+        if self.directory is None or entry.size() > self.maxDiskBytes:
+            return
+        path = self.pathFor(key)
+        try:
+            with open(path, "wb") as f:
+                pickle.dump((key, entry.payload, entry.etag), f, pickle.HIGHEST_PROTOCOL)
+            self.removeFromIndex(path)
+            size = os.path.getsize(path)
+            self.diskEntries[path] = size
+            self.totalDiskBytes += size
+            while self.totalDiskBytes > self.maxDiskBytes:
+                evictedPath = next(iter(self.diskEntries))
+                self.removeFromDisk(evictedPath)
+        except Exception:
+            traceback.print_exc()
+
+    def removeFromIndex(self, path):
+        size = self.diskEntries.pop(path, None)
+        if size is not None:
+            self.totalDiskBytes -= size
+
+    def removeFromDisk(self, path):
+        self.removeFromIndex(path)
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def missingIntervals(coverage, first, last):
+    """
+    Parts of [first, last] that are not in coverage, a sorted list of disjoint
+    inclusive (first, last) intervals.
+    """
+    missing = []
+    cursor = first
+    for coveredFirst, coveredLast in coverage:
+        if coveredLast < cursor:
+            continue
+        if coveredFirst > last:
+            break
+        if coveredFirst > cursor:
+            missing.append((cursor, coveredFirst - 1))
+        cursor = coveredLast + 1
+    if cursor <= last:
+        missing.append((cursor, last))
+    return missing
+
+def mergeInterval(coverage, first, last):
+    merged = []
+    for interval in sorted(coverage + [(first, last)]):
+        if merged and interval[0] <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], interval[1]))
+        else:
+            merged.append(interval)
+    return merged
+
+class DailyBarCache(object):
+    """
+    Daily values per (security, field) with the date ranges they were fetched for,
+    so that only days that were never fetched have to come from Bloomberg. Only
+    completed days are kept. Least recently used series are evicted first.
+    """
+    def __init__(self, maxSeries=20000):
+        self.maxSeries = maxSeries
+        self.series = OrderedDict()
+
+    def missingRanges(self, security, field, start, end):
+        coverage = self.series.get((security, field), ([], {}))[0]
+        missing = missingIntervals(coverage, start.toordinal(), end.toordinal())
+        return [(datetime.date.fromordinal(a), datetime.date.fromordinal(b)) for a, b in missing]
+
+    def store(self, security, field, start, end, values):
+        key = (security, field)
+        coverage, stored = self.series.pop(key, ([], {}))
+        first, last = start.toordinal(), end.toordinal()
+        for day, value in values.items():
+            if first <= day <= last:
+                stored[day] = value
+        self.series[key] = (mergeInterval(coverage, first, last), stored)
+        while len(self.series) > self.maxSeries:
+            self.series.popitem(last=False)
+
+    def values(self, security, field, start, end):
+        entry = self.series.get((security, field))
+        if entry is None:
+            return {}
+        self.series.move_to_end((security, field))
+        first, last = start.toordinal(), end.toordinal()
+        return dict((day, value) for day, value in entry[1].items() if first <= day <= last)
+
+MINUTES_PER_DAY = 24 * 60
+
+class IntradayBarCache(object):
+    """
+    One minute bars per (security, eventType, day) with the minutes they were fetched
+    for, so that bars of any interval can be built locally and only minutes that were
+    never fetched have to come from Bloomberg. Minutes are counted from the epoch, in
+    UTC. Least recently used days are evicted first.
+    """
+    def __init__(self, maxDays=20000):
+        self.maxDays = maxDays
+        self.days = OrderedDict()
+
+    def daysBetween(self, first, last):
+        for day in range(first // MINUTES_PER_DAY, last // MINUTES_PER_DAY + 1):
+            yield day, max(first, day * MINUTES_PER_DAY), min(last, (day + 1) * MINUTES_PER_DAY - 1)
+
+    def missingRanges(self, security, eventType, first, last):
+        missing = []
+        for day, dayFirst, dayLast in self.daysBetween(first, last):
+            coverage = self.days.get((security, eventType, day), ([], {}))[0]
+            for interval in missingIntervals(coverage, dayFirst, dayLast):
+                if missing and interval[0] == missing[-1][1] + 1:
+                    # gaps running over midnight are fetched with one request
+                    missing[-1] = (missing[-1][0], interval[1])
+                else:
+                    missing.append(interval)
+        return missing
+
+    def store(self, security, eventType, first, last, bars):
+        for day, dayFirst, dayLast in self.daysBetween(first, last):
+            key = (security, eventType, day)
+            coverage, stored = self.days.pop(key, ([], {}))
+            for minute in range(dayFirst, dayLast + 1):
+                if minute in bars:
+                    stored[minute] = bars[minute]
+            self.days[key] = (mergeInterval(coverage, dayFirst, dayLast), stored)
+        while len(self.days) > self.maxDays:
+            self.days.popitem(last=False)
+
+    def bars(self, security, eventType, first, last):
+        result = {}
+        for day, dayFirst, dayLast in self.daysBetween(first, last):
+            key = (security, eventType, day)
+            entry = self.days.get(key)
+            if entry is None:
+                continue
+            self.days.move_to_end(key)
+            result.update((minute, bar) for minute, bar in entry[1].items() if dayFirst <= minute <= dayLast)
+        return result
@@ -0,0 +1,72 @@
+import eventlet
+import hmac
+import json
+import traceback
+from eventlet import patcher
+from flask import Blueprint, current_app as app, request, Response
+
+from profiler import MAX_SECONDS, SamplingProfiler
+
+from .utils import allowCORS, respond400
+
+blueprint = Blueprint('debug', __name__)
+
+@blueprint.route('/slow', methods = ['GET'])
+def slow():
+    response = Response(
+        json.dumps({ "requests": app.slowRequests.slowest() }).encode(),
+        status=200,
+        mimetype='application/json')
+    response.headers['Access-Control-Allow-Origin'] = allowCORS(request.headers.get('Origin'))
+    return response
+
+@blueprint.route('/stalls', methods = ['GET'])
+def stalls():
+    response = Response(
+        json.dumps({
+            "lag": app.stallDetector.percentiles(),
+            "stalls": list(app.stallDetector.stalls)
+        }).encode(),
+        status=200,
+        mimetype='application/json')
+    response.headers['Access-Control-Allow-Origin'] = allowCORS(request.headers.get('Origin'))
+    return response
+
+def isAuthorized():
+    # the profiler is only available when the server was started with --profiler-token or BBAPI_PROFILER_TOKEN
+    token = app.config.get("PROFILER_TOKEN")
+    # only taken from the header, URLs end up in logs
+    given = request.headers.get('X-Profiler-Token') or ""
+    return bool(token) and hmac.compare_digest(given.encode(), token.encode())
+
+# ?seconds=10 with the X-Profiler-Token header returns the stacks sampled meanwhile, collapsed for flamegraph.pl
+@blueprint.route('/profile', methods = ['GET'])
+def profile():
+    if not isAuthorized():
+        response = Response("Forbidden", status=403)
+        response.headers['Access-Control-Allow-Origin'] = allowCORS(request.headers.get('Origin'))
+        return response
+    try:
+        seconds = float(request.args.get('seconds', 10))
+        if not 0 < seconds <= MAX_SECONDS:
+            raise ValueError("seconds must be between 0 and {}".format(MAX_SECONDS))
+        if app.profiler is not None:
+            raise ValueError("A profile is already being taken")
+    except Exception as e:
+        traceback.print_exc()
+        return respond400(e)
+
+    # requests are served by the OS thread of the hub, which runs every green thread
+    profiler = SamplingProfiler(patcher.original("_thread").get_ident())
+    app.profiler = profiler
+    try:
+        profiler.start()
+        eventlet.sleep(seconds)
+    finally:
+        profiler.stop()
+        app.profiler = None
+
+    response = Response(profiler.collapsed().encode(), status=200, mimetype='text/plain')
+    response.headers['Content-Disposition'] = 'attachment; filename="profile.collapsed"'
+    response.headers['Access-Control-Allow-Origin'] = allowCORS(request.headers.get('Origin'))
+    return response
@@ -1,6 +1,8 @@
 import json
 from flask import Blueprint, current_app as app, request, Response
 
+from .cache import DailyBarCache, IntradayBarCache
+
 blueprint = Blueprint('dev', __name__)
 
 def raise_(ex):
@@ -38,8 +40,15 @@ def startSessionForRequests():
         blpapi.Session = OriginalSession[0]
         app.sessionForRequests = None
         app.sessionForSubscriptions = None
+        app.sessions.breaker.recordSuccess()
     return Response("OK", status=200)
 
+def forgetCachedData():
+    # cached responses and bars would be served without ever reaching the broken session
+    app.responseCache.clear()
+    app.dailyBars = DailyBarCache()
+    app.intradayBars = IntradayBarCache()
+
 def functionOneTimeBroken(original):
     hit = [False]
     def function(*args, **kwargs):
@@ -53,6 +62,7 @@ def functionOneTimeBroken(original):
 @blueprint.route('/requests/sendRequest/break', methods = ['GET'])
 def breakSendRequestForRequests():
     app.sessionForRequests.sendRequest = functionOneTimeBroken(app.sessionForRequests.sendRequest)
+    forgetCachedData()
 
     return Response("OK", status=200)
 
@@ -65,11 +75,15 @@ def breakNextEventForSubscriptions():
 @blueprint.route('/requests/getService/break', methods = ['GET'])
 def breakGetServiceForRequests():
     app.sessionForRequests.getService = functionOneTimeBroken(app.sessionForRequests.getService)
+    # services are kept open once they are, drop them so that the broken getService is used
+    app.sessions.invalidate(app.sessionForRequests)
+    forgetCachedData()
 
     return Response("OK", status=200)
 
 @blueprint.route('/subscriptions/getService/break', methods = ['GET'])
 def breakGetServiceForSubscriptions():
     app.sessionForSubscriptions.getService = functionOneTimeBroken(app.sessionForSubscriptions.getService)
+    app.sessions.invalidate(app.sessionForSubscriptions)
 
     return Response("OK", status=200)
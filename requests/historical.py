@@ -1,45 +1,192 @@
+import datetime
 import json
+import time
 import traceback
+from collections import OrderedDict
 from flask import Blueprint, current_app as app, request, Response
 
-from bloomberg.utils import openBloombergSession, openBloombergService, sendAndWait
+from bloomberg.utils import sendAndWait
 from bloomberg.extract import extractHistoricalSecurityPricing, extractErrors
+from derive import deriveHistorical, parseHistoricalDerivations, requiredFields, requiredSecurities
+from timeseries import AGGREGATIONS, PERIODICITIES, defaultAggregation, downsample, resample
+from timing import span
 from utils import handleBrokenSession
 
-from .utils import allowCORS, generateEtag, respond400, respond500, recordBloombergHits
+from .cache import CachedResponse
+from .utils import allowCORS, classifyRequest, etagMatches, generateEtag, parseMaxPoints, respond304, respond400, respond500, recordBloombergHits, runChunks, splitIntoChunks, splitIntoDateWindows
 
 blueprint = Blueprint('historical', __name__)
 
+# ranges that include today can still change, so they are only reused for a short while
+LIVE_RESPONSE_TTL = 60
+
+def endsBeforeToday(endDate):
+    try:
+        return datetime.datetime.strptime(endDate, "%Y%m%d").date() < datetime.date.today()
+    except (TypeError, ValueError):
+        return False
+
 def requestHistorical(session, securities, fields, startDate, endDate):
     recordBloombergHits("historical", len(securities) * len(fields))
     try:
-        refDataService, _ = openBloombergService(session, "//blp/refdata")
-        request = refDataService.createRequest("HistoricalDataRequest")
+        refDataService, _ = app.sessions.service(session, "//blp/refdata")
 
-        request.set("startDate", startDate)
-        request.set("endDate", endDate)
-        request.set("periodicitySelection", "DAILY");
+        def requestChunk(securities, startDate, endDate):
+            request = refDataService.createRequest("HistoricalDataRequest")
 
-        for security in securities:
-            request.append("securities", security)
+            request.set("startDate", startDate)
+            request.set("endDate", endDate)
+            request.set("periodicitySelection", "DAILY");
 
-        for field in fields:
-            request.append("fields", field)
+            for security in securities:
+                request.append("securities", security)
 
-        responses = sendAndWait(session, request)
+            for field in fields:
+                request.append("fields", field)
 
-        securityPricing = []
-        for response in responses:
-            securityPricing.extend(extractHistoricalSecurityPricing(response))
+            return sendAndWait(session, request)
 
-        errors = []
-        for response in responses:
-            errors.extend(extractErrors(response))
+        chunks = [(securityChunk, windowStart, windowEnd)
+            for securityChunk in splitIntoChunks(securities, app.config["MAX_SECURITIES_PER_REQUEST"])
+            for windowStart, windowEnd in splitIntoDateWindows(startDate, endDate, app.config["MAX_DAYS_PER_REQUEST"])]
+        responses = [response for chunk in runChunks(requestChunk, chunks) for response in chunk]
+
+        with span("extract"):
+            securityPricing = []
+            for response in responses:
+                securityPricing.extend(extractHistoricalSecurityPricing(response))
+
+            errors = []
+            for response in responses:
+                errors.extend(extractErrors(response))
 
         return { "response": securityPricing, "errors": errors }
     except Exception as e:
         raise
 
+def parseDate(value):
+    return datetime.datetime.strptime(value[:10].replace("-", ""), "%Y%m%d").date()
+
+def historicalCost(securities, fields, startDate, endDate):
+    try:
+        years = (parseDate(endDate) - parseDate(startDate)).days // 365 + 1
+    except (TypeError, ValueError):
+        years = 1
+    return len(securities) * len(fields) * years
+
+def fetchMissingDailyBars(session, securities, fields, start, end):
+    """
+    Requests the daily bars that are not in app.dailyBars, one request per span so
+    that securities missing the same days are fetched together.
+    """
+    missingSpans = {}
+    for security in securities:
+        missing = [missingRange for field in fields for missingRange in app.dailyBars.missingRanges(security, field, start, end)]
+        if len(missing):
+            missingSpan = (min(each[0] for each in missing), max(each[1] for each in missing))
+            missingSpans.setdefault(missingSpan, []).append(security)
+
+    # days up to yesterday are final, today can still change and is never stored
+    lastCompleteDay = datetime.date.today() - datetime.timedelta(days=1)
+    fetched = {}
+    errors = []
+    for (spanStart, spanEnd), group in missingSpans.items():
+        result = requestHistorical(session, group, fields, spanStart.strftime("%Y%m%d"), spanEnd.strftime("%Y%m%d"))
+        errors.extend(result["errors"])
+        for entry in result["response"]:
+            day = parseDate(entry["date"]).toordinal()
+            for value in entry["values"]:
+                for field in value["fields"]:
+                    fetched.setdefault((value["security"], field["name"].upper()), {})[day] = field["value"]
+        if not result["errors"] and spanStart <= lastCompleteDay:
+            for security in group:
+                for field in fields:
+                    app.dailyBars.store(security, field, spanStart, min(spanEnd, lastCompleteDay), fetched.get((security, field), {}))
+    return fetched, errors
+
+def requestHistoricalPeriodic(session, securities, fields, startDate, endDate, periodicity, aggregations):
+    start = parseDate(startDate)
+    end = parseDate(endDate)
+    fields = [field.upper() for field in fields]
+    fetched, errors = fetchMissingDailyBars(session, securities, fields, start, end)
+
+    series = OrderedDict()
+    for security in securities:
+        for field in fields:
+            daily = app.dailyBars.values(security, field, start, end)
+            daily.update(fetched.get((security, field), {}))
+            days = sorted(daily)
+            series[(security, field)] = resample(
+                [datetime.date.fromordinal(day) for day in days],
+                [daily[day] for day in days],
+                periodicity,
+                aggregations.get(field) or defaultAggregation(field))
+    return { "response": pricingOf(series), "errors": errors }
+
+def seriesOf(securityPricing):
+    """
+    Turns the date major response into ([date], [value]) per (security, field).
+    """
+    series = OrderedDict()
+    for entry in sorted(securityPricing, key=lambda each: each["date"]):
+        for value in entry["values"]:
+            for field in value["fields"]:
+                dates, values = series.setdefault((value["security"], field["name"]), ([], []))
+                dates.append(entry["date"])
+                values.append(field["value"])
+    return series
+
+def pricingOf(series):
+    valuesForDate = {}
+    for (security, field), (dates, values) in series.items():
+        for date, value in zip(dates, values):
+            valuesForDate.setdefault(date, OrderedDict()).setdefault(security, []).append({ "name": field, "value": value })
+    return [{
+        "date": date,
+        "values": [{ "security": security, "fields": fields } for security, fields in valuesForDate[date].items()]
+    } for date in sorted(valuesForDate)]
+
+def deriveSecurityPricing(securityPricing, securities, derivations):
+    return pricingOf(deriveHistorical(seriesOf(securityPricing), securities, derivations))
+
+def downsampleSecurityPricing(securityPricing, maxPoints):
+    """
+    Keeps at most maxPoints dates of each (security, field), chosen per series so
+    that the peaks and troughs survive.
+    """
+    series = seriesOf(securityPricing)
+    for key, (dates, values) in series.items():
+        keep = downsample(values, maxPoints)
+        series[key] = ([dates[i] for i in keep], [values[i] for i in keep])
+    return pricingOf(series)
+
+def parsePeriodicity(value, startDate, endDate):
+    periodicity = (value or "DAILY").upper()
+    if not periodicity in PERIODICITIES:
+        raise ValueError("Unknown periodicity {}, expected one of {}".format(periodicity, ", ".join(PERIODICITIES)))
+    if periodicity != "DAILY":
+        # resampling needs absolute dates to know which daily bars are missing
+        parseDate(startDate)
+        parseDate(endDate)
+    return periodicity
+
+def requestHistoricalSeries(session, securities, fields, startDate, endDate, periodicity, aggregations):
+    if periodicity == "DAILY":
+        return requestHistorical(session, securities, fields, startDate, endDate)
+    return requestHistoricalPeriodic(session, securities, fields, startDate, endDate, periodicity, aggregations)
+
+def unique(items):
+    return list(OrderedDict.fromkeys(items))
+
+def parseAggregations(values):
+    aggregations = {}
+    for value in values:
+        field, _, aggregation = value.rpartition(":")
+        if not field or not aggregation in AGGREGATIONS:
+            raise ValueError("Expected aggregation=FIELD:{}, got {}".format("|".join(AGGREGATIONS), value))
+        aggregations[field.upper()] = aggregation
+    return aggregations
+
 @blueprint.route('/', methods = ['OPTIONS'])
 def tellThemWhenCORSIsAllowed():
     response = Response("")
@@ -47,55 +194,86 @@ def tellThemWhenCORSIsAllowed():
     response.headers['Access-Control-Allow-Methods'] = ", ".join(["GET", "POST", "OPTIONS"])
     return response
 
-# ?security=...&security=...&field=...&field=...&startDate=...&endDate=...
+# ?security=...&security=...&field=...&field=...&startDate=...&endDate=...[&periodicity=WEEKLY&aggregation=PX_LAST:max&maxPoints=2000&derive=returns:PX_LAST]
 @blueprint.route('/', methods = ['GET', 'POST'])
 def index():
-    try:
-        if app.sessionForRequests is None:
-            app.sessionForRequests = openBloombergSession()
-        if app.sessionForSubscriptions is None:
-            app.sessionForSubscriptions = openBloombergSession()
-            app.allSubscriptions = {}
-    except Exception as e:
-        handleBrokenSession(app, e)
-        traceback.print_exc()
-        return respond500(e)
     try:
         securities = request.values.getlist('security') or []
         fields = request.values.getlist('field') or []
         startDate = request.values.get('startDate')
         endDate = request.values.get('endDate')
+        periodicity = parsePeriodicity(request.values.get('periodicity'), startDate, endDate)
+        aggregations = parseAggregations(request.values.getlist('aggregation'))
+        maxPoints = parseMaxPoints(request.values.get('maxPoints'))
+        derive = request.values.getlist('derive')
+        derivations = parseHistoricalDerivations(derive)
     except Exception as e:
         traceback.print_exc()
         return respond400(e)
+    classifyRequest(historicalCost(securities, fields, startDate, endDate))
 
     etag = generateEtag({
         "securities": securities,
         "fields": fields,
         "startDate": startDate,
-        "endDate": endDate
+        "endDate": endDate,
+        "periodicity": periodicity,
+        "aggregations": aggregations,
+        "maxPoints": maxPoints,
+        "derive": derive
     })
-    if request.headers.get('If-None-Match') == etag:
-        response = Response(
-            "",
-            status=304,
-            mimetype='application/json')
-        response.headers['Access-Control-Allow-Origin'] = allowCORS(request.headers.get('Origin'))
-        return response
-    try:
-        payload = json.dumps(requestHistorical(app.sessionForRequests, securities, fields, startDate, endDate)).encode()
-    except Exception as e:
-        handleBrokenSession(app, e)
-        traceback.print_exc()
-        return respond500(e)
+    immutable = endsBeforeToday(endDate)
+    if immutable and etagMatches(etag):
+        return respond304(etag)
+
+    stale = False
+    if not app.sessions.breaker.isClosed():
+        # while Bloomberg is unreachable an outdated response beats none
+        cached = app.responseCache.get(etag, stale=True)
+        stale = cached is not None and not cached.isFresh()
+    else:
+        cached = app.responseCache.get(etag)
+    if cached is None:
+        try:
+            app.sessions.ensureSessions()
+            # only the derived series are returned, but they need their inputs fetched
+            fetchSecurities = unique(securities + requiredSecurities(derivations))
+            fetchFields = unique(fields + requiredFields(derivations))
+            result = requestHistoricalSeries(app.sessionForRequests, fetchSecurities, fetchFields, startDate, endDate, periodicity, aggregations)
+            if len(derivations):
+                with span("derive"):
+                    result["response"] = deriveSecurityPricing(result["response"], securities, derivations)
+            if maxPoints:
+                with span("downsample"):
+                    result["response"] = downsampleSecurityPricing(result["response"], maxPoints)
+            with span("json"):
+                payload = json.dumps(result).encode()
+        except Exception as e:
+            handleBrokenSession(app, e)
+            traceback.print_exc()
+            return respond500(e)
+        if immutable:
+            cached = CachedResponse(payload, etag)
+        else:
+            cached = CachedResponse(payload, generateEtag(payload), time.time() + LIVE_RESPONSE_TTL)
+        if not result["errors"]:
+            app.responseCache.put(etag, cached.payload, cached.etag, None if immutable else LIVE_RESPONSE_TTL)
+
+    if etagMatches(cached.etag):
+        return respond304(cached.etag)
 
     response = Response(
-        payload,
+        cached.payload,
         status=200,
         mimetype='application/json')
-    response.headers['Etag'] = etag
-    response.headers['Cache-Control'] = "max-age=86400, must-revalidate"
+    response.headers['Etag'] = cached.etag
+    if stale:
+        response.headers['Cache-Control'] = "no-cache"
+        response.headers['Warning'] = '110 - "Response is Stale"'
+    elif immutable:
+        response.headers['Cache-Control'] = "max-age=31536000, immutable"
+    else:
+        response.headers['Cache-Control'] = "max-age={}, must-revalidate".format(LIVE_RESPONSE_TTL)
     response.headers['Vary'] = "Origin"
     response.headers['Access-Control-Allow-Origin'] = allowCORS(request.headers.get('Origin'))
     return response
-
@@ -1,54 +1,141 @@
+import datetime
 import dateutil.parser
 import json
 import traceback
-from flask import Blueprint, current_app as app, request, Response
+from flask import Blueprint, current_app as app, request, Response, stream_with_context
 
-from bloomberg.utils import openBloombergSession, openBloombergService, sendAndWait
-from bloomberg.extract import extractIntradaySecurityPricing, extractErrors
+from bloomberg.utils import sendAndStream, sendAndWait
+from bloomberg.extract import extractIntradayBars, extractIntradayTicks, extractErrors
+from derive import deriveIntraday, parseIntradayDerivations
+from timeseries import aggregateBars
+from timing import span
 from utils import handleBrokenSession
 
-from .utils import allowCORS, generateEtag, respond400, respond500, recordBloombergHits
+from .utils import allowCORS, classifyRequest, generateEtag, parseMaxPoints, respond400, respond500, recordBloombergHits, runChunks, scheduledResponses
 
 blueprint = Blueprint('intraday', __name__)
 
-def requestIntraday(session, securities, eventTypes, startDateTime, endDateTime):
-    recordBloombergHits("intraday", len(securities) * len(eventTypes))
-    try:
-        refDataService, _ = openBloombergService(session, "//blp/refdata")
-        securityPricing = []
-        errors = []
-        for security in securities:
-            for eventType in eventTypes:
-                request = refDataService.createRequest("IntradayBarRequest")
+EPOCH = datetime.datetime(1970, 1, 1)
+
+def minuteOf(dateTime):
+    if dateTime.tzinfo is not None:
+        dateTime = dateTime.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return int((dateTime - EPOCH).total_seconds() // 60)
+
+def dateTimeOf(minute):
+    return EPOCH + datetime.timedelta(minutes=minute)
+
+def formatNumber(value):
+    return str(int(value)) if value.is_integer() else str(value)
+
+def intradayCost(securities, eventTypes, startDateTime, endDateTime):
+    return len(securities) * len(eventTypes) * ((endDateTime - startDateTime).days + 1)
+
+def requestMinuteBars(session, refDataService, security, eventType, first, last):
+    recordBloombergHits("intraday", 1)
+    request = refDataService.createRequest("IntradayBarRequest")
+
+    request.set("startDateTime", dateTimeOf(first))
+    request.set("endDateTime", dateTimeOf(last + 1))
+    request.set("security", security)
+    request.set("eventType", eventType)
+    request.set("interval", 1)
 
-                request.set("startDateTime", startDateTime)
-                request.set("endDateTime", endDateTime)
-                request.set("security", security)
-                request.set("eventType", eventType)
-                request.set("interval", 5)
+    responses = sendAndWait(session, request)
+    bars = {}
+    errors = []
+    with span("extract"):
+        for response in responses:
+            for bar in extractIntradayBars(response):
+                bars[minuteOf(bar[0])] = bar[1:]
+        for response in responses:
+            errors.extend(extractErrors(response))
+    return bars, errors
 
-                responses = sendAndWait(session, request)
+def requestIntraday(session, securities, eventTypes, startDateTime, endDateTime, interval=5, maxPoints=0, derivations=None):
+    """
+    Builds bars of interval minutes from the one minute bars in app.intradayBars,
+    requesting only the minutes that are not there yet. With maxPoints, neighbouring
+    bars are merged further until there are no more than maxPoints of them. With
+    derivations, only the derived series are returned instead of the bars.
+    """
+    try:
+        refDataService, _ = app.sessions.service(session, "//blp/refdata")
+        first = minuteOf(startDateTime)
+        last = minuteOf(endDateTime) - 1
+        # the bar of the current minute is still being built
+        lastCompleteMinute = minuteOf(datetime.datetime.utcnow()) - 1
 
-                for response in responses:
-                    securityPricing.append(extractIntradaySecurityPricing(security, response))
+        def requestSeries(security, eventType):
+            fetched = {}
+            errors = []
+            for missingFirst, missingLast in app.intradayBars.missingRanges(security, eventType, first, last):
+                bars, missingErrors = requestMinuteBars(session, refDataService, security, eventType, missingFirst, missingLast)
+                fetched.update(bars)
+                errors.extend(missingErrors)
+                if not missingErrors and missingFirst <= lastCompleteMinute:
+                    app.intradayBars.store(security, eventType, missingFirst, min(missingLast, lastCompleteMinute), bars)
 
-                for response in responses:
-                    errors.extend(extractErrors(response))
+            bars = app.intradayBars.bars(security, eventType, first, last)
+            bars.update(fetched)
+            minutes = sorted(bars)
+            starts, merged = aggregateBars(minutes, [bars[minute] for minute in minutes], first, interval)
+            if maxPoints and len(starts) > maxPoints:
+                groups, merged = aggregateBars(range(len(starts)), merged, 0, -(-len(starts) // maxPoints))
+                starts = [starts[index] for index in groups]
+            times = [dateTimeOf(start).strftime("%Y-%m-%dT%H:%M:%S.000") for start in starts]
+            if derivations:
+                derived = deriveIntraday(merged, derivations)
+                values = [dict([("time", time)] + [(expression, derived[expression][index]) for expression, _, _ in derivations])
+                    for index, time in enumerate(times)]
+                return { "security": security, "eventType": eventType, "values": values }, errors
+            values = [{
+                "time": time,
+                "open": formatNumber(bar[0]),
+                "high": formatNumber(bar[1]),
+                "low": formatNumber(bar[2]),
+                "close": formatNumber(bar[3]),
+                "numEvents": formatNumber(bar[4]),
+                "volume": formatNumber(bar[5])
+            } for time, bar in zip(times, merged)]
+            return { "security": security, "eventType": eventType, "values": values }, errors
 
-        return { "response": securityPricing, "errors": errors }
+        series = runChunks(requestSeries, [(security, eventType) for security in securities for eventType in eventTypes])
+        return { "response": [each[0] for each in series], "errors": [error for each in series for error in each[1]] }
     except Exception as e:
         raise
 
+def streamIntradayTicks(session, securities, eventTypes, startDateTime, endDateTime, includeConditionCodes=False):
+    """
+    Yields one {"security", "columns"} chunk per partial response, and the errors
+    of each security, while Bloomberg is still sending the rest.
+    """
+    recordBloombergHits("intraday", len(securities))
+    refDataService, _ = app.sessions.service(session, "//blp/refdata")
+    for security in securities:
+        request = refDataService.createRequest("IntradayTickRequest")
+
+        request.set("startDateTime", startDateTime)
+        request.set("endDateTime", endDateTime)
+        request.set("security", security)
+        for eventType in eventTypes:
+            request.append("eventTypes", eventType)
+        request.set("includeConditionCodes", includeConditionCodes)
+
+        errors = []
+        for response in scheduledResponses(sendAndStream(session, request)):
+            errors.extend(extractErrors(response))
+            columns = extractIntradayTicks(response, includeConditionCodes)
+            if len(columns["time"]):
+                yield { "security": security, "columns": columns }
+        if len(errors):
+            yield { "security": security, "errors": errors }
 
-# ?eventType=[...]&security=[...]
+# ?eventType=[...]&security=[...]&startDateTime=...&endDateTime=...[&interval=5&maxPoints=2000&derive=vwap]
 @blueprint.route('/', methods = ['GET'])
 def index():
     try:
-        if app.sessionForRequests is None:
-            app.sessionForRequests = openBloombergSession()
-        if app.sessionForSubscriptions is None:
-            app.sessionForSubscriptions = openBloombergSession()
-            app.allSubscriptions = {}
+        app.sessions.ensureSessions()
     except Exception as e:
         handleBrokenSession(app, e)
         traceback.print_exc()
@@ -58,12 +145,20 @@ def index():
         eventTypes = request.args.getlist('eventType') or []
         startDateTime = dateutil.parser.parse(request.args.get('startDateTime'))
         endDateTime = dateutil.parser.parse(request.args.get('endDateTime'))
+        interval = int(request.args.get('interval') or 5)
+        if interval < 1:
+            raise ValueError("interval has to be a positive number of minutes")
+        maxPoints = parseMaxPoints(request.args.get('maxPoints'))
+        derivations = parseIntradayDerivations(request.args.getlist('derive'))
     except Exception as e:
         traceback.print_exc()
         return respond400(e)
+    classifyRequest(intradayCost(securities, eventTypes, startDateTime, endDateTime))
 
     try:
-        payload = json.dumps(requestIntraday(app.sessionForRequests, securities, eventTypes, startDateTime, endDateTime)).encode()
+        result = requestIntraday(app.sessionForRequests, securities, eventTypes, startDateTime, endDateTime, interval, maxPoints, derivations)
+        with span("json"):
+            payload = json.dumps(result).encode()
     except Exception as e:
         handleBrokenSession(app, e)
         traceback.print_exc()
@@ -77,3 +172,41 @@ def index():
     return response
 
 
+
+# ?security=[...]&eventType=[...]&startDateTime=...&endDateTime=...[&includeConditionCodes=true]
+# one JSON document per line, each with the ticks of a partial response as columns
+@blueprint.route('/ticks', methods = ['GET'])
+def ticks():
+    try:
+        app.sessions.ensureSessions()
+    except Exception as e:
+        handleBrokenSession(app, e)
+        traceback.print_exc()
+        return respond500(e)
+    try:
+        securities = request.args.getlist('security') or []
+        eventTypes = request.args.getlist('eventType') or ["TRADE"]
+        startDateTime = dateutil.parser.parse(request.args.get('startDateTime'))
+        endDateTime = dateutil.parser.parse(request.args.get('endDateTime'))
+        includeConditionCodes = request.args.get('includeConditionCodes') == "true"
+    except Exception as e:
+        traceback.print_exc()
+        return respond400(e)
+    classifyRequest(intradayCost(securities, eventTypes, startDateTime, endDateTime))
+
+    def generate():
+        try:
+            for chunk in streamIntradayTicks(app.sessionForRequests, securities, eventTypes, startDateTime, endDateTime, includeConditionCodes):
+                yield json.dumps(chunk).encode() + b"\n"
+        except Exception as e:
+            # the status has already been sent, so the failure ends the stream instead
+            handleBrokenSession(app, e)
+            traceback.print_exc()
+            yield json.dumps({ "error": "{0}: {1}".format(type(e).__name__, e) }).encode() + b"\n"
+
+    response = Response(
+        stream_with_context(generate()),
+        status=200,
+        mimetype='application/x-ndjson')
+    response.headers['Access-Control-Allow-Origin'] = allowCORS(request.headers.get('Origin'))
+    return response
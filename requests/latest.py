@@ -1,41 +1,73 @@
 import json
 import traceback
-from flask import Blueprint, current_app as app, request, Response
+from flask import Blueprint, current_app as app, request, Response, stream_with_context
 
-from bloomberg.utils import openBloombergSession, openBloombergService, sendAndWait
-from bloomberg.extract import extractReferenceSecurityPricing, extractErrors
+from bloomberg.utils import sendAndStream, sendAndWait
+from bloomberg.extract import extractReferenceSecurityPricing, extractErrors, iterReferenceSecurityPricing
+from timing import span
 from utils import handleBrokenSession
 
-from .utils import allowCORS, respond400, respond500, recordBloombergHits
+from .utils import allowCORS, classifyRequest, etagMatches, generateEtag, respond304, respond400, respond500, recordBloombergHits, runChunks, scheduledResponses, splitIntoChunks
 
 blueprint = Blueprint('latest', __name__)
 
-def requestLatest(session, securities, fields):
+def createReferenceDataRequest(refDataService, securities, fields, typed):
+    request = refDataService.createRequest("ReferenceDataRequest")
+
+    request.set("returnFormattedValue", not typed)
+    for security in securities:
+        request.append("securities", security)
+
+    for field in fields:
+        request.append("fields", field)
+    return request
+
+def schemaFor(session, fields, typed):
+    if not typed:
+        return None
+    app.fieldSchema.kindsFor(app.sessions, session, fields)
+    return app.fieldSchema
+
+def requestLatest(session, securities, fields, typed=False):
     recordBloombergHits("latest", len(securities) * len(fields))
     try:
-        refDataService, _ = openBloombergService(session, "//blp/refdata")
-        request = refDataService.createRequest("ReferenceDataRequest")
+        fieldSchema = schemaFor(session, fields, typed)
+        refDataService, _ = app.sessions.service(session, "//blp/refdata")
 
-        request.set("returnFormattedValue", True)
-        for security in securities:
-            request.append("securities", security)
+        def requestChunk(securities):
+            return sendAndWait(session, createReferenceDataRequest(refDataService, securities, fields, typed))
 
-        for field in fields:
-            request.append("fields", field)
-
-        responses = sendAndWait(session, request)
+        chunks = [(chunk,) for chunk in splitIntoChunks(securities, app.config["MAX_SECURITIES_PER_REQUEST"])]
+        responses = [response for chunk in runChunks(requestChunk, chunks) for response in chunk]
 
         securityPricing = []
-        for response in responses:
-            securityPricing.extend(extractReferenceSecurityPricing(response))
-
         errors = []
-        for response in responses:
-            errors.extend(extractErrors(response))
+        with span("extract"):
+            for response in responses:
+                securityPricing.extend(extractReferenceSecurityPricing(response, fieldSchema))
+            for response in responses:
+                errors.extend(extractErrors(response))
         return { "response": securityPricing, "errors": errors }
     except Exception as e:
         raise
 
+def streamLatest(session, securities, fields, typed=False):
+    """
+    Yields each security as soon as its partial response is extracted, and the
+    errors of each partial response, so that large bulk fields are never all held
+    in memory.
+    """
+    recordBloombergHits("latest", len(securities) * len(fields))
+    fieldSchema = schemaFor(session, fields, typed)
+    refDataService, _ = app.sessions.service(session, "//blp/refdata")
+    for chunk in splitIntoChunks(securities, app.config["MAX_SECURITIES_PER_REQUEST"]):
+        for response in scheduledResponses(sendAndStream(session, createReferenceDataRequest(refDataService, chunk, fields, typed))):
+            for securityPricing in iterReferenceSecurityPricing(response, fieldSchema):
+                yield securityPricing
+            errors = extractErrors(response)
+            if len(errors):
+                yield { "errors": errors }
+
 @blueprint.route('/', methods = ['OPTIONS'])
 def tellThemWhenCORSIsAllowed():
     response = Response("")
@@ -43,15 +75,11 @@ def tellThemWhenCORSIsAllowed():
     response.headers['Access-Control-Allow-Methods'] = ", ".join(["GET", "POST", "OPTIONS"])
     return response
 
-# ?security=...&security=...&field=...&field=...
+# ?security=...&security=...&field=...&field=...[&stream=true]
 @blueprint.route('/', methods = ['GET', 'POST'])
 def index():
     try:
-        if app.sessionForRequests is None:
-            app.sessionForRequests = openBloombergSession()
-        if app.sessionForSubscriptions is None:
-            app.sessionForSubscriptions = openBloombergSession()
-            app.allSubscriptions = {}
+        app.sessions.ensureSessions()
     except Exception as e:
         handleBrokenSession(app, e)
         traceback.print_exc()
@@ -59,21 +87,56 @@ def index():
     try:
         securities = request.values.getlist('security') or []
         fields = request.values.getlist('field') or []
+        # ?typed=true returns numbers, ISO dates and bulk tables instead of formatted strings
+        typed = request.values.get('typed') == "true"
+        stream = request.values.get('stream') == "true"
     except Exception as e:
         traceback.print_exc()
         return respond400(e)
+    classifyRequest(len(securities) * len(fields))
+
+    if stream:
+        return streamResponse(securities, fields, typed)
 
     try:
-        payload = json.dumps(requestLatest(app.sessionForRequests, securities, fields)).encode()
+        result = requestLatest(app.sessionForRequests, securities, fields, typed)
+        with span("json"):
+            payload = json.dumps(result).encode()
     except Exception as e:
         handleBrokenSession(app, e)
         traceback.print_exc()
         return respond500(e)
 
+    etag = generateEtag(payload)
+    if etagMatches(etag):
+        return respond304(etag)
+
     response = Response(
         payload,
         status=200,
         mimetype='application/json')
+    response.headers['Etag'] = etag
+    response.headers['Cache-Control'] = "no-cache"
+    response.headers['Vary'] = "Origin"
+    response.headers['Access-Control-Allow-Origin'] = allowCORS(request.headers.get('Origin'))
+    return response
+
+# one JSON document per line, a security with its fields or the errors of a partial response
+def streamResponse(securities, fields, typed):
+    def generate():
+        try:
+            for chunk in streamLatest(app.sessionForRequests, securities, fields, typed):
+                yield json.dumps(chunk).encode() + b"\n"
+        except Exception as e:
+            # the status has already been sent, so the failure ends the stream instead
+            handleBrokenSession(app, e)
+            traceback.print_exc()
+            yield json.dumps({ "error": "{0}: {1}".format(type(e).__name__, e) }).encode() + b"\n"
+
+    response = Response(
+        stream_with_context(generate()),
+        status=200,
+        mimetype='application/x-ndjson')
     response.headers['Access-Control-Allow-Origin'] = allowCORS(request.headers.get('Origin'))
     return response
 
@@ -2,7 +2,6 @@ import json, sys
 import traceback
 from flask import Blueprint, current_app as app, request, Response
 
-from bloomberg.utils import openBloombergSession, openBloombergService
 from utils import handleBrokenSession
 
 from .utils import allowCORS, respond400, respond500, recordBloombergHits
@@ -16,12 +15,71 @@ def tellThemWhenCORSIsAllowed():
     response.headers['Access-Control-Allow-Methods'] = ", ".join(["GET", "POST", "OPTIONS"])
     return response
 
+def fastestInterval(security):
+    return min(app.subscriptionIntervals[security].values())
+
+def doSubscribe(securities, fields, interval, client=None):
+    """
+    Subscribes each security once, at the fastest interval any client asked for.
+    Clients that asked for a slower interval are throttled when the ticks are sent.
+    """
+    _, sessionRestarted = app.sessions.service(app.sessionForSubscriptions, "//blp/mktdata")
+    if sessionRestarted:
+        app.allSubscriptions = {}
+    try:
+        # binary frames encode values by the field types, these have to be known before the first tick.
+        # They are looked up on the session for requests, the subscriptions must not depend on //blp/apiflds
+        app.sessions.ensureSessions()
+        app.fieldSchema.kindsFor(app.sessions, app.sessionForRequests, fields)
+    except Exception as e:
+        traceback.print_exc()
+    if client is not None:
+        clientSubscriptions = app.clientSubscriptions.setdefault(client, {})
+        for security in securities:
+            requested = set(clientSubscriptions.get(security, ())) | set(field.upper() for field in fields)
+            clientSubscriptions[security] = tuple(requested)
+            app.clientIntervals.setdefault(client, {})[security] = float(interval)
+    subscriptionList = blpapi.SubscriptionList()
+    resubscriptionList = blpapi.SubscriptionList()
+    for security in securities:
+        correlationId = blpapi.CorrelationId(sys.intern(security))
+        if not security in app.allSubscriptions:
+            # intervals of subscriptions lost with a session or to a failure no longer apply
+            app.subscriptionIntervals.pop(security, None)
+            app.subscribedIntervals.pop(security, None)
+        requestedIntervals = app.subscriptionIntervals.setdefault(security, {})
+        previousInterval = min(requestedIntervals.values()) if len(requestedIntervals) else None
+        requestedIntervals[client] = float(interval)
+        options = "interval={}".format(fastestInterval(security))
+        if not security in app.allSubscriptions:
+            app.allSubscriptions[security] = list(fields)
+            subscriptionList.add(security, app.allSubscriptions[security], options, correlationId)
+            app.subscribedIntervals[security] = fastestInterval(security)
+            recordBloombergHits("subscribe", len(fields))
+        elif not set(fields) <= set(app.allSubscriptions[security]) or fastestInterval(security) < previousInterval:
+            app.allSubscriptions[security] += fields
+            app.allSubscriptions[security] = list(set(app.allSubscriptions[security]))
+            resubscriptionList.add(security, app.allSubscriptions[security], options, correlationId)
+            app.subscribedIntervals[security] = fastestInterval(security)
+            recordBloombergHits("resubscribe", len(fields))
+
+    if subscriptionList.size() != 0:
+        app.sessionForSubscriptions.subscribe(subscriptionList)
+
+    if resubscriptionList.size() != 0:
+        try:
+            app.sessionForSubscriptions.resubscribe(resubscriptionList)
+        except Exception as e:
+            traceback.print_exc()
+            recordBloombergHits("unsubscribe", resubscriptionList.size() * 3)
+            app.sessionForSubscriptions.unsubscribe(resubscriptionList)
+            recordBloombergHits("subscribe", resubscriptionList.size() * 3)
+            app.sessionForSubscriptions.subscribe(resubscriptionList)
+
 @blueprint.route('/', methods = ['GET', 'POST'])
 def index():
     try:
-        if app.sessionForSubscriptions is None:
-            app.sessionForSubscriptions = openBloombergSession()
-            app.allSubscriptions = {}
+        app.sessions.ensureSessions(forRequests=False)
     except Exception as e:
         handleBrokenSession(app, e)
         traceback.print_exc()
@@ -30,40 +88,18 @@ def index():
         securities = request.values.getlist('security') or []
         fields = request.values.getlist('field') or []
         interval = request.values.get('interval') or "2.0"
+        float(interval)
+        # Socket.IO session id of the caller, it then receives only the fields it asked for
+        client = request.values.get('client')
     except Exception as e:
         traceback.print_exc()
         return respond400(e)
 
     try:
-        _, sessionRestarted = openBloombergService(app.sessionForSubscriptions, "//blp/mktdata")
-        if sessionRestarted:
-            app.allSubscriptions = {}
-        subscriptionList = blpapi.SubscriptionList()
-        resubscriptionList = blpapi.SubscriptionList()
-        for security in securities:
-            correlationId = blpapi.CorrelationId(sys.intern(security))
-            if not security in app.allSubscriptions:
-                app.allSubscriptions[security] = list(fields)
-                subscriptionList.add(security, app.allSubscriptions[security], "interval=" + interval, correlationId)
-                recordBloombergHits("subscribe", len(fields))
-            else:
-                app.allSubscriptions[security] += fields
-                app.allSubscriptions[security] = list(set(app.allSubscriptions[security]))
-                resubscriptionList.add(security, app.allSubscriptions[security], "interval=" + interval, correlationId)
-                recordBloombergHits("resubscribe", len(fields))
-
-        if subscriptionList.size() != 0:
-            app.sessionForSubscriptions.subscribe(subscriptionList)
-
-        if resubscriptionList.size() != 0:
-            try:
-                app.sessionForSubscriptions.resubscribe(resubscriptionList)
-            except Exception as e:
-                traceback.print_exc()
-                recordBloombergHits("unsubscribe", resubscriptionList.size() * 3)
-                app.sessionForSubscriptions.unsubscribe(resubscriptionList)
-                recordBloombergHits("subscribe", resubscriptionList.size() * 3)
-                app.sessionForSubscriptions.subscribe(resubscriptionList)
+        if app.engine is not None:
+            app.engine.call("subscribe", securities, fields, interval, client)
+        else:
+            doSubscribe(securities, fields, interval, client)
     except Exception as e:
         handleBrokenSession(app, e)
         traceback.print_exc()
@@ -76,4 +112,14 @@ def index():
     response.headers['Access-Control-Allow-Origin'] = allowCORS(request.headers.get('Origin'))
     return response
 
+def useBinaryTicks(client):
+    # binary frames carry every subscribed field, client= only filters the JSON ticks
+    app.binarySockets.add(client)
 
+def forgetClient(client):
+    app.clientSubscriptions.pop(client, None)
+    app.clientIntervals.pop(client, None)
+    app.binarySockets.discard(client)
+    # Bloomberg keeps sending at the subscribed interval, the remaining clients are throttled against that
+    for requestedIntervals in app.subscriptionIntervals.values():
+        requestedIntervals.pop(client, None)
@@ -2,7 +2,6 @@ import json, sys
 import traceback
 from flask import Blueprint, current_app as app, request, Response
 
-from bloomberg.utils import openBloombergSession, openBloombergService
 from utils import handleBrokenSession
 
 from .utils import allowCORS, respond400, respond500, recordBloombergHits
@@ -16,20 +15,32 @@ def tellThemWhenCORSIsAllowed():
     response.headers['Access-Control-Allow-Methods'] = ", ".join(["OPTIONS", "GET", "POST", "DELETE"])
     return response
 
+def unsubscribeSecurities(securities):
+    _, sessionRestarted = app.sessions.service(app.sessionForSubscriptions, "//blp/mktdata")
+    if sessionRestarted:
+        app.allSubscriptions = {}
+    subscriptionList = blpapi.SubscriptionList()
+    for security in securities:
+        correlationId = blpapi.CorrelationId(sys.intern(security))
+        if security in app.allSubscriptions:
+            del app.allSubscriptions[security]
+        app.subscriptionIntervals.pop(security, None)
+        app.subscribedIntervals.pop(security, None)
+        for clientSubscriptions in app.clientSubscriptions.values():
+            clientSubscriptions.pop(security, None)
+        for clientIntervals in app.clientIntervals.values():
+            clientIntervals.pop(security, None)
+        subscriptionList.add(security, correlationId=correlationId)
+
+    recordBloombergHits("unsubscribe", subscriptionList.size())
+    app.sessionForSubscriptions.unsubscribe(subscriptionList)
+
 def doUnsubscribe(securities):
     try:
-        _, sessionRestarted = openBloombergService(app.sessionForSubscriptions, "//blp/mktdata")
-        if sessionRestarted:
-            app.allSubscriptions = {}
-        subscriptionList = blpapi.SubscriptionList()
-        for security in securities:
-            correlationId = blpapi.CorrelationId(sys.intern(security))
-            if security in app.allSubscriptions:
-                del app.allSubscriptions[security]
-            subscriptionList.add(security, correlationId=correlationId)
-
-        recordBloombergHits("unsubscribe", subscriptionList.size())
-        app.sessionForSubscriptions.unsubscribe(subscriptionList)
+        if app.engine is not None:
+            app.engine.call("unsubscribe", securities)
+        else:
+            unsubscribeSecurities(securities)
     except Exception as e:
         handleBrokenSession(app, e)
         traceback.print_exc()
@@ -45,9 +56,7 @@ def doUnsubscribe(securities):
 @blueprint.route('/', methods = ['DELETE'])
 def unsubscribeAll():
     try:
-        if app.sessionForSubscriptions is None:
-            app.sessionForSubscriptions = openBloombergSession()
-            app.allSubscriptions = {}
+        app.sessions.ensureSessions(forRequests=False)
     except Exception as e:
         handleBrokenSession(app, e)
         traceback.print_exc()
@@ -58,9 +67,7 @@ def unsubscribeAll():
 @blueprint.route('/', methods = ['GET', 'POST'])
 def unsubscribe():
     try:
-        if app.sessionForSubscriptions is None:
-            app.sessionForSubscriptions = openBloombergSession()
-            app.allSubscriptions = {}
+        app.sessions.ensureSessions(forRequests=False)
     except Exception as e:
         handleBrokenSession(app, e)
         traceback.print_exc()
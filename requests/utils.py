@@ -1,7 +1,12 @@
 import datetime
+import eventlet
 from flask import request, Response, current_app as app
 
-import hashlib, traceback
+import hashlib, json, traceback
+
+from scheduler import BULK, INTERACTIVE, currentSchedule, useSchedule
+from sessions import PROBE_INTERVAL, SessionUnavailableException
+from timing import currentTiming, useTiming
 
 
 def allowCORS(host):
@@ -17,9 +22,25 @@ def allowCORS(host):
         return "null"
 
 def generateEtag(obj):
-    sha1 = hashlib.sha1()
-    sha1.update("{}".format(obj).encode())
-    return '"{}"'.format(sha1.hexdigest())
+    if not isinstance(obj, bytes):
+        obj = json.dumps(obj, sort_keys=True, separators=(",", ":"), default=str).encode()
+    return '"{}"'.format(hashlib.sha1(obj).hexdigest())
+
+def etagMatches(etag):
+    ifNoneMatch = request.headers.get('If-None-Match')
+    if not ifNoneMatch:
+        return False
+    candidates = [each.strip() for each in ifNoneMatch.split(",")]
+    return "*" in candidates or etag in candidates or "W/" + etag in candidates
+
+def respond304(etag):
+    response = Response(
+        "",
+        status=304,
+        mimetype='application/json')
+    response.headers['Etag'] = etag
+    response.headers['Access-Control-Allow-Origin'] = allowCORS(request.headers.get('Origin'))
+    return response
 
 def respond400(e):
     response = Response("{0}: {1}".format(type(e).__name__, e).encode(), status=400)
@@ -27,7 +48,16 @@ def respond400(e):
     traceback.print_exc()
     return response
 
+def respond503(e):
+    response = Response("{0}: {1}".format(type(e).__name__, e).encode(), status=503)
+    response.headers['Retry-After'] = str(PROBE_INTERVAL)
+    response.headers['Access-Control-Allow-Origin'] = allowCORS(request.headers.get('Origin'))
+    return response
+
 def respond500(e):
+    if isinstance(e, SessionUnavailableException):
+        # Bloomberg is known to be down, there is no point in retrying right away
+        return respond503(e)
     response = Response("{0}: {1}".format(type(e).__name__, e).encode(), status=500)
     response.headers['Access-Control-Allow-Origin'] = allowCORS(request.headers.get('Origin'))
     traceback.print_exc()
@@ -47,3 +77,79 @@ def recordBloombergHits(key, number):
     if not key in app.bloombergHits[today]:
         app.bloombergHits[today][key] = 0
     app.bloombergHits[today][key] += number
+
+def splitIntoChunks(items, size):
+    if not size or len(items) <= size:
+        return [items]
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+def splitIntoDateWindows(startDate, endDate, days):
+    try:
+        start = datetime.datetime.strptime(startDate, "%Y%m%d").date()
+        end = datetime.datetime.strptime(endDate, "%Y%m%d").date()
+    except (TypeError, ValueError):
+        # relative dates such as -1CY are left for Bloomberg to resolve
+        return [(startDate, endDate)]
+    if not days or (end - start).days < days:
+        return [(startDate, endDate)]
+    windows = []
+    while start <= end:
+        windowEnd = min(start + datetime.timedelta(days=days - 1), end)
+        windows.append((start.strftime("%Y%m%d"), windowEnd.strftime("%Y%m%d")))
+        start = windowEnd + datetime.timedelta(days=1)
+    return windows
+
+def parseMaxPoints(value):
+    maxPoints = int(value or 0)
+    if maxPoints < 0:
+        raise ValueError("maxPoints has to be a positive number of points, or 0 for all of them")
+    return maxPoints
+
+def classifyRequest(cost):
+    """
+    Requests for more than BULK_COST security fields, or that ask for it with
+    X-Priority: bulk, are scheduled as bulk. Clients are told apart by X-Client-Id,
+    their Origin or their address.
+    """
+    bulk = cost > app.config["BULK_COST"] or request.headers.get('X-Priority') == BULK
+    useSchedule(BULK if bulk else INTERACTIVE, requestClient())
+
+def requestClient():
+    return request.headers.get('X-Client-Id') or request.headers.get('Origin') or request.remote_addr
+
+def scheduled():
+    priority, client = currentSchedule()
+    return app.scheduler.slot(priority, client)
+
+def scheduledResponses(responses):
+    """
+    Holds a scheduler slot only while waiting for the next partial response, and
+    not while the client of a stream reads the previous one, so that slow readers
+    do not keep the slots from other requests.
+    """
+    responses = iter(responses)
+    while True:
+        with scheduled():
+            response = next(responses, None)
+        if response is None:
+            return
+        yield response
+
+def runChunks(function, chunks):
+    if len(chunks) == 1:
+        with scheduled():
+            return [function(*chunks[0])]
+    flaskApp = app._get_current_object()
+    timing = currentTiming()
+    priority, client = currentSchedule()
+
+    # green threads of the pool do not share the application context of the request
+    def runChunk(*chunk):
+        with flaskApp.app_context():
+            useTiming(timing)
+            useSchedule(priority, client)
+            with app.scheduler.slot(priority, client):
+                return function(*chunk)
+
+    pool = eventlet.GreenPool(app.config["CONCURRENT_CHUNKS"])
+    return list(pool.starmap(runChunk, chunks))
@@ -0,0 +1,85 @@
+"""
+Admission of requests to Bloomberg. Interactive and bulk requests have separate
+concurrency limits, so that backfills can never take all of the request session,
+and within a class the clients share their slots by weighted fair queuing.
+"""
+import heapq
+import itertools
+from contextlib import contextmanager
+from eventlet.event import Event
+from flask import g, has_app_context
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+PRIORITIES = [INTERACTIVE, BULK]
+
+DEFAULT_LIMITS = { INTERACTIVE: 8, BULK: 2 }
+
+def currentSchedule():
+    if not has_app_context():
+        return INTERACTIVE, None
+    return getattr(g, "priority", INTERACTIVE), getattr(g, "client", None)
+
+def useSchedule(priority, client):
+    g.priority = priority
+    g.client = client
+
+class Scheduler(object):
+    def __init__(self, limits=None, weights=None):
+        self.limits = dict(DEFAULT_LIMITS)
+        self.limits.update(limits or {})
+        self.weights = weights or {}
+        self.running = dict((priority, 0) for priority in PRIORITIES)
+        self.waiting = dict((priority, []) for priority in PRIORITIES)
+        self.virtualTime = dict((priority, 0.0) for priority in PRIORITIES)
+        self.finishTags = dict((priority, {}) for priority in PRIORITIES)
+        self.counter = itertools.count()
+
+    def weightOf(self, client):
+        return self.weights.get(client, 1.0)
+
+    @contextmanager
+    def slot(self, priority, client, cost=1):
+        self.acquire(priority, client, cost)
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+    def acquire(self, priority, client, cost=1):
+        if self.running[priority] == 0 and not self.waiting[priority]:
+            # an idle class forgets the history of its clients
+            self.finishTags[priority].clear()
+        # clients that asked for less so far are served first, in proportion to their weight
+        start = max(self.virtualTime[priority], self.finishTags[priority].get(client, 0.0))
+        finish = start + float(cost) / self.weightOf(client)
+        self.finishTags[priority][client] = finish
+        if self.running[priority] < self.limits[priority] and not self.waiting[priority]:
+            self.running[priority] += 1
+            self.virtualTime[priority] = start
+            return
+        event = Event()
+        entry = [finish, next(self.counter), start, event]
+        heapq.heappush(self.waiting[priority], entry)
+        try:
+            event.wait()
+        except BaseException:
+            if event.ready():
+                self.release(priority)
+            else:
+                self.waiting[priority].remove(entry)
+                heapq.heapify(self.waiting[priority])
+            raise
+
+    def release(self, priority):
+        self.running[priority] -= 1
+        waiting = self.waiting[priority]
+        while waiting and self.running[priority] < self.limits[priority]:
+            _, _, start, event = heapq.heappop(waiting)
+            self.running[priority] += 1
+            self.virtualTime[priority] = start
+            event.send()
+
+    def metrics(self):
+        return dict((priority, { "running": self.running[priority], "waiting": len(self.waiting[priority]) })
+            for priority in PRIORITIES)
@@ -11,36 +11,102 @@ import time
 import json
 import traceback
 import sys
+import os
+import tempfile
 import subprocess
 import psutil
 import functools as fn
 
 from flask import Flask, Response, request
-from flask_socketio import emit, SocketIO
+from flask_socketio import emit, join_room, leave_room, SocketIO
 
-from bloomberg.utils import openBloombergSession, startBbcommIfNecessary, BrokenSessionException
-from requests import latest, historical, intraday, subscribe, unsubscribe, dev
-from requests.utils import allowCORS
+from bloomberg.fields import FieldSchema
+from bloomberg.utils import startBbcommIfNecessary, BrokenSessionException
+from bus import connectBus, parseBusUrl, serveBus
+from engine import EngineClient, runEngine
+from journal import Journal
+from frames import JSON_ROOM, BINARY_ROOM, TickDictionary
+from requests import latest, historical, intraday, subscribe, unsubscribe, batch, debug, dev
+from requests.cache import DailyBarCache, IntradayBarCache, ResponseCache
+from requests.utils import allowCORS, requestClient
+from prewarm import PREWARM_HEADER, PREWARMED_ENDPOINTS, AccessPatterns, Prewarmer
+from scheduler import BULK, INTERACTIVE, Scheduler
+from sessions import SessionManager
+from stalls import StallDetector
 from subscriptions import handleSubscriptions
+from ticktable import TickTable
+from timing import SlowRequestLog, Timing, currentTiming, useTiming
 from utils import get_main_dir, main_is_frozen
 
 VERSION = "2.6"
 app = Flask(__name__)
 
 app.url_map.strict_slashes = False
+app.config["MAX_SECURITIES_PER_REQUEST"] = 100
+app.config["MAX_DAYS_PER_REQUEST"] = 5 * 365
+app.config["CONCURRENT_CHUNKS"] = 4
+app.config["CONCURRENT_QUERIES"] = 8
+app.config["BULK_COST"] = 1000
+# the Windows service calls main() without any arguments, it can only be configured through the environment
+app.config["PROFILER_TOKEN"] = os.environ.get("BBAPI_PROFILER_TOKEN")
 
 app.allSubscriptions = {}
+app.clientSubscriptions = {}
+app.clientIntervals = {}
+app.subscriptionIntervals = {}
+# the interval each security was last subscribed or resubscribed at, Bloomberg sends at that rate
+app.subscribedIntervals = {}
 app.bloombergHits = {}
 app.sessionForRequests = None
 app.sessionForSubscriptions = None
+app.sessions = SessionManager(app)
+app.responseCache = ResponseCache()
+app.dailyBars = DailyBarCache()
+app.intradayBars = IntradayBarCache()
+app.fieldSchema = FieldSchema()
+app.engine = None
+app.tickTable = None
+app.tickDictionary = TickDictionary()
+app.binaryClients = 0
+app.binarySockets = set()
+app.slowRequests = SlowRequestLog()
+app.stallDetector = StallDetector()
+app.profiler = None
+app.scheduler = Scheduler()
+app.accessPatterns = AccessPatterns()
+app.prewarmer = Prewarmer(app, app.accessPatterns)
+app.journal = None
 
 app.register_blueprint(latest.blueprint, url_prefix='/latest')
 app.register_blueprint(historical.blueprint, url_prefix='/historical')
 app.register_blueprint(intraday.blueprint, url_prefix='/intraday')
+app.register_blueprint(debug.blueprint, url_prefix='/debug')
 app.register_blueprint(subscribe.blueprint, url_prefix='/subscribe')
 app.register_blueprint(unsubscribe.blueprint, url_prefix='/unsubscribe')
+app.register_blueprint(batch.blueprint, url_prefix='/batch')
 socketio = SocketIO(app, async_mode="eventlet")
 
+@app.before_request
+def startTiming():
+    useTiming(Timing())
+
+@app.after_request
+def reportTiming(response):
+    timing = currentTiming()
+    if timing is not None:
+        response.headers['Server-Timing'] = timing.header()
+        app.slowRequests.record(request, response.status_code, timing)
+        if app.journal is not None:
+            app.journal.record(request, response.status_code, timing, requestClient())
+    return response
+
+@app.after_request
+def recordAccessPattern(response):
+    # by endpoint, /historical and /historical/ are the same query
+    if request.method == 'GET' and request.endpoint in PREWARMED_ENDPOINTS and response.status_code in (200, 304) and not request.headers.get(PREWARM_HEADER):
+        app.accessPatterns.record(PREWARMED_ENDPOINTS[request.endpoint], list(request.args.items(multi=True)))
+    return response
+
 @app.route('/status', methods = ['OPTIONS'])
 @app.route('/subscriptions', methods = ['OPTIONS'])
 @app.route('/latest', methods = ['OPTIONS'])
@@ -56,14 +122,28 @@ def tellThemWhenCORSIsAllowed():
 
 @app.route('/status', methods = ['GET'])
 def status():
-    status = "UP" if app.sessionForRequests or app.sessionForSubscriptions else "DOWN"
+    status = "UP" if app.sessionForRequests or app.sessionForSubscriptions or (app.engine and app.engine.isConnected()) else "DOWN"
     response = Response(
         json.dumps({
             "status": status,
             "version": VERSION,
             "metrics": {
                 "subscriptions": fn.reduce(lambda xs, x: xs + len(x[1]), app.allSubscriptions.items(), 0),
-                "bloombergHits": app.bloombergHits
+                "bloombergHits": app.bloombergHits,
+                "responseCache": {
+                    "entries": len(app.responseCache.entries),
+                    "bytes": app.responseCache.totalBytes
+                },
+                "circuitBreaker": app.sessions.breaker.state,
+                "dailyBars": len(app.dailyBars.series),
+                "intradayBars": len(app.intradayBars.days),
+                "hubLag": app.stallDetector.percentiles(),
+                "hubStalls": len(app.stallDetector.stalls),
+                "scheduler": app.scheduler.metrics(),
+                "prewarm": {
+                    "queries": len(app.accessPatterns.shapes),
+                    "lastRun": app.prewarmer.lastRun
+                }
             }
         }).encode(),
         status=200,
@@ -80,6 +160,39 @@ def subscriptions():
     response.headers['Access-Control-Allow-Origin'] = allowCORS(request.headers.get('Origin'))
     return response
 
+@socketio.on('connect')
+def joinJsonTicks():
+    join_room(JSON_ROOM)
+
+# clients opt in to compact binary "ticks" frames, the ids in them are announced with "tickDictionary"
+@socketio.on('binary')
+def switchToBinaryTicks():
+    if request.sid in app.binarySockets:
+        return
+    leave_room(JSON_ROOM)
+    join_room(BINARY_ROOM)
+    emit("tickDictionary", app.tickDictionary.snapshot())
+    # app.binarySockets holds the sockets of this process, the engine keeps its own for all workers
+    if app.engine is not None:
+        app.engine.notify("binarySocket", request.sid)
+    subscribe.useBinaryTicks(request.sid)
+    updateBinaryClients()
+
+@socketio.on('disconnect')
+def forgetSocket():
+    wasBinary = request.sid in app.binarySockets
+    if app.engine is not None:
+        app.engine.notify("forgetClient", request.sid)
+    subscribe.forgetClient(request.sid)
+    if wasBinary:
+        updateBinaryClients()
+
+def updateBinaryClients():
+    if app.engine is not None:
+        app.engine.setBinaryClients(len(app.binarySockets))
+    else:
+        app.binaryClients = len(app.binarySockets)
+
 def wireUpBlpapiImplementation(blpapi):
     import bloomberg.utils
     bloomberg.utils.__dict__["blpapi"] = blpapi
@@ -88,6 +201,8 @@ def wireUpBlpapiImplementation(blpapi):
     subscriptions.__dict__["blpapi"] = blpapi
     unsubscribe.__dict__["blpapi"] = blpapi
     dev.__dict__["blpapi"] = blpapi
+    import sessions
+    sessions.__dict__["blpapi"] = blpapi
 
 def wireUpDevelopmentDependencies():
     global blpapi
@@ -102,22 +217,34 @@ def wireUpProductionDependencies():
     log.setLevel(logging.WARNING)
     startBbcommIfNecessary()
 
-def main(port = 6659):
+def main(port = 6659, role = "standalone", busUrl = "tcp://127.0.0.1:6660"):
     wireUpBlpapiImplementation(blpapi)
 
     server = None
     try:
+        if role == "engine":
+            runEngine(app, serveBus(busUrl))
+            return
         try:
-            app.sessionForRequests = openBloombergSession()
-            app.sessionForSubscriptions = openBloombergSession()
-            app.allSubscriptions = {}
+            app.sessionForRequests = app.sessions.openSession()
+            if role == "standalone":
+                app.sessionForSubscriptions = app.sessions.openSession()
+                app.allSubscriptions = {}
         except:
             traceback.print_exc()
-        socketio.start_background_task(lambda: handleSubscriptions(app, socketio))
+        app.sessions.start()
+        app.stallDetector.start()
+        app.prewarmer.start()
+        if role == "worker":
+            app.engine = EngineClient(app, socketio, connectBus(busUrl))
+            app.engine.start()
+        else:
+            socketio.start_background_task(lambda: handleSubscriptions(app, socketio))
         socketio.run(app, port = port)
     except KeyboardInterrupt:
         print("Ctrl+C received, exiting...")
     finally:
+        app.accessPatterns.save()
         if app.sessionForRequests is not None:
             app.sessionForRequests.stop()
         if app.sessionForSubscriptions is not None:
@@ -125,6 +252,49 @@ def main(port = 6659):
         if server is not None:
             server.socket.close()
 
+def argumentsWithout(arguments, name):
+    result = []
+    skipNext = False
+    for argument in arguments:
+        if skipNext:
+            skipNext = False
+        elif argument == name:
+            skipNext = True
+        elif not argument.startswith(name + "="):
+            result.append(argument)
+    return result
+
+def workerCommands(command, arguments, workers, port, prewarmBudget):
+    """
+    Every worker listens on a port of its own, --port + N. A Socket.IO connection starts
+    with long-polling, its requests have to keep reaching the worker that knows its session.
+    """
+    for name in ["--workers", "--role", "--port", "--prewarm-budget"]:
+        arguments = argumentsWithout(arguments, name)
+    commands = [command + arguments + ["--role", "engine"]]
+    for index in range(workers):
+        # every worker warms its own caches, together they stay within the budget
+        commands.append(command + arguments + ["--role", "worker", "--port", str(port + index),
+            "--prewarm-budget", str(prewarmBudget // workers)])
+    return commands
+
+def launchWorkers(workers, port, prewarmBudget):
+    # one engine process owns the Bloomberg subscriptions, the workers serve HTTP and Socket.IO
+    command = [sys.executable] if main_is_frozen() else [sys.executable, os.path.realpath(__file__)]
+    commands = workerCommands(command, sys.argv[1:], workers, port, prewarmBudget)
+    for index in range(workers):
+        print("Starting worker {} on port {}".format(index, port + index))
+    processes = [subprocess.Popen(each) for each in commands]
+    try:
+        for process in processes:
+            process.wait()
+    except KeyboardInterrupt:
+        print("Ctrl+C received, exiting...")
+    finally:
+        for process in processes:
+            if process.poll() is None:
+                process.terminate()
+
 if main_is_frozen():
     wireUpProductionDependencies()
 
@@ -136,16 +306,89 @@ if __name__ == "__main__":
                         help='log level')
     parser.add_argument('--port', type=int, default=6659,
                         help='port number (default: 6659)')
+    parser.add_argument('--role', choices=['standalone', 'engine', 'worker'], default='standalone',
+                        help='run everything in one process, or only the subscription engine (primary node) or an HTTP worker (edge node)')
+    parser.add_argument('--engine-port', type=int, default=6660,
+                        help='local port of the subscription engine (default: 6660)')
+    parser.add_argument('--bus',
+                        help='tcp://HOST:PORT the engine relays ticks on and workers connect to, for workers on other machines '
+                             'the engine has to listen on an address they can reach (default: tcp://127.0.0.1:ENGINE_PORT)')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='start a subscription engine and this many HTTP workers as separate processes')
+    parser.add_argument('--tick-table',
+                        help='also publish last values into a memory-mapped tick table at this path')
+    parser.add_argument('--field-schema', default=os.path.join(tempfile.gettempdir(), "bbapi-fields.json"),
+                        help='file caching field types looked up from //blp/apiflds')
+    parser.add_argument('--max-securities-per-request', type=int, default=100,
+                        help='split /latest and /historical into Bloomberg requests of at most this many securities')
+    parser.add_argument('--max-days-per-request', type=int, default=5 * 365,
+                        help='split /historical into Bloomberg requests covering at most this many days')
+    parser.add_argument('--concurrent-chunks', type=int, default=4,
+                        help='number of split requests sent to Bloomberg at the same time')
+    parser.add_argument('--interactive-concurrency', type=int, default=8,
+                        help='number of interactive requests sent to Bloomberg at the same time')
+    parser.add_argument('--bulk-concurrency', type=int, default=2,
+                        help='number of bulk requests sent to Bloomberg at the same time')
+    parser.add_argument('--bulk-cost', type=int, default=1000,
+                        help='requests for more security fields (times years or days) than this are scheduled as bulk')
+    parser.add_argument('--client-weight', action='append', default=[], metavar='CLIENT=WEIGHT',
+                        help='share of the Bloomberg requests given to a client (X-Client-Id, Origin or address), 1 by default')
+    parser.add_argument('--access-patterns', default=os.path.join(tempfile.gettempdir(), "bbapi-access-patterns.json"),
+                        help='file keeping how often each /historical and /intraday query was asked for')
+    parser.add_argument('--prewarm-at', default="06:30",
+                        help='local time (HH:MM) at which the most frequent queries are replayed on weekdays')
+    parser.add_argument('--prewarm-budget', type=int, default=20000,
+                        help='Bloomberg hits the replayed queries may use up, shared by --workers (0 disables prewarming)')
+    parser.add_argument('--journal',
+                        help='append every API call to this JSONL file, for replaying with benchmarks/loadtest.py')
+    parser.add_argument('--cache-size', type=int, default=64,
+                        help='size of the in-memory response cache in MB (default: 64)')
+    parser.add_argument('--slow-requests', type=int, default=20,
+                        help='number of slowest requests kept for /debug/slow')
+    parser.add_argument('--stall-threshold', type=float, default=0.5,
+                        help='seconds the eventlet hub may be blocked before the blocking stack is captured for /debug/stalls')
+    parser.add_argument('--profiler-token', default=app.config["PROFILER_TOKEN"],
+                        help='enables /debug/profile for requests carrying this token in the X-Profiler-Token header (default: $BBAPI_PROFILER_TOKEN, or disabled)')
+    parser.add_argument('--cache-dir',
+                        help='directory for persisting immutable responses (default: memory only)')
 
     args = parser.parse_args()
 
+    if args.workers > 0:
+        launchWorkers(args.workers, args.port, args.prewarm_budget)
+        sys.exit(0)
+
     if args.log is not None:
         logging.basicConfig(level=getattr(logging, args.log.upper(), None))
 
+    app.responseCache = ResponseCache(args.cache_size * 1024 * 1024, args.cache_dir)
+    app.fieldSchema = FieldSchema(args.field_schema)
+    app.slowRequests = SlowRequestLog(args.slow_requests)
+    app.stallDetector = StallDetector(args.stall_threshold)
+    app.config["PROFILER_TOKEN"] = args.profiler_token
+    app.config["MAX_SECURITIES_PER_REQUEST"] = args.max_securities_per_request
+    app.config["MAX_DAYS_PER_REQUEST"] = args.max_days_per_request
+    app.config["CONCURRENT_CHUNKS"] = args.concurrent_chunks
+    app.config["BULK_COST"] = args.bulk_cost
+    app.accessPatterns = AccessPatterns(args.access_patterns)
+    app.prewarmer = Prewarmer(app, app.accessPatterns, args.prewarm_at, args.prewarm_budget)
+    if args.journal is not None:
+        app.journal = Journal(args.journal)
+    app.scheduler = Scheduler(
+        { INTERACTIVE: args.interactive_concurrency, BULK: args.bulk_concurrency },
+        dict((client, float(weight)) for client, weight in (each.rsplit("=", 1) for each in args.client_weight)))
+    if args.tick_table is not None and args.role != "worker":
+        app.tickTable = TickTable(args.tick_table)
+
     if args.simulator:
         print("Using blpapi_simulator")
         wireUpDevelopmentDependencies()
     else:
         wireUpProductionDependencies()
-    main(args.port)
+    busUrl = args.bus or "tcp://127.0.0.1:{}".format(args.engine_port)
+    try:
+        parseBusUrl(busUrl)
+    except ValueError as e:
+        parser.error(str(e))
+    main(args.port, args.role, busUrl)
 
@@ -0,0 +1,172 @@
+import eventlet
+import time
+import traceback
+
+from bloomberg.utils import openBloombergSession, openBloombergService, restartBbcomm
+from timing import span
+
+# services every session of that kind needs, opened before the first request asks for them
+PREFERRED_SERVICES = [
+    ("sessionForRequests", "//blp/refdata"),
+    ("sessionForSubscriptions", "//blp/mktdata")
+]
+
+# status messages after which the services of a session have to be opened again
+SERVICE_LOST = ["SessionConnectionDown", "SessionConnectionUp", "SessionTerminated", "ServiceDown", "ServiceUp"]
+
+# consecutive failures to open a session before requests stop trying
+SESSION_FAILURE_THRESHOLD = 2
+PROBE_INTERVAL = 5
+
+class SessionUnavailableException(Exception):
+    pass
+
+class CircuitBreaker(object):
+    """
+    Closed while sessions can be opened. After repeated failures it opens and
+    requests fail fast, until a single prober, half-open, manages to open a
+    session again.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, threshold=SESSION_FAILURE_THRESHOLD):
+        self.threshold = threshold
+        self.state = CircuitBreaker.CLOSED
+        self.failures = 0
+        self.openedAt = None
+
+    def isClosed(self):
+        return self.state == CircuitBreaker.CLOSED
+
+    def halfOpen(self):
+        self.state = CircuitBreaker.HALF_OPEN
+
+    def recordSuccess(self):
+        self.state = CircuitBreaker.CLOSED
+        self.failures = 0
+        self.openedAt = None
+
+    def recordFailure(self):
+        self.failures += 1
+        if self.state == CircuitBreaker.HALF_OPEN or self.failures >= self.threshold:
+            if self.state == CircuitBreaker.CLOSED:
+                self.openedAt = time.time()
+            self.state = CircuitBreaker.OPEN
+
+class SessionManager(object):
+    """
+    Owns the Bloomberg sessions of the app and keeps the services opened on them,
+    so that requests use ready Service handles instead of opening services on the
+    way. Services are reopened in the background after session status events.
+    """
+    def __init__(self, app):
+        self.app = app
+        self.services = {}
+        self.monitor = None
+        self.breaker = CircuitBreaker()
+        self.prober = None
+
+    def ensureSessions(self, forRequests=True):
+        if forRequests and self.app.sessionForRequests is None:
+            self.app.sessionForRequests = self.openSession()
+        if self.app.engine is None and self.app.sessionForSubscriptions is None:
+            self.app.sessionForSubscriptions = self.openSession()
+            self.app.allSubscriptions = {}
+
+    def openSession(self):
+        if not self.breaker.isClosed():
+            raise SessionUnavailableException("Bloomberg has been unreachable for {:.0f}s, retrying in the background".format(time.time() - self.breaker.openedAt))
+        try:
+            session = openBloombergSession()
+        except Exception:
+            self.breaker.recordFailure()
+            if not self.breaker.isClosed():
+                self.startProber()
+            raise
+        self.breaker.recordSuccess()
+        return session
+
+    def startProber(self):
+        if self.prober is None:
+            self.prober = eventlet.spawn(self.probe)
+
+    def probe(self):
+        try:
+            while not self.breaker.isClosed():
+                eventlet.sleep(PROBE_INTERVAL)
+                self.breaker.halfOpen()
+                try:
+                    # the session only proves that Bloomberg is back, requests open their own
+                    openBloombergSession().stop()
+                    self.breaker.recordSuccess()
+                except Exception:
+                    traceback.print_exc()
+                    self.breaker.recordFailure()
+                    restartBbcomm()
+        finally:
+            self.prober = None
+
+    def service(self, session, serviceName):
+        """
+        Returns the service and whether the session had to be restarted to open it.
+        A restart is reported once, to the first caller after it, even when the
+        service was opened in the background.
+        """
+        if not self.isOpen(session, serviceName):
+            self.openService(session, serviceName)
+        key = (id(session), serviceName)
+        _, service, sessionRestarted = self.services[key]
+        self.services[key] = (session, service, False)
+        return service, sessionRestarted
+
+    def isOpen(self, session, serviceName):
+        cached = self.services.get((id(session), serviceName))
+        return cached is not None and cached[0] is session
+
+    def openService(self, session, serviceName):
+        with span("openService"):
+            service, sessionRestarted = openBloombergService(session, serviceName)
+        self.services[(id(session), serviceName)] = (session, service, sessionRestarted)
+
+    def invalidate(self, session=None):
+        for key, (cachedSession, _, _) in list(self.services.items()):
+            if session is None or cachedSession is session:
+                del self.services[key]
+
+    def processStatusEvent(self, event, session):
+        for msg in event:
+            if str(msg.messageType()) in SERVICE_LOST:
+                self.invalidate(session)
+
+    def start(self):
+        if self.monitor is None:
+            self.monitor = eventlet.spawn(self.monitorSessions)
+
+    def monitorSessions(self):
+        while True:
+            try:
+                # services of sessions that were replaced are never asked for again
+                current = [self.app.sessionForRequests, self.app.sessionForSubscriptions]
+                for key, (session, _, _) in list(self.services.items()):
+                    if not any(session is each for each in current):
+                        del self.services[key]
+                self.drainStatusEvents(self.app.sessionForRequests)
+                for attribute, serviceName in PREFERRED_SERVICES:
+                    session = getattr(self.app, attribute)
+                    if session is not None and not self.isOpen(session, serviceName):
+                        self.openService(session, serviceName)
+            except Exception:
+                traceback.print_exc()
+            eventlet.sleep(1)
+
+    def drainStatusEvents(self, session):
+        # requests use their own event queues, so only status events end up in the session queue
+        if session is None:
+            return
+        event = session.tryNextEvent()
+        while event is not None:
+            if event.eventType() in (blpapi.Event.SESSION_STATUS, blpapi.Event.SERVICE_STATUS):
+                self.processStatusEvent(event, session)
+            event = session.tryNextEvent()
@@ -0,0 +1,84 @@
+"""
+Measures how late the eventlet hub wakes green threads up. A heartbeat green
+thread records its lag, and a watchdog in a real OS thread captures the stack
+of whatever keeps the hub blocked for longer than the threshold, since no green
+thread can run while it is.
+"""
+import datetime
+import eventlet
+import sys
+import time
+import traceback
+from collections import deque
+from eventlet import patcher
+
+import numpy as np
+
+HEARTBEAT_INTERVAL = 0.1
+STALL_THRESHOLD = 0.5
+
+class StallDetector(object):
+    def __init__(self, threshold=STALL_THRESHOLD, interval=HEARTBEAT_INTERVAL, samples=3000, stalls=20):
+        self.threshold = threshold
+        self.interval = interval
+        self.lags = deque(maxlen=samples)
+        self.stalls = deque(maxlen=stalls)
+        self.lastBeat = time.time()
+        self.stalledSince = None
+        self.currentStall = None
+        self.hubThreadId = None
+        self.heartbeat = None
+
+    def start(self):
+        if self.heartbeat is not None:
+            return
+        # the hub runs in this OS thread, every green thread included
+        self.hubThreadId = patcher.original("_thread").get_ident()
+        self.lastBeat = time.time()
+        self.heartbeat = eventlet.spawn(self.beat)
+        watchdog = patcher.original("threading").Thread(target=self.watch, name="stall-watchdog")
+        watchdog.daemon = True
+        watchdog.start()
+
+    def beat(self):
+        while True:
+            expected = time.time() + self.interval
+            eventlet.sleep(self.interval)
+            now = time.time()
+            lag = max(0, now - expected)
+            self.lags.append(lag)
+            self.lastBeat = now
+            if self.currentStall is not None:
+                self.currentStall["duration"] = round(lag * 1000, 1)
+                self.currentStall = None
+
+    def watch(self):
+        sleep = patcher.original("time").sleep
+        while True:
+            sleep(self.interval)
+            try:
+                self.check()
+            except Exception:
+                traceback.print_exc()
+
+    def check(self):
+        lastBeat = self.lastBeat
+        if time.time() - lastBeat - self.interval <= self.threshold or self.stalledSince == lastBeat:
+            return
+        # one stack per stall, taken while the hub is still blocked
+        self.stalledSince = lastBeat
+        frame = sys._current_frames().get(self.hubThreadId)
+        stall = {
+            "at": datetime.datetime.fromtimestamp(lastBeat + self.interval).isoformat(),
+            "duration": None,
+            "stack": traceback.format_stack(frame) if frame is not None else []
+        }
+        self.stalls.append(stall)
+        self.currentStall = stall
+
+    def percentiles(self):
+        if not len(self.lags):
+            return { "p50": 0, "p90": 0, "p99": 0, "max": 0 }
+        lags = np.asarray(self.lags) * 1000
+        p50, p90, p99 = np.percentile(lags, [50, 90, 99])
+        return { "p50": round(p50, 1), "p90": round(p90, 1), "p99": round(p99, 1), "max": round(lags.max(), 1) }
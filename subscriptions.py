@@ -1,24 +1,57 @@
 import eventlet
 import traceback
 import time
+from collections import OrderedDict
 
-from bloomberg.utils import openBloombergSession
+from bloomberg.fields import typedValue
+from frames import JSON_ROOM, BINARY_ROOM, encodeTickFrame
+from ticktable import TickTableFullException
+from sessions import SessionUnavailableException
 from utils import handleBrokenSession
 
-def extractFieldValues(message):
+# how often ticks held back for throttled clients are checked
+THROTTLE_RESOLUTION = 0.1
+
+def extractFieldValues(message, fieldNames=None):
+    d = {}
+    for name, kind, each in elementsOf(message, fieldNames):
+        try:
+            d[name] = each.getValueAsString()
+        except Exception as e:
+            traceback.print_exc()
+    return d
+
+def extractTypedFieldValues(message, fieldNames=None):
     d = {}
-    for each in message.asElement().elements():
-        if each.numValues() > 0:
-            try:
-                d[str(each.name())] = each.getValueAsString()
-            except Exception as e:
-                traceback.print_exc()
+    for name, kind, each in elementsOf(message, fieldNames):
+        try:
+            d[name] = typedValue(each, kind)
+        except Exception as e:
+            traceback.print_exc()
     return d
 
+def elementsOf(message, fieldNames):
+    element = message.asElement()
+    if fieldNames is None:
+        for each in element.elements():
+            if each.numValues() > 0:
+                yield str(each.name()), None, each
+    else:
+        for fieldName, name, kind in fieldNames:
+            if element.hasElement(fieldName):
+                each = element.getElement(fieldName)
+                if each.numValues() > 0:
+                    yield name, kind, each
+
 class SubscriptionEventHandler(object):
     def __init__(self, app, socketio):
         self.app = app
         self.socketio = socketio
+        self.securitiesNotInTickTable = set()
+        self.fieldNames = {}
+        # ticks for clients that asked for a slower interval than Bloomberg sends, latest values win
+        self.pendingValues = {}
+        self.lastSent = {}
 
     def getTimeStamp(self):
         return time.strftime("%Y/%m/%d %X")
@@ -33,47 +66,156 @@ class SubscriptionEventHandler(object):
                 print("SubscriptionFailure: " + str({ 'security': security, 'description': str(msg) }))
         return True
 
+    def fieldNamesFor(self, security):
+        # blpapi.Name lookups are prepared once per subscription, not once per tick
+        fields = self.app.allSubscriptions.get(security)
+        if fields is None:
+            return None
+        cached = self.fieldNames.get(security)
+        if cached is None or cached[0] is not fields:
+            names = sorted(set(field.upper() for field in fields))
+            cached = (fields, [(blpapi.Name(name), name, self.app.fieldSchema.kindOf(name)) for name in names])
+            self.fieldNames[security] = cached
+        return cached[1]
+
     def processSubscriptionDataEvent(self, event):
         timeStamp = self.getTimeStamp()
+        encodeBinary = self.app.binaryClients > 0
         messages = []
+        typedMessages = []
         for msg in event:
             security = msg.correlationIds()[0].value()
+            fieldNames = self.fieldNamesFor(security)
+            values = extractFieldValues(msg, fieldNames)
             messages.append({
                 "type": "SUBSCRIPTION_DATA",
                 "security": security,
-                "values": extractFieldValues(msg)
+                "values": values
             })
+            if encodeBinary:
+                typedMessages.append((security, extractTypedFieldValues(msg, fieldNames)))
+            if self.app.tickTable is not None:
+                self.publishToTickTable(security, values)
             if len(messages) > 10:
-                self.socketio.emit("action", messages, namespace="/")
-                self.socketio.sleep(5 / 1000)
+                self.emitMessages(messages, typedMessages)
                 messages = []
+                typedMessages = []
         if len(messages):
-            self.socketio.emit("action", messages, namespace="/")
-            self.socketio.sleep(5 / 1000)
+            self.emitMessages(messages, typedMessages)
         return True
 
+    def emitMessages(self, messages, typedMessages):
+        # binary clients get every field in the frames, client= only filters JSON ticks
+        clients = dict((client, subscriptions) for client, subscriptions in self.app.clientSubscriptions.items()
+            if not client in self.app.binarySockets)
+        # clients are left out of the broadcast only for the securities they get filtered
+        broadcasts = OrderedDict()
+        for message in messages:
+            filtering = tuple(sorted(client for client, subscriptions in clients.items() if message["security"] in subscriptions))
+            broadcasts.setdefault(filtering, []).append(message)
+        for filtering, broadcast in broadcasts.items():
+            self.socketio.emit("action", broadcast, namespace="/", room=JSON_ROOM, skip_sid=list(filtering) or None)
+        now = time.time()
+        for client, subscriptions in list(clients.items()):
+            clientMessages = []
+            for message in messages:
+                security = message["security"]
+                fields = subscriptions.get(security)
+                if fields:
+                    values = message["values"]
+                    values = dict((field, values[field]) for field in fields if field in values)
+                    interval = self.clientInterval(client, security)
+                    if interval is not None:
+                        key = (client, security)
+                        if key in self.pendingValues or now - self.lastSent.get(key, 0) < interval:
+                            self.pendingValues.setdefault(key, {}).update(values)
+                            continue
+                        self.lastSent[key] = now
+                    clientMessages.append({
+                        "type": "SUBSCRIPTION_DATA",
+                        "security": security,
+                        "values": values
+                    })
+            if len(clientMessages):
+                self.socketio.emit("action", clientMessages, namespace="/", room=client)
+        if len(typedMessages):
+            frame, newEntries = encodeTickFrame(self.app.tickDictionary, typedMessages)
+            if newEntries is not None:
+                self.socketio.emit("tickDictionary", newEntries, namespace="/", room=BINARY_ROOM)
+            self.socketio.emit("ticks", frame, namespace="/", room=BINARY_ROOM)
+        self.socketio.sleep(5 / 1000)
+
+    def clientInterval(self, client, security):
+        # only clients slower than the interval Bloomberg was subscribed at need throttling
+        interval = self.app.clientIntervals.get(client, {}).get(security)
+        subscribedInterval = self.app.subscribedIntervals.get(security)
+        if interval is None or subscribedInterval is None or interval <= subscribedInterval:
+            return None
+        return interval
+
+    def flushThrottled(self):
+        now = time.time()
+        messagesForClients = {}
+        for key in list(self.lastSent):
+            if not key[0] in self.app.clientSubscriptions:
+                del self.lastSent[key]
+                self.pendingValues.pop(key, None)
+        for (client, security), values in list(self.pendingValues.items()):
+            interval = self.clientInterval(client, security) or 0
+            if now - self.lastSent.get((client, security), 0) >= interval:
+                del self.pendingValues[(client, security)]
+                self.lastSent[(client, security)] = now
+                messagesForClients.setdefault(client, []).append({
+                    "type": "SUBSCRIPTION_DATA",
+                    "security": security,
+                    "values": values
+                })
+        for client, clientMessages in messagesForClients.items():
+            self.socketio.emit("action", clientMessages, namespace="/", room=client)
+
+    def publishToTickTable(self, security, values):
+        try:
+            self.app.tickTable.publish(security, values)
+        except TickTableFullException as e:
+            if not security in self.securitiesNotInTickTable:
+                self.securitiesNotInTickTable.add(security)
+                print(str(e))
+
     def processEvent(self, event, session):
         try:
             if event.eventType() == blpapi.Event.SUBSCRIPTION_DATA:
                 return self.processSubscriptionDataEvent(event)
             elif event.eventType() == blpapi.Event.SUBSCRIPTION_STATUS:
                 return self.processSubscriptionStatus(event)
+            elif event.eventType() in (blpapi.Event.SESSION_STATUS, blpapi.Event.SERVICE_STATUS):
+                self.app.sessions.processStatusEvent(event, session)
+                return True
             else:
                 return True
         except blpapi.Exception as e:
             traceback.print_exc()
         return False
 
+def flushThrottledClients(eventHandler, socketio):
+    while True:
+        try:
+            eventHandler.flushThrottled()
+        except Exception:
+            traceback.print_exc()
+        socketio.sleep(THROTTLE_RESOLUTION)
+
 def handleSubscriptions(app, socketio):
     eventHandler = SubscriptionEventHandler(app, socketio)
+    eventlet.spawn(flushThrottledClients, eventHandler, socketio)
     while True:
         try:
-            if app.sessionForSubscriptions is None:
-                app.sessionForSubscriptions = openBloombergSession()
-                app.allSubscriptions = {}
+            app.sessions.ensureSessions(forRequests=False)
 
             event = app.sessionForSubscriptions.nextEvent(500)
             eventHandler.processEvent(event, app.sessionForSubscriptions)
+        except SessionUnavailableException:
+            # the session manager is already probing for Bloomberg to come back
+            socketio.sleep(1)
         except Exception as e:
             traceback.print_exc()
             handleBrokenSession(app, e)
@@ -1,6 +1,6 @@
 import datetime
 
-from bloomberg.extract import extractIntradaySecurityPricing, extractErrors
+from bloomberg.extract import extractIntradaySecurityPricing, extractIntradayTicks, extractErrors
 from blpapi_simulator.simulator.message import Message, Map, List, Element
 
 def test_simple():
@@ -25,3 +25,29 @@ def test_simple():
     assert response["values"][0]["high"] == "4"
     assert response["values"][0]["low"] == "3"
 
+
+def test_ticks():
+    message = Message({
+        "tickData":
+            Map({
+                "tickData": List([
+                    Map({
+                        "time": Element("2017-11-01T10:00:00.000"),
+                        "type": Element("TRADE"),
+                        "value": Element(4.5),
+                        "size": Element(100)
+                    }),
+                    Map({
+                        "time": Element("2017-11-01T10:00:01.000"),
+                        "type": Element("TRADE"),
+                        "value": Element(4.75),
+                        "size": Element(200)
+                    })
+                ])
+            })
+    })
+    columns = extractIntradayTicks(message)
+    assert columns["type"] == ["TRADE", "TRADE"]
+    assert columns["value"] == [4.5, 4.75]
+    assert columns["size"] == [100, 200]
+    assert not "conditionCodes" in columns
@@ -67,3 +67,20 @@ def test_response_error_no_subcategory():
     assert len(response) == 0
     assert len(errors) == 1
     assert errors[0] == "CATEGORY/None MESSAGE"
+
+def test_bulk_field_is_a_table():
+    message = Message({
+        "securityData": List([Map({
+            "security": "SPX Index",
+            "fieldData": Map({
+                "INDX_MEMBERS": List([
+                    Map({ "Member Ticker and Exchange Code": "AAPL UW" }),
+                    Map({ "Member Ticker and Exchange Code": "MSFT UW" })
+                ])
+            })
+        })])
+    })
+    response = extractReferenceSecurityPricing(message)
+    value = response[0]["fields"][0]["value"]
+    assert value["columns"] == ["Member Ticker and Exchange Code"]
+    assert value["rows"] == [["AAPL UW"], ["MSFT UW"]]
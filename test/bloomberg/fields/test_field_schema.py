@@ -0,0 +1,40 @@
+from bloomberg.fields import FieldSchema, kindOf, NUMBER, INTEGER, DATE, BULK, STRING
+
+def test_kind_of():
+    assert kindOf("Float64", "Price") == NUMBER
+    assert kindOf("Int64", "Integer") == INTEGER
+    assert kindOf("Date", "Date") == DATE
+    assert kindOf("Sequence", "Bulk Format") == BULK
+    assert kindOf("String", "Character") == STRING
+    assert kindOf("Unknown", "Unknown") == STRING
+
+def test_known_fields_are_not_looked_up():
+    schema = FieldSchema()
+    schema.kinds = { "PX_LAST": NUMBER }
+    assert schema.kindsFor(None, None, ["px_last"]) == { "px_last": NUMBER }
+
+def test_persisted_schema(tmpdir):
+    path = str(tmpdir.join("fields.json"))
+    schema = FieldSchema(path)
+    schema.kinds = { "PX_LAST": NUMBER }
+    schema.save()
+    assert FieldSchema(path).kindOf("PX_LAST") == NUMBER
+
+class UnavailableSessions(object):
+    def __init__(self):
+        self.asked = []
+
+    def service(self, session, serviceName):
+        self.asked.append((session, serviceName))
+        raise Exception("Failed to open " + serviceName)
+
+def test_failed_lookups_are_strings_until_restart(tmpdir):
+    path = str(tmpdir.join("fields.json"))
+    schema = FieldSchema(path)
+    sessions = UnavailableSessions()
+    assert schema.kindsFor(sessions, "requests", ["px_last"]) == { "px_last": STRING }
+    assert schema.kindsFor(sessions, "requests", ["px_last"]) == { "px_last": STRING }
+    assert sessions.asked == [("requests", "//blp/apiflds")]
+    schema.kinds["BID"] = NUMBER
+    schema.save()
+    assert FieldSchema(path).kinds == { "BID": NUMBER }
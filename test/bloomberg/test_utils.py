@@ -0,0 +1,42 @@
+import eventlet
+
+import bloomberg.utils
+from bloomberg.utils import sendAndWait
+
+class Message(object):
+    def messageType(self):
+        return "ReferenceDataResponse"
+
+class Event(object):
+    RESPONSE = 5
+
+    def eventType(self):
+        return Event.RESPONSE
+
+    def __iter__(self):
+        return iter([Message()])
+
+class EventQueue(object):
+    def __init__(self):
+        self.polls = 0
+
+    def tryNextEvent(self):
+        # the response arrives after a few polls, as it would from Bloomberg
+        self.polls += 1
+        return Event() if self.polls > 3 else None
+
+class Session(object):
+    def sendRequest(self, request, eventQueue):
+        pass
+
+class blpapi(object):
+    Event = Event
+    EventQueue = EventQueue
+
+def test_waiting_for_a_response_lets_other_green_threads_run():
+    bloomberg.utils.__dict__["blpapi"] = blpapi
+    ran = []
+    other = eventlet.spawn(ran.append, True)
+    assert len(sendAndWait(Session(), None)) == 1
+    assert ran == [True]
+    other.wait()
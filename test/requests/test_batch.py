@@ -0,0 +1,52 @@
+import eventlet
+import json
+import pytest
+
+from server import app as my_app, wireUpBlpapiImplementation
+from requests import dev
+
+@pytest.fixture(scope="session")
+def app():
+    wireUpBlpapiImplementation(eventlet.import_patched("blpapi_simulator"))
+    my_app.register_blueprint(dev.blueprint, url_prefix='/dev')
+    app = my_app.test_client()
+    app.testing = True 
+    return app
+
+QUERIES = [
+    { "id": "latest", "type": "latest", "security": ["TEST"], "field": ["TEST"] },
+    { "id": "historical", "type": "historical", "security": ["TEST"], "field": ["TEST"], "startDate": "20151221", "endDate": "20161218" }
+]
+
+def test_batch():
+    result = app().post("/batch", data=json.dumps({ "queries": QUERIES }))
+    assert result.status_code == 200
+    responses = json.loads(result.data.decode())["responses"]
+    assert [each["id"] for each in responses] == ["latest", "historical"]
+    assert all(each["status"] == 200 for each in responses)
+
+def test_batch_stream():
+    result = app().post("/batch", data=json.dumps({ "queries": QUERIES, "stream": True }))
+    assert result.status_code == 200
+    lines = result.data.decode().splitlines()
+    assert sorted(json.loads(line)["id"] for line in lines) == ["historical", "latest"]
+
+def test_unknown_query_type():
+    assert app().post("/batch", data=json.dumps({ "queries": [{ "type": "TEST" }] })).status_code == 400
+
+def test_preflight_allows_json_posts():
+    result = app().options("/batch", headers={ "Origin": "http://localhost:8080" })
+    assert "POST" in result.headers["Access-Control-Allow-Methods"]
+    assert result.headers["Access-Control-Allow-Headers"] == "Content-Type"
+
+def test_negative_max_points():
+    assert app().post("/batch", data=json.dumps({ "queries": [dict(QUERIES[1], maxPoints=-1)] })).status_code == 400
+
+def test_unknown_periodicity():
+    assert app().post("/batch", data=json.dumps({ "queries": [dict(QUERIES[1], periodicity="HOURLY")] })).status_code == 400
+
+def test_weekly_historical():
+    query = dict(QUERIES[1], startDate="20150101", endDate="20150131", periodicity="WEEKLY", aggregation=["TEST:max"])
+    result = app().post("/batch", data=json.dumps({ "queries": [query] }))
+    assert result.status_code == 200
+    assert json.loads(result.data.decode())["responses"][0]["status"] == 200
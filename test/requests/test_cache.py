@@ -0,0 +1,95 @@
+import datetime
+
+from requests.cache import DailyBarCache, IntradayBarCache, ResponseCache
+
+def test_immutable_entry():
+    cache = ResponseCache()
+    cache.put("key", b"payload", '"etag"')
+    entry = cache.get("key")
+    assert entry.payload == b"payload"
+    assert entry.etag == '"etag"'
+    assert entry.isImmutable()
+
+def test_expired_entry():
+    cache = ResponseCache()
+    cache.put("key", b"payload", '"etag"', ttl=-1)
+    assert cache.get("key") is None
+
+def test_size_based_eviction():
+    cache = ResponseCache(maxBytes=10)
+    cache.put("a", b"12345", '"a"')
+    cache.put("b", b"12345", '"b"')
+    cache.get("a")
+    cache.put("c", b"12345", '"c"')
+    assert cache.get("a") is not None
+    assert cache.get("b") is None
+    assert cache.get("c") is not None
+    assert cache.totalBytes == 10
+
+def test_oversized_entry_is_not_kept():
+    cache = ResponseCache(maxBytes=4)
+    cache.put("a", b"12345", '"a"')
+    assert cache.get("a") is None
+
+def test_disk_tier(tmpdir):
+    cache = ResponseCache(directory=str(tmpdir))
+    cache.put("immutable", b"payload", '"etag"')
+    cache.put("live", b"payload", '"etag"', ttl=60)
+    restarted = ResponseCache(directory=str(tmpdir))
+    assert restarted.get("immutable").payload == b"payload"
+    assert restarted.get("live") is None
+
+def test_disk_eviction(tmpdir):
+    cache = ResponseCache(directory=str(tmpdir), maxDiskBytes=400)
+    for key in ["a", "b", "c", "d", "e"]:
+        cache.put(key, b"x" * 100, '"etag"')
+    assert cache.totalDiskBytes <= 400
+    assert len(tmpdir.listdir()) == len(cache.diskEntries)
+
+def test_daily_bar_cache_missing_ranges():
+    cache = DailyBarCache()
+    cache.store("A", "PX_LAST", datetime.date(2020, 1, 5), datetime.date(2020, 1, 10), { datetime.date(2020, 1, 6).toordinal(): 1.0 })
+    missing = cache.missingRanges("A", "PX_LAST", datetime.date(2020, 1, 1), datetime.date(2020, 1, 20))
+    assert missing == [
+        (datetime.date(2020, 1, 1), datetime.date(2020, 1, 4)),
+        (datetime.date(2020, 1, 11), datetime.date(2020, 1, 20))
+    ]
+    assert cache.missingRanges("A", "PX_LAST", datetime.date(2020, 1, 6), datetime.date(2020, 1, 9)) == []
+
+def test_daily_bar_cache_merges_coverage():
+    cache = DailyBarCache()
+    cache.store("A", "PX_LAST", datetime.date(2020, 1, 1), datetime.date(2020, 1, 5), {})
+    cache.store("A", "PX_LAST", datetime.date(2020, 1, 6), datetime.date(2020, 1, 9), {})
+    assert cache.series[("A", "PX_LAST")][0] == [(datetime.date(2020, 1, 1).toordinal(), datetime.date(2020, 1, 9).toordinal())]
+
+def test_daily_bar_cache_eviction():
+    cache = DailyBarCache(maxSeries=1)
+    cache.store("A", "PX_LAST", datetime.date(2020, 1, 1), datetime.date(2020, 1, 5), {})
+    cache.store("B", "PX_LAST", datetime.date(2020, 1, 1), datetime.date(2020, 1, 5), {})
+    assert cache.values("A", "PX_LAST", datetime.date(2020, 1, 1), datetime.date(2020, 1, 5)) == {}
+    assert len(cache.missingRanges("A", "PX_LAST", datetime.date(2020, 1, 1), datetime.date(2020, 1, 5))) == 1
+
+def test_intraday_bar_cache_spans_midnight():
+    cache = IntradayBarCache()
+    cache.store("A", "TRADE", 1430, 1439, { 1435: (1, 1, 1, 1, 1, 1) })
+    cache.store("A", "TRADE", 1450, 1460, {})
+    assert cache.missingRanges("A", "TRADE", 1420, 1470) == [(1420, 1429), (1440, 1449), (1461, 1470)]
+    assert cache.missingRanges("A", "TRADE", 1420, 1445) == [(1420, 1429), (1440, 1445)]
+    assert cache.bars("A", "TRADE", 1400, 1500) == { 1435: (1, 1, 1, 1, 1, 1) }
+    assert len(cache.days) == 2
+
+def test_intraday_bar_cache_joins_gaps_over_midnight():
+    cache = IntradayBarCache()
+    assert cache.missingRanges("A", "TRADE", 1430, 1450) == [(1430, 1450)]
+
+def test_stale_entry():
+    cache = ResponseCache()
+    cache.put("key", b"payload", '"etag"', ttl=-1)
+    assert cache.get("key", stale=True).payload == b"payload"
+    assert cache.get("key") is None
+
+def test_expired_entry_is_still_there_when_served_stale():
+    cache = ResponseCache()
+    cache.put("key", b"payload", '"etag"', ttl=-1)
+    assert cache.get("key") is None
+    assert cache.get("key", stale=True).payload == b"payload"
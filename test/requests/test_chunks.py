@@ -0,0 +1,41 @@
+from flask import Flask, current_app
+
+from requests.utils import runChunks, scheduledResponses, splitIntoChunks, splitIntoDateWindows
+from scheduler import INTERACTIVE, Scheduler
+
+def test_small_requests_are_not_split():
+    assert splitIntoChunks(["A", "B"], 2) == [["A", "B"]]
+    assert splitIntoDateWindows("20170101", "20170110", 10) == [("20170101", "20170110")]
+
+def test_split_securities():
+    assert splitIntoChunks(["A", "B", "C"], 2) == [["A", "B"], ["C"]]
+
+def test_split_date_range():
+    assert splitIntoDateWindows("20161225", "20170105", 7) == [("20161225", "20161231"), ("20170101", "20170105")]
+
+def test_relative_dates_are_not_split():
+    assert splitIntoDateWindows("-1CY", "20170105", 7) == [("-1CY", "20170105")]
+
+def test_chunks_run_in_the_application_context():
+    app = Flask(__name__)
+    app.config["CONCURRENT_CHUNKS"] = 2
+    app.scheduler = Scheduler()
+    with app.test_request_context("/"):
+        assert runChunks(lambda security: (current_app.name, security), [("A",), ("B",), ("C",)]) == [(app.name, "A"), (app.name, "B"), (app.name, "C")]
+
+def test_streams_hold_no_slot_while_the_client_reads():
+    app = Flask(__name__)
+    app.scheduler = Scheduler({ INTERACTIVE: 1 })
+    running = []
+
+    def responses():
+        for response in ["first", "second"]:
+            running.append(app.scheduler.metrics()[INTERACTIVE]["running"])
+            yield response
+
+    with app.test_request_context("/"):
+        stream = scheduledResponses(responses())
+        assert next(stream) == "first"
+        assert app.scheduler.metrics()[INTERACTIVE]["running"] == 0
+        assert list(stream) == ["second"]
+    assert running == [1, 1]
@@ -32,3 +32,16 @@ def test_break_session():
     assert app().get("/historical?security=TEST&field=TEST&startDate=20151221&endDate=20161218").status_code == 500
     assert app().get("/historical?security=TEST&field=TEST&startDate=20151221&endDate=20161218").status_code == 200
 
+
+def test_immutable_range_is_cached():
+    first = app().get("/historical?security=TEST&field=TEST&startDate=20151221&endDate=20161218")
+    assert first.status_code == 200
+    assert "immutable" in first.headers["Cache-Control"]
+    second = app().get("/historical?security=TEST&field=TEST&startDate=20151221&endDate=20161218")
+    assert second.data == first.data
+    revalidated = app().get("/historical?security=TEST&field=TEST&startDate=20151221&endDate=20161218",
+                            headers={"If-None-Match": first.headers["Etag"]})
+    assert revalidated.status_code == 304
+
+def test_negative_max_points():
+    assert app().get("/historical?security=TEST&field=TEST&startDate=20151221&endDate=20161218&maxPoints=-1").status_code == 400
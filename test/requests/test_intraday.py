@@ -0,0 +1,26 @@
+import eventlet
+import json
+import pytest
+
+from server import app as my_app, wireUpBlpapiImplementation
+from requests import dev
+
+@pytest.fixture(scope="session")
+def app():
+    wireUpBlpapiImplementation(eventlet.import_patched("blpapi_simulator"))
+    my_app.register_blueprint(dev.blueprint, url_prefix='/dev')
+    app = my_app.test_client()
+    app.testing = True 
+    return app
+
+def test_intraday():
+    assert app().get("/intraday?security=TEST&eventType=TRADE&startDateTime=2016-12-19T10:00:00&endDateTime=2016-12-19T11:00:00").status_code == 200
+
+def test_intraday_for_several_securities():
+    result = app().get("/intraday?security=TEST&security=OTHER&eventType=TRADE&eventType=BID&startDateTime=2016-12-19T10:00:00&endDateTime=2016-12-19T11:00:00")
+    assert result.status_code == 200
+    series = json.loads(result.data.decode())["response"]
+    assert [(each["security"], each["eventType"]) for each in series] == [("TEST", "TRADE"), ("TEST", "BID"), ("OTHER", "TRADE"), ("OTHER", "BID")]
+
+def test_negative_max_points():
+    assert app().get("/intraday?security=TEST&eventType=TRADE&startDateTime=2016-12-19T10:00:00&endDateTime=2016-12-19T11:00:00&maxPoints=-1").status_code == 400
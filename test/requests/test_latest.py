@@ -33,3 +33,10 @@ def test_break_session():
     assert app().get("/latest?security=TEST&field=TEST").status_code == 500
     assert app().get("/latest?security=TEST&field=TEST").status_code == 200
 
+
+def test_unchanged_result_is_not_modified():
+    first = app().get("/latest?security=TEST&field=TEST")
+    assert first.status_code == 200
+    second = app().get("/latest?security=TEST&field=TEST", headers={"If-None-Match": first.headers["Etag"]})
+    assert second.status_code == 304
+    assert second.data == b""
@@ -26,3 +26,17 @@ def test_reset_session():
     assert app().get("/dev/subscriptions/session/reset").status_code == 200
     assert app().get("/subscribe?security=TEST&field=TEST").status_code == 202
 
+
+def test_subscribe_for_client():
+    assert app().get("/subscribe?security=TEST&field=TEST&client=CLIENT").status_code == 202
+    assert my_app.clientSubscriptions["CLIENT"]["TEST"] == ("TEST",)
+
+def test_subscribe_at_fastest_interval():
+    assert app().get("/subscribe?security=INTERVAL&field=TEST&interval=5.0&client=SLOW").status_code == 202
+    assert app().get("/subscribe?security=INTERVAL&field=TEST&interval=1.0&client=FAST").status_code == 202
+    assert min(my_app.subscriptionIntervals["INTERVAL"].values()) == 1.0
+    assert my_app.subscribedIntervals["INTERVAL"] == 1.0
+    assert my_app.clientIntervals["SLOW"]["INTERVAL"] == 5.0
+
+def test_subscribe_with_invalid_interval():
+    assert app().get("/subscribe?security=TEST&field=TEST&interval=fast").status_code == 400
@@ -0,0 +1,116 @@
+import eventlet
+from eventlet.event import Event
+
+from bus import LocalBus, Remote, TcpBroker, TcpBus, parseBusUrl
+from engine import INTENTS, TICKS, Engine, EngineBroadcaster, EngineClient
+
+class App(object):
+    def __init__(self):
+        self.allSubscriptions = {}
+        self.clientSubscriptions = {}
+        self.clientIntervals = {}
+        self.binaryClients = 0
+        self.sessions = self
+        self.tickDictionary = self
+
+    def ensureSessions(self, forRequests=True):
+        pass
+
+    def app_context(self):
+        return self
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *args):
+        pass
+
+    def snapshot(self):
+        return {}
+
+    def update(self, entries):
+        pass
+
+class SocketIO(object):
+    def __init__(self):
+        self.emitted = []
+
+    def emit(self, event, data, **kwargs):
+        self.emitted.append((event, data, kwargs))
+
+    def start_background_task(self, target):
+        pass
+
+def connect(bus):
+    primaryApp, edgeApp, socketio = App(), App(), SocketIO()
+    broadcaster = EngineBroadcaster(bus)
+
+    def subscribe(securities, fields, interval, client):
+        primaryApp.allSubscriptions.update((security, fields) for security in securities)
+
+    Engine(primaryApp, bus, broadcaster, { "subscribe": subscribe }).start()
+    edge = EngineClient(edgeApp, socketio, bus)
+    edge.start()
+    return primaryApp, edgeApp, socketio, broadcaster, edge
+
+def test_ticks_reach_the_edges_and_intents_the_primary():
+    primaryApp, edgeApp, socketio, broadcaster, edge = connect(LocalBus())
+    edge.call("subscribe", ["IBM US Equity"], ["PX_LAST"], None, "client")
+    assert primaryApp.allSubscriptions == { "IBM US Equity": ["PX_LAST"] }
+    assert edgeApp.allSubscriptions == { "IBM US Equity": ["PX_LAST"] }
+    broadcaster.emit("action", [{ "security": "IBM US Equity" }], room="client")
+    assert socketio.emitted == [("action", [{ "security": "IBM US Equity" }], { "room": "client" })]
+
+def test_binary_clients_add_up_over_the_edges():
+    primaryApp, edgeApp, socketio, broadcaster, edge = connect(LocalBus())
+    edge.setBinaryClients(3)
+    EngineClient(App(), SocketIO(), broadcaster.bus).setBinaryClients(2)
+    assert primaryApp.binaryClients == 5
+
+def test_frames_cross_a_tcp_broker():
+    broker = TcpBroker("127.0.0.1", 0)
+    broker.start()
+    port = broker.server.getsockname()[1]
+    bus = TcpBus("127.0.0.1", port)
+    received = []
+    bus.subscribe(TICKS, received.append)
+    broker.subscribe(INTENTS, lambda frame: broker.publish(TICKS, ["echo", frame]))
+    bus.start()
+    while not bus.isConnected():
+        eventlet.sleep(0.01)
+    bus.publish(INTENTS, "hello")
+    with eventlet.Timeout(5):
+        while not received:
+            eventlet.sleep(0.01)
+    assert received == [["echo", "hello"]]
+
+def test_bus_urls():
+    assert parseBusUrl("tcp://10.0.0.1:6660") == ("10.0.0.1", 6660)
+
+class StalledStream(object):
+    def __init__(self):
+        self.connection = self
+        self.shutDown = False
+
+    def send(self, frame):
+        # like a remote that stopped reading, with the TCP send buffer full
+        Event().wait()
+
+    def shutdown(self, how):
+        self.shutDown = True
+
+def test_stalled_remotes_are_disconnected_without_blocking_the_publisher():
+    broker = TcpBroker("127.0.0.1", 0)
+    stream = StalledStream()
+    remote = Remote(stream, maxPendingFrames=2)
+    broker.remotes[TICKS] = set([remote])
+    received = []
+    broker.subscribe(TICKS, received.append)
+    with eventlet.Timeout(5):
+        for index in range(5):
+            broker.publish(TICKS, index)
+            eventlet.sleep(0)
+    assert received == [0, 1, 2, 3, 4]
+    assert broker.remotes[TICKS] == set()
+    assert stream.shutDown
+    remote.writer.kill()
@@ -0,0 +1,43 @@
+import math
+import numpy as np
+import pytest
+from collections import OrderedDict
+
+from derive import deriveHistorical, deriveIntraday, parseHistoricalDerivations, parseIntradayDerivations, rollingVolatility
+
+def test_parse():
+    assert parseHistoricalDerivations(["volatility:px_last:20"]) == [("volatility:px_last:20", "volatility", ["PX_LAST", 20])]
+    assert parseIntradayDerivations(["vwap"]) == [("vwap", "vwap", [])]
+    with pytest.raises(ValueError):
+        parseHistoricalDerivations(["vwap"])
+    with pytest.raises(ValueError):
+        parseIntradayDerivations(["volatility:1"])
+
+def test_rolling_volatility():
+    values = np.array([1.0, 2.0, 1.0, 2.0, 4.0])
+    changes = np.diff(np.log(values))
+    expected = [np.std(changes[i:i + 3], ddof=1) for i in range(2)]
+    assert np.allclose(rollingVolatility(values, 3), expected)
+    assert len(rollingVolatility(values, 10)) == 0
+
+def test_historical_returns_and_spread():
+    series = OrderedDict([
+        (("A", "PX_LAST"), (["d1", "d2", "d3"], [1.0, 2.0, 3.0])),
+        (("B", "PX_LAST"), (["d2", "d3"], [1.5, 1.0]))
+    ])
+    derived = deriveHistorical(series, ["A"], parseHistoricalDerivations(["returns:PX_LAST", "spread:PX_LAST:A:B"]))
+    assert derived[("A", "returns:PX_LAST")] == (["d2", "d3"], [1.0, 0.5])
+    assert derived[("A - B", "spread:PX_LAST")] == (["d2", "d3"], [0.5, 2.0])
+    assert not ("B", "returns:PX_LAST") in derived
+
+def test_intraday_vwap():
+    bars = [(1, 3, 0, 3, 1, 10), (3, 6, 3, 6, 1, 0), (6, 9, 6, 9, 1, 30)]
+    derived = deriveIntraday(bars, parseIntradayDerivations(["vwap", "logReturns"]))
+    assert derived["vwap"] == [2.0, 2.0, 6.5]
+    assert derived["logReturns"][0] is None
+    assert abs(derived["logReturns"][1] - math.log(2)) < 1e-12
+
+def test_returns_over_a_zero_price_are_none():
+    series = OrderedDict([(("A", "PX_LAST"), (["d1", "d2", "d3"], [0.0, 2.0, 3.0]))])
+    derived = deriveHistorical(series, ["A"], parseHistoricalDerivations(["returns:PX_LAST"]))
+    assert derived[("A", "returns:PX_LAST")] == (["d2", "d3"], [None, 0.5])
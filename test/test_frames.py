@@ -0,0 +1,31 @@
+import datetime
+import json
+
+from frames import TickDictionary, encodeTickFrame, decodeTickFrame
+
+def test_round_trip():
+    dictionary = TickDictionary()
+    frame, newEntries = encodeTickFrame(dictionary, [
+        ("L Z7 Comdty", { "BID": 90.05, "BID_SIZE": 120, "IS_DELAYED_STREAM": False, "TRADING_DT": datetime.date(2017, 12, 20) })
+    ])
+    client = TickDictionary()
+    client.update(newEntries)
+    assert decodeTickFrame(client, frame) == [
+        ("L Z7 Comdty", { "BID": 90.05, "BID_SIZE": 120, "IS_DELAYED_STREAM": False, "TRADING_DT": "2017-12-20" })
+    ]
+
+def test_dictionary_entries_are_announced_once():
+    dictionary = TickDictionary()
+    _, newEntries = encodeTickFrame(dictionary, [("L Z7 Comdty", { "BID": 90.05 })])
+    assert newEntries == { "securities": { "L Z7 Comdty": 0 }, "fields": { "BID": 0 } }
+    _, newEntries = encodeTickFrame(dictionary, [("L Z7 Comdty", { "BID": 90.06 })])
+    assert newEntries is None
+    _, newEntries = encodeTickFrame(dictionary, [("L Z7 Comdty", { "BID": 90.06, "ASK": 90.07 })])
+    assert newEntries == { "securities": {}, "fields": { "ASK": 1 } }
+
+def test_frame_is_smaller_than_json():
+    values = { "BID": 90.05, "ASK": 90.06, "BID_SIZE": 120, "ASK_SIZE": 80 }
+    frame, _ = encodeTickFrame(TickDictionary(), [("L Z7 Comdty", values)])
+    message = json.dumps([{ "type": "SUBSCRIPTION_DATA", "security": "L Z7 Comdty",
+                            "values": dict((k, str(v)) for k, v in values.items()) }])
+    assert len(frame) * 2 < len(message)
@@ -0,0 +1,33 @@
+import json
+from flask import Flask, request
+
+from journal import Journal
+from timing import Timing
+
+app = Flask(__name__)
+
+def readLines(path):
+    with open(str(path)) as f:
+        return [json.loads(line) for line in f]
+
+def test_calls_are_appended_as_compact_lines(tmpdir):
+    path = tmpdir.join("journal.jsonl")
+    journal = Journal(str(path))
+    with app.test_request_context("/historical/?security=A&security=B&field=PX_LAST", method="GET"):
+        journal.record(request, 200, Timing(), "desk")
+    with app.test_request_context("/batch/", method="POST", data=json.dumps({ "queries": [] })):
+        journal.record(request, 200, Timing(), "desk")
+    journal.close()
+    first, second = readLines(path)
+    assert first["path"] == "/historical/"
+    assert first["args"] == { "security": ["A", "B"], "field": ["PX_LAST"] }
+    assert first["client"] == "desk"
+    assert second["body"] == { "queries": [] }
+
+def test_debug_calls_are_not_journaled(tmpdir):
+    path = tmpdir.join("journal.jsonl")
+    journal = Journal(str(path))
+    with app.test_request_context("/debug/slow", method="GET"):
+        journal.record(request, 200, Timing(), "desk")
+    journal.close()
+    assert readLines(path) == []
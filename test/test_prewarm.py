@@ -0,0 +1,84 @@
+import datetime
+
+from prewarm import AccessPatterns, Prewarmer, batchQueryFor, isWorthPrewarming, nextRunAfter, queryFor, queryShape
+
+TODAY = datetime.date(2024, 3, 14)
+
+def test_dates_are_kept_relative_to_today():
+    shape = queryShape("/historical/", [("security", "IBM US Equity"), ("startDate", "20240214"), ("endDate", "20240313")], TODAY)
+    assert shape == "/historical/?security=IBM+US+Equity&startDate=%40-29&endDate=%40-1"
+    assert queryFor(shape, datetime.date(2024, 3, 15)) == "/historical/?security=IBM+US+Equity&startDate=20240215&endDate=20240314"
+
+def test_date_times_keep_their_time_of_day():
+    shape = queryShape("/intraday/", [("startDateTime", "2024-03-13T14:30:00"), ("endDateTime", "2024-03-14T09:00:00")], TODAY)
+    assert queryFor(shape, datetime.date(2024, 3, 15)) == "/intraday/?startDateTime=2024-03-14T14%3A30%3A00&endDateTime=2024-03-15T09%3A00%3A00"
+
+def test_relative_bloomberg_dates_are_left_alone():
+    shape = queryShape("/historical/", [("startDate", "-1CY")], TODAY)
+    assert queryFor(shape, datetime.date(2024, 3, 15)) == "/historical/?startDate=-1CY"
+
+def test_most_frequent_first_and_old_ones_forgotten():
+    patterns = AccessPatterns()
+    patterns.record("/historical/", [("security", "A")], TODAY - datetime.timedelta(days=30))
+    patterns.record("/historical/", [("security", "B")], TODAY)
+    patterns.record("/historical/", [("security", "C")], TODAY)
+    patterns.record("/historical/", [("security", "C")], TODAY)
+    patterns.forget(TODAY)
+    assert patterns.mostFrequent() == ["/historical/?security=C", "/historical/?security=B"]
+
+def test_runs_skip_weekends():
+    friday = datetime.datetime(2024, 3, 15, 7, 0)
+    assert nextRunAfter(friday, "06:30") == datetime.datetime(2024, 3, 18, 6, 30)
+    assert nextRunAfter(friday, "08:00") == datetime.datetime(2024, 3, 15, 8, 0)
+
+def test_workers_add_up_their_counts_in_the_shared_file(tmpdir):
+    path = str(tmpdir.join("patterns.json"))
+    first, second = AccessPatterns(path), AccessPatterns(path)
+    today = datetime.date.today()
+    first.record("/historical/", [("security", "A")], today)
+    first.record("/historical/", [("security", "A")], today)
+    second.record("/historical/", [("security", "A")], today)
+    second.record("/historical/", [("security", "B")], today)
+    first.save()
+    second.save()
+    first.save()
+    shapes = AccessPatterns(path).shapes
+    assert shapes["/historical/?security=A"]["count"] == 3
+    assert shapes["/historical/?security=B"]["count"] == 1
+    assert second.shapes == shapes
+
+def test_daily_ranges_up_to_today_are_not_prewarmed():
+    today = datetime.date.today()
+    yesterday = (today - datetime.timedelta(days=1)).strftime("%Y%m%d")
+    assert not isWorthPrewarming(batchQueryFor("/historical/?security=A&field=PX_LAST&startDate=20240101&endDate=" + today.strftime("%Y%m%d")))
+    assert isWorthPrewarming(batchQueryFor("/historical/?security=A&field=PX_LAST&startDate=20240101&endDate=" + yesterday))
+    assert isWorthPrewarming(batchQueryFor("/historical/?security=A&field=PX_LAST&startDate=20240101&endDate=" + today.strftime("%Y%m%d") + "&periodicity=WEEKLY"))
+
+class Client(object):
+    def __init__(self):
+        self.queries = []
+
+    def get(self, query, headers):
+        self.queries.append(query)
+        return Response()
+
+class Response(object):
+    status_code = 200
+
+class App(object):
+    def __init__(self):
+        self.bloombergHits = {}
+        self.client = Client()
+
+    def test_client(self):
+        return self.client
+
+def test_queries_over_the_remaining_budget_are_skipped():
+    patterns = AccessPatterns()
+    yesterday = datetime.date.today() - datetime.timedelta(days=1)
+    for count, securities in [(3, ["A", "B", "C"]), (2, ["D"])]:
+        for _ in range(count):
+            patterns.record("/historical/", [("security", each) for each in securities] + [("field", "PX_LAST"), ("endDate", yesterday.strftime("%Y%m%d"))])
+    app = App()
+    Prewarmer(app, patterns, budget=2).prewarm()
+    assert [query.split("&field")[0] for query in app.client.queries] == ["/historical/?security=D"]
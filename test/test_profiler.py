@@ -0,0 +1,35 @@
+from eventlet import patcher
+from flask import Flask
+
+from profiler import SamplingProfiler
+from requests.debug import isAuthorized
+
+def busyFunction(profiler):
+    profiler.sample()
+    profiler.sample()
+
+def test_samples_are_collapsed_per_stack():
+    profiler = SamplingProfiler(patcher.original("_thread").get_ident())
+    busyFunction(profiler)
+    lines = profiler.collapsed().splitlines()
+    assert len(lines) == 1
+    stack, count = lines[0].rsplit(" ", 1)
+    assert count == "2"
+    assert stack.endswith("test_profiler.py:busyFunction;profiler.py:sample")
+    assert "test_profiler.py:test_samples_are_collapsed_per_stack" in stack.split(";")
+
+def test_profile_needs_a_configured_token():
+    app = Flask(__name__)
+    for token in [None, ""]:
+        app.config["PROFILER_TOKEN"] = token
+        with app.test_request_context("/debug/profile?token="):
+            assert not isAuthorized()
+    app.config["PROFILER_TOKEN"] = "secret"
+    with app.test_request_context("/debug/profile", headers={ "X-Profiler-Token": "secret" }):
+        assert isAuthorized()
+
+def test_profile_token_is_not_taken_from_the_url():
+    app = Flask(__name__)
+    app.config["PROFILER_TOKEN"] = "secret"
+    with app.test_request_context("/debug/profile?token=secret"):
+        assert not isAuthorized()
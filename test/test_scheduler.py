@@ -0,0 +1,53 @@
+import eventlet
+
+from scheduler import BULK, INTERACTIVE, Scheduler
+
+def runAll(scheduler, requests):
+    order = []
+
+    def run(priority, client, name):
+        with scheduler.slot(priority, client):
+            order.append(name)
+            eventlet.sleep(0.01)
+
+    threads = []
+    for priority, client, name in requests:
+        threads.append(eventlet.spawn(run, priority, client, name))
+        # queue them in this order
+        eventlet.sleep(0)
+    for thread in threads:
+        thread.wait()
+    return order
+
+def test_clients_take_turns():
+    scheduler = Scheduler({ BULK: 1 })
+    order = runAll(scheduler, [(BULK, "a", "a1"), (BULK, "a", "a2"), (BULK, "a", "a3"), (BULK, "b", "b1")])
+    assert order == ["a1", "b1", "a2", "a3"]
+
+def test_weights_give_a_larger_share():
+    scheduler = Scheduler({ BULK: 1 }, { "b": 2.0 })
+    order = runAll(scheduler, [(BULK, "a", "a1"), (BULK, "a", "a2"), (BULK, "a", "a3"), (BULK, "b", "b1"), (BULK, "b", "b2")])
+    assert order == ["a1", "b1", "b2", "a2", "a3"]
+
+def test_interactive_requests_do_not_wait_for_bulk_ones():
+    scheduler = Scheduler({ INTERACTIVE: 1, BULK: 1 })
+    order = runAll(scheduler, [(BULK, "a", "bulk1"), (BULK, "a", "bulk2"), (INTERACTIVE, "b", "interactive")])
+    assert order == ["bulk1", "interactive", "bulk2"]
+    assert scheduler.metrics()[BULK] == { "running": 0, "waiting": 0 }
+
+def test_cancelled_waiters_give_up_their_place():
+    scheduler = Scheduler({ BULK: 1 })
+    release = eventlet.event.Event()
+
+    def hold():
+        with scheduler.slot(BULK, "a"):
+            release.wait()
+
+    holder = eventlet.spawn(hold)
+    eventlet.sleep(0)
+    waiter = eventlet.spawn(lambda: scheduler.slot(BULK, "b").__enter__())
+    eventlet.sleep(0)
+    waiter.kill()
+    release.send()
+    holder.wait()
+    assert scheduler.metrics()[BULK] == { "running": 0, "waiting": 0 }
@@ -0,0 +1,17 @@
+from flask import Response
+
+from server import app, recordAccessPattern, workerCommands
+
+def test_every_worker_listens_on_a_port_of_its_own():
+    commands = workerCommands(["python", "server.py"], ["--simulator", "--workers", "2", "--port=7000", "--prewarm-budget", "100"], 2, 7000, 100)
+    assert commands == [
+        ["python", "server.py", "--simulator", "--role", "engine"],
+        ["python", "server.py", "--simulator", "--role", "worker", "--port", "7000", "--prewarm-budget", "50"],
+        ["python", "server.py", "--simulator", "--role", "worker", "--port", "7001", "--prewarm-budget", "50"]
+    ]
+
+def test_queries_are_recorded_with_or_without_the_trailing_slash():
+    for path in ["/historical?security=A", "/historical/?security=A"]:
+        with app.test_request_context(path):
+            recordAccessPattern(Response(""))
+    assert app.accessPatterns.shapes["/historical/?security=A"]["count"] == 2
@@ -0,0 +1,105 @@
+import pytest
+
+from sessions import CircuitBreaker, SessionManager, SessionUnavailableException
+
+class App(object):
+    def __init__(self):
+        self.sessionForRequests = None
+        self.sessionForSubscriptions = None
+        self.engine = None
+
+class Session(object):
+    def __init__(self):
+        self.opened = []
+
+    def openService(self, name):
+        self.opened.append(name)
+        return True
+
+    def getService(self, name):
+        return name
+
+class Message(object):
+    def __init__(self, messageType):
+        self.type = messageType
+
+    def messageType(self):
+        return self.type
+
+def test_service_is_opened_once():
+    manager = SessionManager(App())
+    session = Session()
+    assert manager.service(session, "//blp/refdata") == ("//blp/refdata", False)
+    assert manager.service(session, "//blp/refdata") == ("//blp/refdata", False)
+    assert session.opened == ["//blp/refdata"]
+
+def test_services_are_kept_per_session():
+    manager = SessionManager(App())
+    first, second = Session(), Session()
+    manager.service(first, "//blp/refdata")
+    manager.service(second, "//blp/refdata")
+    manager.invalidate(first)
+    manager.service(first, "//blp/refdata")
+    manager.service(second, "//blp/refdata")
+    assert first.opened == ["//blp/refdata", "//blp/refdata"]
+    assert second.opened == ["//blp/refdata"]
+
+def test_status_event_drops_services():
+    manager = SessionManager(App())
+    session = Session()
+    manager.service(session, "//blp/refdata")
+    manager.processStatusEvent([Message("SessionStarted")], session)
+    assert len(manager.services) == 1
+    manager.processStatusEvent([Message("SessionConnectionDown")], session)
+    assert len(manager.services) == 0
+
+def test_circuit_breaker_opens_after_repeated_failures():
+    breaker = CircuitBreaker(threshold=2)
+    breaker.recordFailure()
+    assert breaker.isClosed()
+    breaker.recordFailure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.openedAt is not None
+
+def test_circuit_breaker_half_open():
+    breaker = CircuitBreaker(threshold=2)
+    breaker.recordFailure()
+    breaker.recordFailure()
+    breaker.halfOpen()
+    breaker.recordFailure()
+    assert breaker.state == CircuitBreaker.OPEN
+    breaker.halfOpen()
+    breaker.recordSuccess()
+    assert breaker.isClosed()
+    assert breaker.failures == 0
+
+def test_open_circuit_fails_fast():
+    manager = SessionManager(App())
+    manager.breaker.recordFailure()
+    manager.breaker.recordFailure()
+    manager.prober = "running"
+    with pytest.raises(SessionUnavailableException):
+        manager.ensureSessions()
+
+class RestartingSession(Session):
+    def __init__(self):
+        Session.__init__(self)
+        self.restarted = False
+
+    def openService(self, name):
+        # the first attempt fails, and succeeds once the session was restarted
+        Session.openService(self, name)
+        return self.restarted
+
+    def stop(self):
+        pass
+
+    def start(self):
+        self.restarted = True
+
+def test_restart_in_the_background_is_reported_to_the_next_caller():
+    manager = SessionManager(App())
+    session = RestartingSession()
+    manager.openService(session, "//blp/mktdata")
+    assert manager.service(session, "//blp/mktdata") == ("//blp/mktdata", True)
+    assert manager.service(session, "//blp/mktdata") == ("//blp/mktdata", False)
@@ -0,0 +1,31 @@
+import time
+from eventlet import patcher
+
+from stalls import StallDetector
+
+def stalledDetector():
+    detector = StallDetector(threshold=0.05, interval=0.01)
+    detector.hubThreadId = patcher.original("_thread").get_ident()
+    detector.lastBeat = time.time() - 1
+    return detector
+
+def test_stall_captures_the_blocking_stack_once():
+    detector = stalledDetector()
+    detector.check()
+    detector.check()
+    assert len(detector.stalls) == 1
+    assert any("test_stall_captures_the_blocking_stack_once" in line for line in detector.stalls[0]["stack"])
+
+def test_no_stall_while_the_heartbeat_is_on_time():
+    detector = stalledDetector()
+    detector.lastBeat = time.time()
+    detector.check()
+    assert len(detector.stalls) == 0
+
+def test_percentiles_are_in_milliseconds():
+    detector = StallDetector()
+    assert detector.percentiles()["p99"] == 0
+    detector.lags.extend([0.001] * 99 + [0.5])
+    lag = detector.percentiles()
+    assert lag["p50"] == 1.0
+    assert lag["max"] == 500.0
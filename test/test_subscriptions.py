@@ -0,0 +1,84 @@
+from flask import Flask
+
+import subscriptions
+from requests.subscribe import forgetClient
+from subscriptions import SubscriptionEventHandler
+
+class App(object):
+    def __init__(self):
+        self.clientSubscriptions = {}
+        self.clientIntervals = {}
+        self.subscriptionIntervals = {}
+        self.subscribedIntervals = {}
+        self.binarySockets = set()
+
+class SocketIO(object):
+    def __init__(self):
+        self.emitted = []
+
+    def emit(self, event, data, **kwargs):
+        self.emitted.append((event, data, kwargs))
+
+    def sleep(self, seconds=0):
+        pass
+
+    def received(self, sid, room):
+        """
+        The securities and values of the "action" events a socket in room gets.
+        """
+        result = []
+        for event, data, kwargs in self.emitted:
+            if event == "action" and kwargs["room"] in (room, sid) and not sid in (kwargs.get("skip_sid") or []):
+                result.extend((message["security"], message["values"]) for message in data)
+        return result
+
+def tick(security, **values):
+    return { "type": "SUBSCRIPTION_DATA", "security": security, "values": values }
+
+def test_clients_are_only_left_out_of_the_securities_they_filter():
+    app, socketio = App(), SocketIO()
+    app.clientSubscriptions["filtered"] = { "A": ("BID",) }
+    SubscriptionEventHandler(app, socketio).emitMessages([tick("A", BID="1", ASK="2"), tick("B", BID="3")], [])
+    assert socketio.received("filtered", "json") == [("B", { "BID": "3" }), ("A", { "BID": "1" })]
+    assert socketio.received("other", "json") == [("A", { "BID": "1", "ASK": "2" }), ("B", { "BID": "3" })]
+
+def test_binary_clients_get_no_json_ticks():
+    app, socketio = App(), SocketIO()
+    app.clientSubscriptions["binary"] = { "A": ("BID",) }
+    app.binarySockets.add("binary")
+    SubscriptionEventHandler(app, socketio).emitMessages([tick("A", BID="1")], [])
+    assert socketio.received("binary", "binary") == []
+    assert socketio.received("other", "json") == [("A", { "BID": "1" })]
+
+def test_slow_clients_get_the_latest_values_at_their_interval(monkeypatch):
+    app, socketio = App(), SocketIO()
+    now = [1000.0]
+    monkeypatch.setattr(subscriptions.time, "time", lambda: now[0])
+    app.clientSubscriptions = { "slow": { "A": ("BID",) }, "fast": { "A": ("BID",) } }
+    app.clientIntervals = { "slow": { "A": 5.0 }, "fast": { "A": 1.0 } }
+    app.subscriptionIntervals = { "A": { "slow": 5.0, "fast": 1.0 } }
+    app.subscribedIntervals = { "A": 1.0 }
+    handler = SubscriptionEventHandler(app, socketio)
+    handler.emitMessages([tick("A", BID="1")], [])
+    now[0] += 1
+    handler.emitMessages([tick("A", BID="2")], [])
+    handler.emitMessages([tick("A", BID="3")], [])
+    handler.flushThrottled()
+    assert socketio.received("fast", "json") == [("A", { "BID": "1" }), ("A", { "BID": "2" }), ("A", { "BID": "3" })]
+    assert socketio.received("slow", "json") == [("A", { "BID": "1" })]
+    now[0] += 4
+    handler.flushThrottled()
+    assert socketio.received("slow", "json") == [("A", { "BID": "1" }), ("A", { "BID": "3" })]
+
+def test_remaining_clients_stay_throttled_after_the_fast_client_leaves():
+    app = Flask(__name__)
+    app.clientSubscriptions = { "slow": { "A": ("BID",) }, "fast": { "A": ("BID",) } }
+    app.clientIntervals = { "slow": { "A": 5.0 }, "fast": { "A": 1.0 } }
+    app.subscriptionIntervals = { "A": { "slow": 5.0, "fast": 1.0 } }
+    app.subscribedIntervals = { "A": 1.0 }
+    app.binarySockets = set()
+    with app.app_context():
+        forgetClient("fast")
+    assert app.subscriptionIntervals == { "A": { "slow": 5.0 } }
+    # nothing resubscribed, Bloomberg still sends every second
+    assert SubscriptionEventHandler(app, SocketIO()).clientInterval("slow", "A") == 5.0
@@ -0,0 +1,45 @@
+from ticktable import SEQUENCE, TickTable, TickTableReader, TickTableFullException
+
+import pytest
+
+def test_publish_and_read(tmpdir):
+    path = str(tmpdir.join("ticks"))
+    table = TickTable(path, maxSecurities=4, maxFields=4)
+    table.publish("L Z7 Comdty", { "BID": "90.05", "ASK": "90.10" })
+    reader = TickTableReader(path)
+    assert reader.get("L Z7 Comdty", "BID") == 90.05
+    assert reader.snapshot("L Z7 Comdty") == { "BID": 90.05, "ASK": 90.10 }
+    assert reader.get("L Z7 Comdty", "LAST") is None
+    assert reader.get("L Z6 Comdty", "BID") is None
+
+def test_reader_sees_new_securities_and_updates(tmpdir):
+    path = str(tmpdir.join("ticks"))
+    table = TickTable(path, maxSecurities=4, maxFields=4)
+    reader = TickTableReader(path)
+    assert reader.securities() == []
+    table.publish("L Z7 Comdty", { "BID": "90.05" })
+    table.publish("L Z7 Comdty", { "BID": "90.06", "TRADING_DT": "2017-12-20" })
+    assert reader.securities() == ["L Z7 Comdty"]
+    assert reader.snapshot("L Z7 Comdty") == { "BID": 90.06, "TRADING_DT": "2017-12-20" }
+
+def test_text_is_truncated(tmpdir):
+    path = str(tmpdir.join("ticks"))
+    table = TickTable(path, maxSecurities=4, maxFields=4)
+    table.publish("L Z7 Comdty", { "NAME": "a very long security description" })
+    assert TickTableReader(path).get("L Z7 Comdty", "NAME") == "a very long security"
+
+def test_full_table(tmpdir):
+    table = TickTable(str(tmpdir.join("ticks")), maxSecurities=1, maxFields=4)
+    table.publish("L Z7 Comdty", { "BID": "90.05" })
+    with pytest.raises(TickTableFullException):
+        table.publish("L Z6 Comdty", { "BID": "90.05" })
+
+def test_sequence_wraps_around(tmpdir):
+    path = str(tmpdir.join("ticks"))
+    table = TickTable(path, maxSecurities=4, maxFields=4)
+    table.publish("L Z7 Comdty", { "BID": "90.05" })
+    rowOffset = table.layout.rowOffset(table.securityRow("L Z7 Comdty"))
+    SEQUENCE.pack_into(table.buffer, rowOffset, 2 ** 32 - 2)
+    table.publish("L Z7 Comdty", { "BID": "90.06" })
+    assert SEQUENCE.unpack_from(table.buffer, rowOffset)[0] == 0
+    assert TickTableReader(path).get("L Z7 Comdty", "BID") == 90.06
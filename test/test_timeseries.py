@@ -0,0 +1,61 @@
+import datetime
+
+from timeseries import aggregateBars, defaultAggregation, downsample, resample
+
+DATES = [datetime.date(2020, 1, day) for day in [2, 3, 6, 7, 8, 9, 10, 13]]
+
+def test_weekly_last():
+    dates, values = resample(DATES, [1, 2, 3, 4, 5, 6, 7, 8], "WEEKLY", "last")
+    assert dates == ["2020-01-03", "2020-01-10", "2020-01-13"]
+    assert values == [2, 7, 8]
+
+def test_weekly_aggregations():
+    assert resample(DATES, [1, 2, 3, 4, 5, 6, 7, 8], "WEEKLY", "first")[1] == [1, 3, 8]
+    assert resample(DATES, [1, 9, 3, 4, 5, 6, 7, 8], "WEEKLY", "max")[1] == [9, 7, 8]
+    assert resample(DATES, [1, 9, 3, 4, 5, 6, 7, 8], "WEEKLY", "min")[1] == [1, 3, 8]
+    assert resample(DATES, [1, 2, 3, 4, 5, 6, 7, 8], "WEEKLY", "sum")[1] == [3, 25, 8]
+
+def test_monthly_and_yearly():
+    dates = [datetime.date(2019, 12, 31), datetime.date(2020, 1, 31), datetime.date(2020, 2, 3)]
+    assert resample(dates, [1, 2, 3], "MONTHLY", "last") == (["2019-12-31", "2020-01-31", "2020-02-03"], [1, 2, 3])
+    assert resample(dates, [1, 2, 3], "YEARLY", "sum") == (["2019-12-31", "2020-02-03"], [1, 5])
+
+def test_text_values_are_picked():
+    assert resample(DATES[:2], ["a", "b"], "WEEKLY", "max") == (["2020-01-03"], ["b"])
+
+def test_empty_series():
+    assert resample([], [], "WEEKLY", "last") == ([], [])
+
+def test_default_aggregation():
+    assert defaultAggregation("px_high") == "max"
+    assert defaultAggregation("PX_LOW") == "min"
+    assert defaultAggregation("PX_OPEN") == "first"
+    assert defaultAggregation("PX_VOLUME") == "sum"
+    assert defaultAggregation("PX_LAST") == "last"
+
+def test_aggregate_bars():
+    minutes = [100, 101, 102, 104]
+    bars = [(1, 2, 0, 1.5, 1, 10), (2, 5, 1, 3, 2, 20), (3, 4, 2, 3.5, 1, 5), (4, 4, 4, 4, 1, 1)]
+    starts, merged = aggregateBars(minutes, bars, 100, 3)
+    assert starts == [100, 103]
+    assert merged == [[1, 5, 0, 3.5, 4, 35], [4, 4, 4, 4, 1, 1]]
+
+def test_aggregate_bars_empty():
+    assert aggregateBars([], [], 0, 5) == ([], [])
+
+def test_downsample_keeps_extremes():
+    values = [0.0] * 1000
+    values[123] = 10.0
+    values[456] = -10.0
+    keep = downsample(values, 20).tolist()
+    assert len(keep) <= 20
+    assert 0 in keep and 999 in keep
+    assert 123 in keep and 456 in keep
+
+def test_downsample_short_series():
+    assert downsample([1, 2, 3], 10).tolist() == [0, 1, 2]
+    assert downsample([1, 2, 3], 0).tolist() == [0, 1, 2]
+
+def test_downsample_text():
+    keep = downsample(["a"] * 100, 10).tolist()
+    assert len(keep) == 10 and keep[0] == 0 and keep[-1] == 99
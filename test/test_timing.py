@@ -0,0 +1,30 @@
+from timing import SlowRequestLog, Timing
+
+class Request(object):
+    def __init__(self, path):
+        self.method = "GET"
+        self.path = path.split("?")[0]
+        self.full_path = path
+
+def test_spans_with_the_same_name_add_up():
+    timing = Timing()
+    timing.add("wait", 0.010)
+    timing.add("json", 0.002)
+    timing.add("wait", 0.005)
+    assert timing.header().startswith("wait;dur=15.0, json;dur=2.0, total;dur=")
+
+def test_only_the_slowest_requests_are_kept():
+    log = SlowRequestLog(2)
+    for path, startedAgo in [("/a", 1), ("/b", 3), ("/c", 2)]:
+        timing = Timing()
+        timing.startedAt -= startedAgo
+        log.record(Request(path), 200, timing)
+    assert [each["url"] for each in log.slowest()] == ["/b", "/c"]
+
+def test_debug_calls_are_not_kept():
+    log = SlowRequestLog(2)
+    timing = Timing()
+    timing.startedAt -= 10
+    log.record(Request("/debug/profile?seconds=10"), 200, timing)
+    log.record(Request("/latest?security=A"), 200, Timing())
+    assert [each["url"] for each in log.slowest()] == ["/latest?security=A"]
@@ -0,0 +1,221 @@
+"""
+Last values of every subscription in a memory-mapped file with a fixed layout,
+for local consumers that cannot afford to go through Socket.IO and JSON.
+
+    header   | magic, version, capacity and the number of securities/fields in use
+    fields   | MAX_FIELDS names, FIELD_NAME_SIZE bytes each
+    securities | MAX_SECURITIES names, SECURITY_NAME_SIZE bytes each
+    rows     | one row per security: a sequence number followed by a slot per field
+
+Each row is guarded by a seqlock: the writer makes the sequence number odd while it
+updates the row and even again once it is done, readers retry whenever they see an
+odd number or the number changed while they were reading.
+"""
+import mmap
+import struct
+import time
+
+MAGIC = b"BBTT"
+VERSION = 1
+
+HEADER = struct.Struct("<4sIIIII")
+HEADER_SIZE = 64
+FIELD_NAME_SIZE = 32
+SECURITY_NAME_SIZE = 64
+SEQUENCE = struct.Struct("<I")
+# sequence numbers wrap around, readers only compare them for equality and parity
+SEQUENCE_MASK = 0xFFFFFFFF
+ROW_HEADER_SIZE = 8
+TEXT_SIZE = 20
+SLOT = struct.Struct("<B3xd{}s".format(TEXT_SIZE))
+
+EMPTY = 0
+NUMBER = 1
+TEXT = 2
+
+class TickTableFullException(Exception):
+    pass
+
+def tableSize(maxSecurities, maxFields):
+    return (HEADER_SIZE + maxFields * FIELD_NAME_SIZE + maxSecurities * SECURITY_NAME_SIZE
+            + maxSecurities * (ROW_HEADER_SIZE + maxFields * SLOT.size))
+
+class TickTableLayout(object):
+    def __init__(self, maxSecurities, maxFields):
+        self.maxSecurities = maxSecurities
+        self.maxFields = maxFields
+        self.fieldsOffset = HEADER_SIZE
+        self.securitiesOffset = self.fieldsOffset + maxFields * FIELD_NAME_SIZE
+        self.rowsOffset = self.securitiesOffset + maxSecurities * SECURITY_NAME_SIZE
+        self.rowSize = ROW_HEADER_SIZE + maxFields * SLOT.size
+
+    def fieldNameOffset(self, index):
+        return self.fieldsOffset + index * FIELD_NAME_SIZE
+
+    def securityNameOffset(self, index):
+        return self.securitiesOffset + index * SECURITY_NAME_SIZE
+
+    def rowOffset(self, index):
+        return self.rowsOffset + index * self.rowSize
+
+    def slotOffset(self, row, field):
+        return self.rowOffset(row) + ROW_HEADER_SIZE + field * SLOT.size
+
+def readName(buffer, offset, size):
+    return bytes(buffer[offset:offset + size]).rstrip(b"\0").decode()
+
+class TickTable(object):
+    """
+    Writer side, owned by the process running handleSubscriptions.
+    """
+    def __init__(self, path, maxSecurities=4096, maxFields=256):
+        self.layout = TickTableLayout(maxSecurities, maxFields)
+        self.path = path
+        with open(path, "wb") as f:
+            f.truncate(tableSize(maxSecurities, maxFields))
+        self.file = open(path, "r+b")
+        self.buffer = mmap.mmap(self.file.fileno(), 0)
+        self.securityIndex = {}
+        self.fieldIndex = {}
+        self.writeHeader()
+
+    def writeHeader(self):
+        HEADER.pack_into(self.buffer, 0, MAGIC, VERSION, self.layout.maxSecurities, self.layout.maxFields,
+                         len(self.securityIndex), len(self.fieldIndex))
+
+    def indexOf(self, index, name, capacity, nameOffset, nameSize):
+        position = index.get(name)
+        if position is None:
+            position = len(index)
+            if position >= capacity:
+                raise TickTableFullException("Tick table has no room left for {}".format(name))
+            encoded = name.encode()[:nameSize]
+            offset = nameOffset(position)
+            self.buffer[offset:offset + len(encoded)] = encoded
+            index[name] = position
+            # the name is in place before readers can see the new count
+            self.writeHeader()
+        return position
+
+    def securityRow(self, security):
+        return self.indexOf(self.securityIndex, security, self.layout.maxSecurities,
+                            self.layout.securityNameOffset, SECURITY_NAME_SIZE)
+
+    def fieldSlot(self, field):
+        return self.indexOf(self.fieldIndex, field, self.layout.maxFields,
+                            self.layout.fieldNameOffset, FIELD_NAME_SIZE)
+
+    def publish(self, security, values):
+        row = self.securityRow(security)
+        slots = [(self.fieldSlot(field), value) for field, value in values.items()]
+        rowOffset = self.layout.rowOffset(row)
+        sequence = SEQUENCE.unpack_from(self.buffer, rowOffset)[0]
+        SEQUENCE.pack_into(self.buffer, rowOffset, (sequence + 1) & SEQUENCE_MASK)
+        for slot, value in slots:
+            SLOT.pack_into(self.buffer, self.layout.slotOffset(row, slot), *encodeValue(value))
+        SEQUENCE.pack_into(self.buffer, rowOffset, (sequence + 2) & SEQUENCE_MASK)
+
+    def close(self):
+        self.buffer.close()
+        self.file.close()
+
+def encodeValue(value):
+    text = value if isinstance(value, str) else str(value)
+    try:
+        number = float(value)
+        kind = NUMBER
+    except (TypeError, ValueError):
+        number = float("nan")
+        kind = TEXT
+    return kind, number, text.encode()[:TEXT_SIZE]
+
+class TickTableReader(object):
+    """
+    Reader side, for any local process. Values are decoded straight out of the
+    shared mapping, there is no copy of the table and no serialisation involved.
+    """
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.buffer = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, maxSecurities, maxFields, _, _ = HEADER.unpack_from(self.buffer, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("{} is not a tick table".format(path))
+        self.layout = TickTableLayout(maxSecurities, maxFields)
+        self.securityIndex = {}
+        self.fieldIndex = {}
+
+    def refreshIndex(self):
+        _, _, _, _, securityCount, fieldCount = HEADER.unpack_from(self.buffer, 0)
+        for position in range(len(self.securityIndex), securityCount):
+            name = readName(self.buffer, self.layout.securityNameOffset(position), SECURITY_NAME_SIZE)
+            self.securityIndex[name] = position
+        for position in range(len(self.fieldIndex), fieldCount):
+            name = readName(self.buffer, self.layout.fieldNameOffset(position), FIELD_NAME_SIZE)
+            self.fieldIndex[name] = position
+
+    def lookup(self, index, name):
+        position = index.get(name)
+        if position is None:
+            self.refreshIndex()
+            position = index.get(name)
+        return position
+
+    def securities(self):
+        self.refreshIndex()
+        return list(self.securityIndex.keys())
+
+    def readRow(self, row, slots):
+        rowOffset = self.layout.rowOffset(row)
+        slotsOffset = rowOffset + ROW_HEADER_SIZE
+        while True:
+            before = SEQUENCE.unpack_from(self.buffer, rowOffset)[0]
+            if before & 1:
+                time.sleep(0)
+                continue
+            values = [SLOT.unpack_from(self.buffer, slotsOffset + slot * SLOT.size) for slot in slots]
+            if SEQUENCE.unpack_from(self.buffer, rowOffset)[0] == before:
+                return values
+
+    def get(self, security, field):
+        row = self.securityIndex.get(security)
+        if row is None:
+            row = self.lookup(self.securityIndex, security)
+        slot = self.fieldIndex.get(field)
+        if slot is None:
+            slot = self.lookup(self.fieldIndex, field)
+        if row is None or slot is None:
+            return None
+        rowOffset = self.layout.rowsOffset + row * self.layout.rowSize
+        slotOffset = rowOffset + ROW_HEADER_SIZE + slot * SLOT.size
+        while True:
+            before = SEQUENCE.unpack_from(self.buffer, rowOffset)[0]
+            if not before & 1:
+                value = SLOT.unpack_from(self.buffer, slotOffset)
+                if SEQUENCE.unpack_from(self.buffer, rowOffset)[0] == before:
+                    return decodeValue(value)
+            time.sleep(0)
+
+    def snapshot(self, security):
+        row = self.lookup(self.securityIndex, security)
+        if row is None:
+            return {}
+        self.refreshIndex()
+        fields = list(self.fieldIndex.items())
+        values = self.readRow(row, [slot for _, slot in fields])
+        result = {}
+        for (field, _), value in zip(fields, values):
+            if value[0] != EMPTY:
+                result[field] = decodeValue(value)
+        return result
+
+    def close(self):
+        self.buffer.close()
+        self.file.close()
+
+def decodeValue(slot):
+    kind, number, text = slot
+    if kind == NUMBER:
+        return number
+    elif kind == TEXT:
+        return text.rstrip(b"\0").decode(errors="ignore")
+    return None
@@ -0,0 +1,122 @@
+import numpy as np
+
+PERIODICITIES = ["DAILY", "WEEKLY", "MONTHLY", "QUARTERLY", "YEARLY"]
+
+FIRST = "first"
+LAST = "last"
+MAX = "max"
+MIN = "min"
+SUM = "sum"
+AGGREGATIONS = [FIRST, LAST, MAX, MIN, SUM]
+
+def defaultAggregation(field):
+    field = field.upper()
+    if "HIGH" in field:
+        return MAX
+    elif "LOW" in field:
+        return MIN
+    elif "OPEN" in field:
+        return FIRST
+    elif "VOLUME" in field or field.startswith("TURNOVER") or field.startswith("NUM_TRADES"):
+        return SUM
+    return LAST
+
+def toDates(dates):
+    return np.array(dates, dtype="datetime64[D]")
+
+def periodKeys(dates, periodicity):
+    if periodicity == "WEEKLY":
+        # 1970-01-01 was a Thursday, shift so that weeks start on Monday
+        return (dates.astype(np.int64) + 3) // 7
+    elif periodicity == "MONTHLY":
+        return dates.astype("datetime64[M]").astype(np.int64)
+    elif periodicity == "QUARTERLY":
+        return dates.astype("datetime64[M]").astype(np.int64) // 3
+    elif periodicity == "YEARLY":
+        return dates.astype("datetime64[Y]").astype(np.int64)
+    return dates.astype(np.int64)
+
+def bucketBounds(keys):
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(keys)) + 1))
+    ends = np.concatenate((starts[1:], [len(keys)])) - 1
+    return starts, ends
+
+def reduceBuckets(values, starts, ends, aggregation):
+    if aggregation == FIRST:
+        return values[starts]
+    elif aggregation == LAST:
+        return values[ends]
+    elif aggregation == MAX:
+        return np.maximum.reduceat(values, starts)
+    elif aggregation == MIN:
+        return np.minimum.reduceat(values, starts)
+    elif aggregation == SUM:
+        return np.add.reduceat(values, starts)
+    raise ValueError("Unknown aggregation {}".format(aggregation))
+
+def asNumbers(values):
+    try:
+        return np.asarray(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        return None
+
+def resample(dates, values, periodicity, aggregation):
+    """
+    Aggregates a daily series, sorted by date, into one value per period.
+    The period is labelled with the last date that has data in it.
+    """
+    if len(dates) == 0:
+        return [], []
+    dates = toDates(dates)
+    starts, ends = bucketBounds(periodKeys(dates, periodicity))
+    numbers = asNumbers(values)
+    if numbers is None:
+        # text fields can only be picked, not combined
+        numbers = np.asarray(values, dtype=object)
+        if not aggregation in (FIRST, LAST):
+            aggregation = LAST
+    return dates[ends].astype(str).tolist(), reduceBuckets(numbers, starts, ends, aggregation).tolist()
+
+def aggregateBars(minutes, bars, firstMinute, interval):
+    """
+    Merges one minute (open, high, low, close, numEvents, volume) bars, sorted by
+    minute, into bars of interval minutes counted from firstMinute. Returns the
+    first minute of each merged bar and its values.
+    """
+    if len(minutes) == 0:
+        return [], []
+    minutes = np.asarray(minutes, dtype=np.int64)
+    bars = np.asarray(bars, dtype=np.float64).reshape(len(minutes), 6)
+    keys = (minutes - firstMinute) // interval
+    starts, ends = bucketBounds(keys)
+    merged = np.column_stack((
+        bars[starts, 0],
+        np.maximum.reduceat(bars[:, 1], starts),
+        np.minimum.reduceat(bars[:, 2], starts),
+        bars[ends, 3],
+        np.add.reduceat(bars[:, 4], starts),
+        np.add.reduceat(bars[:, 5], starts)))
+    return (firstMinute + keys[starts] * interval).tolist(), merged.tolist()
+
+def downsample(values, maxPoints):
+    """
+    Indices of the points to keep so that a series has at most maxPoints points,
+    the first and last point and the lowest and highest point of each bucket.
+    """
+    count = len(values)
+    if not maxPoints or count <= maxPoints:
+        return np.arange(count)
+    numbers = asNumbers(values)
+    if numbers is None or maxPoints < 4:
+        # without numbers there is no shape to keep, only evenly spaced points
+        return np.unique(np.linspace(0, count - 1, maxPoints).astype(np.int64))
+    size = -(-count // ((maxPoints - 2) // 2))
+    buckets = -(-count // size)
+    padded = np.full(buckets * size, np.nan)
+    padded[:count] = numbers
+    rows = padded.reshape(buckets, size)
+    missing = np.isnan(rows)
+    offsets = np.arange(buckets) * size
+    lows = offsets + np.where(missing, np.inf, rows).argmin(axis=1)
+    highs = offsets + np.where(missing, -np.inf, rows).argmax(axis=1)
+    return np.unique(np.concatenate(([0, count - 1], lows, highs)))
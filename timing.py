@@ -0,0 +1,83 @@
+"""
+Lightweight timing of the phases of a request. Spans with the same name add up,
+also across concurrent chunks, and are reported in the Server-Timing header.
+The slowest requests are kept with their breakdown for /debug/slow.
+"""
+import datetime
+import heapq
+import itertools
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from flask import g, has_app_context
+
+class Timing(object):
+    def __init__(self):
+        self.startedAt = time.time()
+        self.spans = OrderedDict()
+
+    def add(self, name, seconds):
+        self.spans[name] = self.spans.get(name, 0) + seconds
+
+    def elapsed(self):
+        return time.time() - self.startedAt
+
+    def milliseconds(self):
+        return OrderedDict((name, round(seconds * 1000, 1)) for name, seconds in self.spans.items())
+
+    def header(self):
+        parts = ["{};dur={:.1f}".format(name, seconds * 1000) for name, seconds in self.spans.items()]
+        parts.append("total;dur={:.1f}".format(self.elapsed() * 1000))
+        return ", ".join(parts)
+
+def currentTiming():
+    if not has_app_context():
+        return None
+    return getattr(g, "timing", None)
+
+def useTiming(timing):
+    g.timing = timing
+
+@contextmanager
+def span(name):
+    timing = currentTiming()
+    startedAt = time.time()
+    try:
+        yield
+    finally:
+        if timing is not None:
+            timing.add(name, time.time() - startedAt)
+
+# the debug endpoints take as long as they are asked to, they would crowd out the API calls
+SKIPPED_PREFIXES = ["/debug/"]
+
+class SlowRequestLog(object):
+    """
+    The slowest requests seen so far, at most size of them.
+    """
+    def __init__(self, size=20):
+        self.size = size
+        self.entries = []
+        self.counter = itertools.count()
+
+    def record(self, request, status, timing):
+        if any(request.path.startswith(prefix) for prefix in SKIPPED_PREFIXES):
+            return
+        duration = timing.elapsed()
+        if len(self.entries) >= self.size and duration <= self.entries[0][0]:
+            return
+        entry = (duration, next(self.counter), {
+            "method": request.method,
+            "url": request.full_path,
+            "status": status,
+            "at": datetime.datetime.fromtimestamp(timing.startedAt).isoformat(),
+            "duration": round(duration * 1000, 1),
+            "spans": timing.milliseconds()
+        })
+        if len(self.entries) < self.size:
+            heapq.heappush(self.entries, entry)
+        else:
+            heapq.heapreplace(self.entries, entry)
+
+    def slowest(self):
+        return [details for _, _, details in sorted(self.entries, reverse=True)]
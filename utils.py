@@ -14,6 +14,7 @@ def get_main_dir():
 
 def handleBrokenSession(app, e):
     if isinstance(e, BrokenSessionException):
+        app.sessions.invalidate()
         if not app.sessionForRequests is None:
             app.sessionForRequests.stop()
             app.sessionForRequests = None